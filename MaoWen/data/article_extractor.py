@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文章正文提取
+把原始 HTML 字节转换为清理后的正文并写入文章目录。
+这里只做 CPU 密集的解析和文件写入，不依赖爬虫对象，可以在进程池中运行。
+"""
+
+import os
+import re
+from datetime import datetime
+
+from bs4 import BeautifulSoup
+
+from near_dup import text_signature
+
+# content.txt 中头部信息与正文之间的分隔线
+CONTENT_SEPARATOR = "-" * 50 + "\n\n"
+
+# 按顺序尝试的正文选择器
+CONTENT_SELECTORS = [
+    'div.content',
+    'div#content',
+    'article',
+    'div.main',
+    'div.text',
+    'body'
+]
+
+
+def extract_content(html):
+    """从 HTML 文本中提取并清理正文"""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    article_content = None
+    for selector in CONTENT_SELECTORS:
+        article_content = soup.select_one(selector)
+        if article_content:
+            break
+
+    if not article_content:
+        article_content = soup
+
+    # 移除导航和非内容元素
+    for element in article_content.find_all(['nav', 'header', 'footer', 'script', 'style']):
+        element.decompose()
+
+    # 提取文本内容
+    content = article_content.get_text().strip()
+
+    # 清理内容
+    content = re.sub(r'\n\s*\n', '\n\n', content)  # 合并多个空行
+    content = re.sub(r'[ \t]+', ' ', content)  # 合并多个空格
+    return content
+
+
+def render_content_file(title, url, download_time, content):
+    """生成 content.txt 的全文"""
+    return (
+        f"标题: {title}\n"
+        f"链接: {url}\n"
+        f"下载时间: {datetime.fromisoformat(download_time).strftime('%Y-%m-%d %H:%M:%S')}\n"
+        + CONTENT_SEPARATOR
+        + content
+    )
+
+
+def content_body(content_text):
+    """去掉 content.txt 的头部信息，只保留正文"""
+    return content_text.split(CONTENT_SEPARATOR, 1)[-1]
+
+
+def save_article_files(article_dir, content_text, source):
+    """写入 content.txt 和 source.html，source 为服务器返回的原始字节"""
+    os.makedirs(article_dir, exist_ok=True)
+
+    # 保存文本内容
+    txt_file = os.path.join(article_dir, "content.txt")
+    with open(txt_file, 'w', encoding='utf-8') as f:
+        f.write(content_text)
+
+    # 保存HTML源码，原样保存不做转码
+    html_file = os.path.join(article_dir, "source.html")
+    with open(html_file, 'wb') as f:
+        f.write(source)
+
+
+def process_article(job):
+    """
+    解码、提取并保存一篇文章；job 由爬虫的抓取阶段生成。
+    返回正文长度，job['return_text'] 为真时同时返回 content.txt 全文（写入打包语料用），
+    job['signature'] 为真时同时返回正文的 MinHash 签名（近似重复检测用）
+    """
+    # 整个流程中页面只解码这一次
+    html = job['body'].decode(job['encoding'] or 'utf-8', errors='replace')
+    content = extract_content(html)
+    content_text = render_content_file(job['title'], job['url'], job['download_time'], content)
+    if job.get('write_dir', True):
+        save_article_files(job['article_dir'], content_text, job['body'])
+    return {
+        'content_length': len(content),
+        'content_text': content_text if job.get('return_text') else None,
+        'minhash': text_signature(content) if job.get('signature') else None
+    }
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+爬虫性能测试
+在本地启动一个模拟站点（带可配置的响应延迟），分别用顺序模式、并发模式
+以及并发 + 进程池提取的流水线模式爬取，输出每秒页面数，并检查各模式生成的语料是否一致。
+加 --volumes N 时改为生成多卷站点，测试全站广度优先模式。
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from crawler import MaoZedongCrawler
+
+
+def build_index_page(num_articles):
+    """生成模拟索引页"""
+    links = "\n".join(
+        f'<li><a href="article_{i:04d}.htm">毛泽东文章第{i}篇</a></li>'
+        for i in range(num_articles)
+    )
+    return f"""<html><head><title>毛泽东选集</title></head>
+<body><h1>毛泽东选集</h1><ul>
+{links}
+</ul></body></html>"""
+
+
+def build_article_page(i):
+    """生成模拟文章页"""
+    paragraphs = "\n".join(
+        f"<p>这是第{i}篇文章的第{j}段。中国革命战争的规律，调查研究，实事求是。</p>"
+        for j in range(30)
+    )
+    return f"""<html><head><title>毛泽东文章第{i}篇</title></head>
+<body><nav>导航</nav><div class="content"><h2>毛泽东文章第{i}篇</h2>
+{paragraphs}
+</div><footer>页脚</footer></body></html>"""
+
+
+class FixtureSite:
+    """本地模拟站点：路径 -> 页面内容，每个请求按 latency 秒延迟返回"""
+
+    def __init__(self, pages, latency=0.05):
+        self.pages = pages
+        self.latency = latency
+        self.request_count = 0
+        self.count_lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    def make_handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with site.count_lock:
+                    site.request_count += 1
+                if site.latency:
+                    time.sleep(site.latency)
+                body = site.pages.get(self.path.split("?")[0])
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_fixture_pages(num_articles):
+    pages = {"/chinese/maozedong/index.htm": build_index_page(num_articles)}
+    for i in range(num_articles):
+        pages[f"/chinese/maozedong/article_{i:04d}.htm"] = build_article_page(i)
+    return pages
+
+
+def make_site_pages(volumes, per_volume):
+    """多卷模拟站点：总索引页链接到各卷索引页，各卷之间互相链接并重复链接部分文章"""
+    root = "/chinese/maozedong/"
+    volume_links = "\n".join(
+        f'<li><a href="vol{v}/index.htm">第{v}卷</a></li>' for v in range(volumes)
+    )
+    pages = {root + "index.htm": f"<html><body><h1>毛泽东选集</h1><ul>{volume_links}</ul></body></html>"}
+    for v in range(volumes):
+        links = "\n".join(
+            f'<li><a href="article_{i:04d}.htm#top">第{v}卷文章第{i}篇</a></li>' for i in range(per_volume)
+        )
+        # 链接回总索引、相邻卷以及上一卷的第一篇文章，检验去重
+        links += f'\n<a href="../index.htm">返回</a><a href="/chinese/maozedong/vol{(v + 1) % volumes}/index.htm">下一卷</a>'
+        links += f'\n<a href="../vol{(v - 1) % volumes}/article_0000.htm">上一卷第一篇</a>'
+        links += '\n<a href="/other/index.htm">站外</a>'
+        pages[f"{root}vol{v}/index.htm"] = f"<html><body><ul>{links}</ul></body></html>"
+        for i in range(per_volume):
+            pages[f"{root}vol{v}/article_{i:04d}.htm"] = build_article_page(v * per_volume + i)
+    return pages
+
+
+def run_site_benchmark(args):
+    """全站模式：顺序与并发各爬一次，比较耗时和结果"""
+    site = FixtureSite(make_site_pages(args.volumes, args.articles), latency=args.latency)
+    seed = site.start() + "/chinese/maozedong/index.htm"
+    output_dirs = []
+    try:
+        print(f"模拟站点: {seed}  {args.volumes} 卷 x {args.articles} 篇  延迟: {args.latency * 1000:.0f}ms")
+        print(f"{'模式':<16}{'页面数':>8}{'耗时(s)':>10}{'页面/秒':>10}{'语料一致':>10}")
+        baseline = None
+        for concurrent, concurrency in [(False, 1)] + [(True, c) for c in args.concurrency]:
+            output_dir = tempfile.mkdtemp(prefix="crawler_bench_")
+            output_dirs.append(output_dir)
+            crawler = MaoZedongCrawler(
+                base_url=seed,
+                output_dir=output_dir,
+                rate=0,
+                per_host_concurrency=concurrency,
+                pool_size=max(concurrency, 1),
+                site_seeds=[seed]
+            )
+            site.request_count = 0
+            start = time.perf_counter()
+            crawler.crawl_all(concurrent=concurrent)
+            elapsed = time.perf_counter() - start
+            snapshot = snapshot_corpus(output_dir)
+            identical = "-" if baseline is None else str(snapshot == baseline)
+            baseline = baseline or snapshot
+            label = f"concurrent x{concurrency}" if concurrent else "sequential"
+            pages = site.request_count
+            print(f"{label:<16}{pages:>8}{elapsed:>10.2f}{pages / elapsed:>10.1f}{identical:>10}")
+    finally:
+        site.stop()
+        for output_dir in output_dirs:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def snapshot_corpus(output_dir):
+    """读取输出目录，去掉下载时间等易变字段后返回可比较的快照"""
+    snapshot = {}
+    for name in sorted(os.listdir(output_dir)):
+        path = os.path.join(output_dir, name)
+        if not os.path.isdir(path):
+            continue
+        with open(os.path.join(path, "content.txt"), encoding="utf-8") as f:
+            content = [line for line in f if not line.startswith("下载时间:")]
+        with open(os.path.join(path, "source.html"), "rb") as f:
+            source = f.read()
+        snapshot[name] = ("".join(content), source)
+    with open(os.path.join(output_dir, "articles_index.json"), encoding="utf-8") as f:
+        index = json.load(f)
+    for article in index:
+        article.pop("download_time", None)
+    snapshot["articles_index.json"] = index
+    return snapshot
+
+
+def run_once(base_url, concurrent, per_host_concurrency, extract_workers=0):
+    output_dir = tempfile.mkdtemp(prefix="crawler_bench_")
+    crawler = MaoZedongCrawler(
+        base_url=base_url,
+        output_dir=output_dir,
+        rate=0,
+        per_host_concurrency=per_host_concurrency,
+        pool_size=max(per_host_concurrency, 1),
+        extract_workers=extract_workers
+    )
+    start = time.perf_counter()
+    crawler.crawl_all(concurrent=concurrent)
+    elapsed = time.perf_counter() - start
+    return output_dir, len(crawler.articles_info), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="顺序模式 vs 并发模式爬虫性能测试")
+    parser.add_argument("--articles", type=int, default=100, help="模拟文章数")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟服务器每个请求的延迟（秒）")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 8, 16], help="要测试的每主机并发数")
+    parser.add_argument("--extract-workers", type=int, default=0, help="额外测试流水线模式时的提取进程数，0 表示不测试")
+    parser.add_argument("--volumes", type=int, default=0, help="大于 0 时生成多卷站点并测试全站模式，--articles 为每卷文章数")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    if args.volumes:
+        run_site_benchmark(args)
+        return
+
+    site = FixtureSite(make_fixture_pages(args.articles), latency=args.latency)
+    base_url = site.start() + "/chinese/maozedong/index.htm"
+    output_dirs = []
+    try:
+        print(f"模拟站点: {base_url}  文章数: {args.articles}  延迟: {args.latency * 1000:.0f}ms")
+        baseline_dir, pages, elapsed = run_once(base_url, False, 1)
+        output_dirs.append(baseline_dir)
+        baseline = snapshot_corpus(baseline_dir)
+        print(f"{'模式':<16}{'页面数':>8}{'耗时(s)':>10}{'页面/秒':>10}{'语料一致':>10}")
+        print(f"{'sequential':<16}{pages:>8}{elapsed:>10.2f}{pages / elapsed:>10.1f}{'-':>10}")
+        for concurrency in args.concurrency:
+            output_dir, pages, elapsed = run_once(base_url, True, concurrency)
+            output_dirs.append(output_dir)
+            identical = snapshot_corpus(output_dir) == baseline
+            label = f"concurrent x{concurrency}"
+            print(f"{label:<16}{pages:>8}{elapsed:>10.2f}{pages / elapsed:>10.1f}{str(identical):>10}")
+            if args.extract_workers:
+                output_dir, pages, elapsed = run_once(base_url, True, concurrency, args.extract_workers)
+                output_dirs.append(output_dir)
+                identical = snapshot_corpus(output_dir) == baseline
+                label = f"pipeline x{concurrency}/p{args.extract_workers}"
+                print(f"{label:<16}{pages:>8}{elapsed:>10.2f}{pages / elapsed:>10.1f}{str(identical):>10}")
+    finally:
+        site.stop()
+        for output_dir in output_dirs:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
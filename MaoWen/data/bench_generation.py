@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+问答生成性能测试
+在本地启动模拟的对话接口（见 mock_llm_server.py），生成一批模拟文章，
+对每个并发数依次运行真实的问题生成、答案生成以及（加 --judge 时）train.py 使用的评分函数，
+输出每个阶段的每秒请求数、请求耗时的 p50/p99（含排队和重试）以及每分钟产出的条目数。
+不需要 API 密钥，也不产生费用。
+
+用法:
+    python bench_generation.py --articles 50 --concurrency 4 16 64 --latency 0.3 --max-inflight 32
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from article_extractor import render_content_file
+from gen_answer import AnswerGenerator
+from gen_question import QAGenerator
+from jsonl_io import iter_jsonl_shards
+from llm_engine import LLMEngine, add_engine_arguments, engine_options_from_args
+from llm_metrics import percentile
+from mock_llm_server import MockLLMServer, add_server_arguments, server_options_from_args
+
+
+def build_corpus(output_dir, num_articles, paragraphs):
+    """生成与爬虫输出格式相同的模拟文章目录"""
+    for i in range(num_articles):
+        title = f"毛泽东文章第{i}篇"
+        content = "\n\n".join(
+            f"这是第{i}篇文章的第{j}段。中国革命战争的规律，调查研究，实事求是，没有调查就没有发言权。"
+            for j in range(paragraphs)
+        )
+        article_dir = Path(output_dir) / f"{i:04d}_{title}"
+        article_dir.mkdir(parents=True)
+        text = render_content_file(title, f"http://127.0.0.1/article_{i:04d}.htm", "2024-01-01T00:00:00", content)
+        (article_dir / "content.txt").write_text(text, encoding="utf-8")
+
+
+def record_latencies(engine):
+    """替换 engine.chat，记录每次调用从发起到返回的耗时（含等待并发名额、限额和重试）"""
+    latencies = []
+    chat = engine.chat
+
+    async def timed_chat(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await chat(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    engine.chat = timed_chat
+    return latencies
+
+
+def run_judge(answers_file, concurrency):
+    """用 train.py 的评分函数给所有问答对打分，返回 (评分数, 每次调用耗时)"""
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from judge import judge
+
+    latencies = []
+
+    def timed_judge(item):
+        start = time.perf_counter()
+        try:
+            return judge(item['q'], item['a'])
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    items = list(iter_jsonl_shards(answers_file))
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        scores = list(executor.map(timed_judge, items))
+    return sum(1 for score in scores if score), latencies
+
+
+def run_stage(server, label, concurrency, action, verbose):
+    """运行一个阶段，返回一行结果"""
+    server.reset_stats()
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stdout if verbose else output):
+        produced, latencies = action()
+    elapsed = time.perf_counter() - start
+    stats = server.stats
+    return (f"{label:<8}{concurrency:>6}{stats['completed']:>8}{elapsed:>10.2f}{stats['completed'] / elapsed:>10.1f}"
+            f"{percentile(latencies, 50):>9.2f}{percentile(latencies, 99):>9.2f}{produced * 60 / elapsed:>12.0f}"
+            f"{stats['throttled']:>7}{stats['errors']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="问题生成、答案生成和评分的性能测试")
+    parser.add_argument("--articles", type=int, default=50, help="模拟文章数")
+    parser.add_argument("--paragraphs", type=int, default=20, help="每篇模拟文章的段落数")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 16, 64], help="要测试的最大并发请求数")
+    parser.add_argument("--batch-size", type=int, default=1, help="答案生成每批合并回答的问题数")
+    parser.add_argument("--context-tokens", type=int, default=0, help="答案生成只发送相关段落时的 token 预算")
+    parser.add_argument("--judge", action="store_true", help="同时测试 train.py 的评分函数")
+    parser.add_argument("--verbose", action="store_true", help="显示生成脚本自身的输出")
+    add_server_arguments(parser)
+    add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockLLMServer(**server_options_from_args(args))
+    base_url = server.start()
+    # 评分函数从环境变量读取接口地址；清空多接口列表，免得 .env 中的配置把请求发到真实接口
+    # （设为空字符串而不是删除，load_dotenv 不会覆盖已有的环境变量）
+    os.environ["LLM_ENDPOINTS"] = ""
+    os.environ["JUDGE_ENDPOINTS"] = ""
+    os.environ["JUDGE_BASE_URL"] = base_url
+    os.environ["JUDGE_API_KEY"] = "mock"
+    work_dir = tempfile.mkdtemp(prefix="generation_bench_")
+    corpus_dir = os.path.join(work_dir, "output")
+    build_corpus(corpus_dir, args.articles, args.paragraphs)
+    engine_options = engine_options_from_args(args)
+
+    def make_engine(concurrency):
+        engine = LLMEngine(max_concurrency=concurrency, api_key="mock", base_url=base_url, **engine_options)
+        return engine, record_latencies(engine)
+
+    try:
+        print(f"模拟接口: {base_url}  文章数: {args.articles}  平均延迟: {args.latency * 1000:.0f}ms"
+              f"（{args.distribution}）  在途上限: {args.max_inflight or '不限'}")
+        print(f"{'阶段':<8}{'并发':>6}{'请求数':>8}{'耗时(s)':>10}{'请求/秒':>10}{'p50(s)':>9}{'p99(s)':>9}"
+              f"{'产出/分钟':>12}{'429':>7}{'5xx':>7}")
+        for concurrency in args.concurrency:
+            questions_file = os.path.join(work_dir, f"questions_{concurrency}.jsonl")
+            answers_file = os.path.join(work_dir, f"answers_{concurrency}.jsonl")
+
+            def questions():
+                engine, latencies = make_engine(concurrency)
+                generator = QAGenerator(corpus_dir, questions_file, engine=engine)
+                generator.run()
+                return generator.total_qa_count, latencies
+
+            def answers():
+                engine, latencies = make_engine(concurrency)
+                generator = AnswerGenerator(questions_file, corpus_dir, answers_file, engine=engine,
+                                            batch_size=args.batch_size, context_tokens=args.context_tokens)
+                generator.run()
+                return generator.total_qa_count, latencies
+
+            print(run_stage(server, "question", concurrency, questions, args.verbose))
+            print(run_stage(server, "answer", concurrency, answers, args.verbose))
+            if args.judge:
+                print(run_stage(server, "judge", concurrency, lambda: run_judge(answers_file, concurrency),
+                                args.verbose))
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
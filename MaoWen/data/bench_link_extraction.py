@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+索引页链接提取性能测试
+生成一个大的模拟索引页（第五卷标记位于页面后部，之后还有大量链接），
+比较旧的 page_text.find 方案和各个解析后端的耗时，并检查结果是否一致。
+"""
+
+import argparse
+import time
+
+from bs4 import BeautifulSoup
+
+from link_extractor import DEFAULT_BOUNDARY_MARKERS, PARSER_BACKENDS, extract_links
+
+
+def build_large_index(num_links, boundary_ratio=0.8):
+    """生成模拟索引页，标题会周期性重复以模拟同名文章"""
+    rows = []
+    boundary_at = int(num_links * boundary_ratio)
+    for i in range(num_links):
+        if i == boundary_at:
+            rows.append(f"<p>{DEFAULT_BOUNDARY_MARKERS[0]}并未收录以下文章。</p>")
+        title = f"关于第{i % 500}个问题的报告"
+        rows.append(
+            f'<tr><td><a href="{i // 100:03d}/{i:05d}.htm">{title}</a></td>'
+            f"<td>（一九{i % 100:02d}年）</td></tr>"
+        )
+    return (
+        "<html><head><title>毛泽东选集</title></head><body><table>"
+        + "\n".join(rows)
+        + "</table></body></html>"
+    )
+
+
+def legacy_extract(html):
+    """旧实现：整页 get_text 后对每个链接再做一次 find"""
+    soup = BeautifulSoup(html, "html.parser")
+    page_text = soup.get_text()
+    boundary_pos = page_text.find(DEFAULT_BOUNDARY_MARKERS[0])
+    links = []
+    for link in soup.find_all("a", href=True):
+        if boundary_pos != -1 and page_text.find(link.get_text().strip()) > boundary_pos:
+            continue
+        links.append((link.get_text().strip(), link.get("href")))
+    return links
+
+
+def timed(func, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="索引页链接提取性能测试")
+    parser.add_argument("--links", type=int, default=20000, help="模拟索引页中的链接数")
+    parser.add_argument("--repeat", type=int, default=3, help="每个后端重复次数，取最快一次")
+    parser.add_argument("--skip-legacy", action="store_true", help="跳过旧实现（链接很多时非常慢）")
+    args = parser.parse_args()
+
+    html = build_large_index(args.links)
+    expected = int(args.links * 0.8)
+    print(f"模拟索引页: {len(html) / 1024:.0f} KB, {args.links} 个链接, 边界前应有 {expected} 个")
+    print(f"{'后端':<18}{'耗时(ms)':>10}{'链接数':>10}")
+
+    reference = None
+    for name in PARSER_BACKENDS:
+        elapsed, (links, boundary) = timed(lambda: extract_links(html, name), args.repeat)
+        if reference is None:
+            reference = links
+        mark = "" if links == reference else "  (与 html.parser 结果不一致)"
+        print(f"{name:<18}{elapsed * 1000:>10.1f}{len(links):>10}{mark}")
+
+    if not args.skip_legacy:
+        elapsed, links = timed(lambda: legacy_extract(html), 1)
+        # 标题重复时旧实现会按第一次出现的位置判断，边界之后的同名链接被错误保留
+        print(f"{'legacy find()':<18}{elapsed * 1000:>10.1f}{len(links):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+页面编码检测
+直接在原始字节上判断编码，不做试解码：依次检查 BOM、响应头、<meta> 声明、
+同一主机上次的判断结果，最后才对有限长度的前缀做 UTF-8 合法性检查。
+GB2312/GBK 统一按 GB18030 解码，避免生僻字在 GB2312 下变成乱码。
+"""
+
+import codecs
+import re
+import threading
+
+# <meta> 声明只在页面开头查找
+META_SCAN_BYTES = 4096
+# 启发式判断只检查这么多字节
+SNIFF_BYTES = 8192
+
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+META_CHARSET_RE = re.compile(
+    rb'<meta[^>]+charset\s*=\s*["\']?\s*([a-zA-Z0-9_\-]+)',
+    re.IGNORECASE
+)
+HEADER_CHARSET_RE = re.compile(r'charset\s*=\s*["\']?\s*([a-zA-Z0-9_\-]+)', re.IGNORECASE)
+
+# 这些编码都是 GB18030 的子集
+GB_FAMILY = {'gb2312', 'gbk', 'gb18030', 'hz'}
+
+
+def normalize_encoding(name):
+    """把编码名规范化为 Python 编码名，未知编码返回 None"""
+    if not name:
+        return None
+    try:
+        name = codecs.lookup(name.strip().lower()).name
+    except LookupError:
+        return None
+    if name in GB_FAMILY:
+        return 'gb18030'
+    return name
+
+
+def encoding_from_header(content_type):
+    match = HEADER_CHARSET_RE.search(content_type or '')
+    return normalize_encoding(match.group(1)) if match else None
+
+
+def encoding_from_bom(body):
+    for bom, encoding in BOMS:
+        if body.startswith(bom):
+            return encoding
+    return None
+
+
+def encoding_from_meta(body):
+    match = META_CHARSET_RE.search(body[:META_SCAN_BYTES])
+    return normalize_encoding(match.group(1).decode('ascii')) if match else None
+
+
+def guess_encoding(body):
+    """前缀是合法 UTF-8 且包含非 ASCII 字节时判为 UTF-8，否则按 GB18030；全 ASCII 时返回 None"""
+    prefix = body[:SNIFF_BYTES]
+    if prefix.isascii():
+        return None
+    try:
+        # 增量解码器允许前缀末尾截断在多字节字符中间
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'gb18030'
+
+
+class CharsetSniffer:
+    """线程安全的编码检测器，按主机缓存没有显式声明时的判断结果"""
+
+    def __init__(self, default='utf-8'):
+        self.default = default
+        self.host_verdicts = {}
+        self.lock = threading.Lock()
+
+    def sniff(self, body, content_type=None, host=None):
+        encoding = encoding_from_bom(body)
+        if encoding:
+            return encoding
+
+        encoding = encoding_from_header(content_type)
+        if encoding:
+            return encoding
+
+        encoding = encoding_from_meta(body)
+        if encoding:
+            return encoding
+
+        with self.lock:
+            cached = self.host_verdicts.get(host)
+        if cached:
+            return cached
+
+        encoding = guess_encoding(body)
+        if encoding is None:
+            return self.default
+        if host:
+            with self.lock:
+                self.host_verdicts[host] = encoding
+        return encoding
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+长文章分块
+按段落边界把正文切成不超过 token 预算的窗口，相邻窗口有一定重叠，
+避免一个论点正好被切在两块之间。单个段落超出预算时再按句子切开。
+每块记录它在正文中的字符区间，答案生成时可以只取这一块。
+"""
+
+import re
+from dataclasses import dataclass
+
+from llm_engine import estimate_tokens
+
+SENTENCE_END_RE = re.compile(r'(?<=[。！？；!?;])')
+
+
+@dataclass
+class Chunk:
+    index: int
+    start: int
+    end: int
+    text: str
+
+    def span(self):
+        return [self.start, self.end]
+
+
+def paragraph_spans(text):
+    """正文中每个非空段落（行）的 (起点, 终点) 字符区间"""
+    return [(m.start(), m.end()) for m in re.finditer(r'[^\n]*\S[^\n]*', text)]
+
+
+def split_long_span(text, start, end, max_tokens):
+    """把超出预算的段落按句子切成若干区间，单句仍超出预算时按字数硬切"""
+    pieces = []
+    piece_start = start
+    piece_tokens = 0
+    position = start
+    for sentence in SENTENCE_END_RE.split(text[start:end]):
+        if not sentence:
+            continue
+        tokens = estimate_tokens(sentence)
+        if piece_tokens and piece_tokens + tokens > max_tokens:
+            pieces.append((piece_start, position))
+            piece_start = position
+            piece_tokens = 0
+        position += len(sentence)
+        piece_tokens += tokens
+    pieces.append((piece_start, end))
+
+    result = []
+    for piece_start, piece_end in pieces:
+        tokens = estimate_tokens(text[piece_start:piece_end])
+        if tokens <= max_tokens:
+            result.append((piece_start, piece_end))
+            continue
+        step = max((piece_end - piece_start) * max_tokens // tokens, 1)
+        result.extend((s, min(s + step, piece_end)) for s in range(piece_start, piece_end, step))
+    return result
+
+
+def chunk_text(text, max_tokens, overlap_tokens=0):
+    """
+    把正文切成若干块，每块不超过 max_tokens（按 estimate_tokens 估计），
+    下一块从上一块末尾往回约 overlap_tokens 处的段落开始
+    """
+    units = []
+    for start, end in paragraph_spans(text):
+        if estimate_tokens(text[start:end]) > max_tokens:
+            units.extend(split_long_span(text, start, end, max_tokens))
+        else:
+            units.append((start, end))
+    if not units:
+        return []
+    tokens = [estimate_tokens(text[start:end]) for start, end in units]
+
+    chunks = []
+    first = 0
+    while first < len(units):
+        last = first
+        used = tokens[first]
+        while last + 1 < len(units) and used + tokens[last + 1] <= max_tokens:
+            last += 1
+            used += tokens[last]
+        start, end = units[first][0], units[last][1]
+        chunks.append(Chunk(len(chunks), start, end, text[start:end]))
+        if last + 1 >= len(units):
+            break
+        # 往回退几个段落作为重叠，但至少前进一个段落，且重叠部分要给下一段留出预算
+        next_first = last + 1
+        overlap_budget = min(overlap_tokens, max_tokens - tokens[next_first])
+        overlap = 0
+        while next_first - 1 > first and overlap + tokens[next_first - 1] <= overlap_budget:
+            next_first -= 1
+            overlap += tokens[next_first]
+        first = next_first
+    return chunks
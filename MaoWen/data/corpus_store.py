@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+打包的语料存储
+所有文章追加写入一个分片文件 corpus.pack，每条记录独立 zlib 压缩；
+corpus_index.json 记录每篇文章在分片中的偏移，读取时通过 mmap 按目录名、标题或序号 O(1) 取出。
+分片本身是自描述的，索引丢失或落后时可以扫描分片重建。
+
+用法:
+    python corpus_store.py info output
+    python corpus_store.py export output exported_output
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+PACK_FILE = "corpus.pack"
+INDEX_FILE = "corpus_index.json"
+
+# 记录格式: MAGIC | meta 长度 | 数据长度 | meta(JSON) | zlib 压缩的数据
+MAGIC = b"MWC1"
+RECORD_HEADER = struct.Struct("<4sII")
+
+
+class CorpusStore:
+    def __init__(self, directory):
+        self.directory = str(directory)
+        self.pack_path = os.path.join(self.directory, PACK_FILE)
+        self.index_path = os.path.join(self.directory, INDEX_FILE)
+        self.lock = threading.Lock()
+        self.pack_file = None
+        self.mapped = None
+        self.index = {'pack_size': 0, 'articles': {}}
+        self.ids = {}
+        self.titles = {}
+        self.load_index()
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(str(directory), PACK_FILE))
+
+    def load_index(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        self.rebuild_lookups()
+        pack_size = os.path.getsize(self.pack_path) if os.path.exists(self.pack_path) else 0
+        if pack_size > self.index['pack_size']:
+            # 上次没来得及保存索引，从索引记录的位置继续扫描
+            self.scan(self.index['pack_size'])
+
+    def rebuild_lookups(self):
+        self.ids = {}
+        self.titles = {}
+        for key, entry in self.index['articles'].items():
+            self.ids[entry['index']] = key
+            self.titles[entry['title']] = key
+
+    def scan(self, offset=0):
+        """扫描分片，把 offset 之后的记录补进索引"""
+        with open(self.pack_path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                magic, meta_len, data_len = RECORD_HEADER.unpack(header)
+                meta_raw = f.read(meta_len)
+                if magic != MAGIC or len(meta_raw) < meta_len:
+                    break
+                data_offset = f.tell()
+                if len(f.read(data_len)) < data_len:
+                    # 最后一条记录写了一半
+                    break
+                self.apply_record(json.loads(meta_raw), data_offset, data_len)
+                offset = f.tell()
+        self.index['pack_size'] = offset
+
+    def apply_record(self, meta, data_offset, data_len):
+        key = meta['key']
+        if meta['kind'] == 'rename':
+            entry = self.index['articles'].pop(meta['old_key'], None)
+            if entry:
+                self.index['articles'][key] = entry
+                self.ids[entry['index']] = key
+                self.titles[entry['title']] = key
+            return
+        entry = self.index['articles'].setdefault(key, {})
+        if meta['kind'] == 'content':
+            entry.update(meta['article'])
+            self.ids[entry['index']] = key
+            self.titles[entry['title']] = key
+        entry[meta['kind']] = [data_offset, data_len]
+
+    def _append(self, meta, data=b""):
+        """写入一条记录，调用方需持有锁"""
+        if self.pack_file is None:
+            self.pack_file = open(self.pack_path, 'ab')
+        meta_raw = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+        data = zlib.compress(data) if data else b""
+        offset = self.pack_file.tell()
+        self.pack_file.write(RECORD_HEADER.pack(MAGIC, len(meta_raw), len(data)))
+        self.pack_file.write(meta_raw)
+        data_offset = offset + RECORD_HEADER.size + len(meta_raw)
+        self.pack_file.write(data)
+        self.index['pack_size'] = data_offset + len(data)
+        self.apply_record(meta, data_offset, len(data))
+
+    def add_article(self, key, article, content_text, source=None):
+        """追加一篇文章：article 为索引信息，content_text 为 content.txt 的全文，source 为原始 HTML 字节"""
+        with self.lock:
+            self._append({'key': key, 'kind': 'content', 'article': article}, content_text.encode('utf-8'))
+            if source is not None:
+                self._append({'key': key, 'kind': 'source'}, source)
+
+    def rename(self, old_key, new_key):
+        with self.lock:
+            self._append({'key': new_key, 'kind': 'rename', 'old_key': old_key})
+
+    def flush(self):
+        """刷新分片并原子地保存索引"""
+        with self.lock:
+            if self.pack_file is not None:
+                self.pack_file.flush()
+                os.fsync(self.pack_file.fileno())
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            if self.pack_file is not None:
+                self.pack_file.close()
+                self.pack_file = None
+            if self.mapped is not None:
+                self.mapped.close()
+                self.mapped = None
+
+    def resolve(self, key):
+        """把目录名、标题或序号解析为存储键"""
+        if isinstance(key, int):
+            return self.ids.get(key)
+        if key in self.index['articles']:
+            return key
+        return self.titles.get(key)
+
+    def has(self, key):
+        key = self.resolve(key)
+        return key is not None and 'content' in self.index['articles'][key]
+
+    def keys(self):
+        """按文章序号排列的所有存储键"""
+        articles = self.index['articles']
+        return sorted((key for key in articles if 'content' in articles[key]), key=lambda k: articles[k]['index'])
+
+    def get_article(self, key):
+        key = self.resolve(key)
+        return dict(self.index['articles'][key]) if key else None
+
+    def _read(self, span):
+        offset, length = span
+        if not length:
+            return b""
+        if self.mapped is None or offset + length > len(self.mapped):
+            # 分片变长后重新映射；旧的映射可能仍被其他线程使用，交给垃圾回收关闭
+            with self.lock:
+                if self.pack_file is not None:
+                    self.pack_file.flush()
+                with open(self.pack_path, 'rb') as f:
+                    self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return zlib.decompress(self.mapped[offset:offset + length])
+
+    def get_content(self, key):
+        """返回 content.txt 的全文，没有该文章时返回 None"""
+        key = self.resolve(key)
+        if key is None or 'content' not in self.index['articles'][key]:
+            return None
+        return self._read(self.index['articles'][key]['content']).decode('utf-8')
+
+    def get_source(self, key):
+        """返回原始 HTML 字节，没有保存时返回 None"""
+        key = self.resolve(key)
+        if key is None or 'source' not in self.index['articles'][key]:
+            return None
+        return self._read(self.index['articles'][key]['source'])
+
+
+def export_to_directories(store, target_dir):
+    """导出为原来的 <序号>_<标题>/content.txt + source.html 目录结构，返回导出的文章数"""
+    os.makedirs(target_dir, exist_ok=True)
+    articles_info = []
+    for key in store.keys():
+        article_dir = os.path.join(target_dir, key)
+        os.makedirs(article_dir, exist_ok=True)
+        with open(os.path.join(article_dir, "content.txt"), 'w', encoding='utf-8') as f:
+            f.write(store.get_content(key))
+        source = store.get_source(key)
+        if source is not None:
+            with open(os.path.join(article_dir, "source.html"), 'wb') as f:
+                f.write(source)
+        article = store.get_article(key)
+        articles_info.append({k: v for k, v in article.items() if k not in ('content', 'source')})
+    with open(os.path.join(target_dir, "articles_index.json"), 'w', encoding='utf-8') as f:
+        json.dump(articles_info, f, ensure_ascii=False, indent=2)
+    return len(articles_info)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="打包语料工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    info_parser = subparsers.add_parser("info", help="查看打包语料的统计信息")
+    info_parser.add_argument("directory", help="包含 corpus.pack 的目录")
+    export_parser = subparsers.add_parser("export", help="导出为文章目录结构")
+    export_parser.add_argument("directory", help="包含 corpus.pack 的目录")
+    export_parser.add_argument("target", help="导出目录")
+    args = parser.parse_args()
+
+    if not CorpusStore.exists(args.directory):
+        print(f"❌ 目录 {args.directory} 中没有 {PACK_FILE}")
+        return
+    store = CorpusStore(args.directory)
+    if args.command == "info":
+        print(f"📚 文章数: {len(store.keys())}")
+        print(f"💾 分片大小: {store.index['pack_size'] / 1024 / 1024:.2f} MB")
+    elif args.command == "export":
+        count = export_to_directories(store, args.target)
+        print(f"✅ 已导出 {count} 篇文章到 {args.target}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+爬取日志
+以追加方式记录待爬列表（frontier）、已完成和失败的文章，每条记录写完立即落盘。
+进程中途被杀掉后，可以通过重放日志恢复进度并重建文章索引。
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+
+from jsonl_io import repair_tail
+
+
+class CrawlJournal:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _append(self, record):
+        record['time'] = datetime.now().isoformat()
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self.lock:
+            if self.file is None:
+                # 上次中途退出时最后一行可能只写了一半，先截掉，否则新记录会接在半行后面一起作废
+                repair_tail(self.path)
+                self.file = open(self.path, 'a', encoding='utf-8')
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def start(self, article_links):
+        """开始新的爬取：清空旧日志并写入本次的 frontier"""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+            self.file = open(self.path, 'w', encoding='utf-8')
+        self._append({'event': 'frontier', 'links': article_links})
+
+    def record_done(self, article_data):
+        self._append({'event': 'done', 'url': article_data['url'], 'article': article_data})
+
+    def record_failed(self, url, index, error):
+        self._append({'event': 'failed', 'url': url, 'index': index, 'error': error})
+
+    def replay(self):
+        """重放日志，返回 frontier、已完成文章和仍处于失败状态的文章"""
+        frontier = []
+        done = {}
+        failed = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 最后一行可能在写入时被中断，忽略即可
+                    continue
+                event = record.get('event')
+                if event == 'frontier':
+                    frontier = record['links']
+                    done = {}
+                    failed = {}
+                elif event == 'done':
+                    done[record['url']] = record['article']
+                    failed.pop(record['url'], None)
+                elif event == 'failed':
+                    entry = failed.setdefault(record['url'], {'index': record['index'], 'attempts': 0})
+                    entry['attempts'] += 1
+                    entry['error'] = record['error']
+        return {'frontier': frontier, 'done': done, 'failed': failed}
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
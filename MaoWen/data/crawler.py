@@ -6,15 +6,29 @@
 """
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 import os
-import time
 import re
 from urllib.parse import urljoin, urlparse
 import json
 import logging
+import argparse
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 
+from politeness import PolitenessPolicy, THROTTLE_STATUS, parse_retry_after
+from manifest import CrawlManifest, content_hash
+from crawl_journal import CrawlJournal
+from link_extractor import DEFAULT_BOUNDARY_MARKERS, PARSER_BACKENDS, extract_links
+from article_extractor import content_body, process_article
+from charset import CharsetSniffer
+from corpus_store import CorpusStore
+from frontier import DEFAULT_EXCLUDE_TITLE_PATTERNS, BloomFilter, UrlRules, normalize_url, subtree_pattern
+from near_dup import LSHIndex, text_signature
+
 # 设置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -26,51 +40,114 @@ logging.basicConfig(
 )
 
 class MaoZedongCrawler:
-    def __init__(self, base_url="https://www.marxists.org/chinese/maozedong/index.htm"):
+    def __init__(self, base_url="https://www.marxists.org/chinese/maozedong/index.htm",
+                 output_dir="output", rate=1.0, burst=1, per_host_concurrency=4, pool_size=16,
+                 max_retries=3, incremental=False, retry_rounds=2, parser='lxml',
+                 boundary_markers=None, exclude_title_patterns=None, extract_workers=0, queue_size=32,
+                 store='dir', site_seeds=None, max_depth=3, include_patterns=None, exclude_patterns=None,
+                 index_patterns=None, visited_capacity=1_000_000, dedup_threshold=0.85):
         self.base_url = base_url
-        self.base_domain = "https://www.marxists.org"
+        parsed = urlparse(base_url)
+        self.base_domain = f"{parsed.scheme}://{parsed.netloc}"
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
-        self.output_dir = "output"
+        # 所有请求共用一个连接池，并发模式下连接数上限为 pool_size
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.output_dir = output_dir
+        # 每个主机的令牌桶限速与退避策略，取代固定的 sleep
+        self.politeness = PolitenessPolicy(rate=rate, burst=burst)
+        self.max_retries = max_retries
+        self.charset = CharsetSniffer()
+        self.per_host_concurrency = per_host_concurrency  # 并发模式下每个主机同时进行的请求数
+        self.pool_size = pool_size
+        # 并发模式下的正文提取进程数，0 表示在抓取线程内直接提取
+        self.extract_workers = extract_workers
+        self.queue_size = queue_size  # 抓取结果队列上限，队列满时抓取暂停
+        # 索引页解析后端及第五卷边界规则
+        self.parser = parser
+        self.boundary_markers = DEFAULT_BOUNDARY_MARKERS if boundary_markers is None else boundary_markers
+        
+        # 全站模式：从 site_seeds 出发广度优先遍历索引页；未指定包含规则时限定在种子页所在目录的子树内
+        self.site_seeds = site_seeds or []
+        self.max_depth = max_depth
+        self.visited_capacity = visited_capacity
+        if include_patterns is None:
+            include_patterns = [subtree_pattern(seed) for seed in self.site_seeds]
+        # 单索引页模式默认跳过第五卷之后的标题，与分卷边界标记配合；全站模式要抓取后面各卷，与边界标记一样默认不用
+        if exclude_title_patterns is None:
+            exclude_title_patterns = [] if self.site_seeds else DEFAULT_EXCLUDE_TITLE_PATTERNS
+        self.rules = UrlRules(
+            include_patterns=include_patterns,
+            exclude_patterns=exclude_patterns,
+            index_patterns=index_patterns,
+            exclude_title_patterns=exclude_title_patterns
+        )
         self.articles_info = []
+        self.info_lock = threading.Lock()
         
         # 创建输出目录
         os.makedirs(self.output_dir, exist_ok=True)
+        
+        # 增量模式下发送条件请求，并跳过内容没有变化的文章
+        self.incremental = incremental
+        self.manifest = CrawlManifest(os.path.join(self.output_dir, "crawl_manifest.json"))
+        
+        # 追加写的爬取日志，用于断点续爬；失败的文章进入重试队列
+        self.journal = CrawlJournal(os.path.join(self.output_dir, "crawl_journal.jsonl"))
+        self.retry_rounds = retry_rounds
+        
+        # 语料存储方式：dir 为每篇文章一个目录，pack 为打包分片，both 同时写两种
+        self.store = store
+        self.corpus = CorpusStore(self.output_dir) if store in ('pack', 'both') else None
+        
+        # 近似重复检测的相似度阈值，0 表示不检测
+        self.dedup_threshold = dedup_threshold
     
-    def get_page(self, url, max_retries=3):
-        """获取网页内容，带重试机制"""
+    def get_page(self, url, max_retries=None, headers=None):
+        """获取网页内容，带限速和重试机制；304 响应原样返回给调用方"""
+        if max_retries is None:
+            max_retries = self.max_retries
+        # max_retries 为 0 时循环一次也不执行，日志中按 0 次尝试记录
+        attempt = -1
         for attempt in range(max_retries):
+            self.politeness.wait_turn(url)
             try:
-                response = self.session.get(url, timeout=30)
-                # 检测编码格式，优先尝试GB2312
-                if 'charset=' in response.headers.get('content-type', '').lower():
-                    # 如果响应头中指定了编码，使用指定的编码
-                    pass  # requests会自动处理
-                else:
-                    # 尝试不同的编码格式
-                    try:
-                        # 先尝试GB2312/GBK编码
-                        response.encoding = 'gb2312'
-                        test_text = response.text[:1000]  # 测试前1000个字符
-                        if '毛泽东' in test_text or '选集' in test_text:
-                            logging.info("使用GB2312编码")
-                        else:
-                            response.encoding = 'utf-8'
-                            logging.info("使用UTF-8编码")
-                    except:
-                        response.encoding = 'utf-8'
-                
-                if response.status_code == 200:
-                    return response
-                else:
-                    logging.warning(f"HTTP {response.status_code} for {url}")
-            except Exception as e:
+                response = self.session.get(url, headers=headers, timeout=30)
+            except requests.RequestException as e:
                 logging.warning(f"Attempt {attempt + 1} failed for {url}: {e}")
-                time.sleep(2)
-        
-        logging.error(f"Failed to get {url} after {max_retries} attempts")
+                if attempt + 1 < max_retries:
+                    self.politeness.backoff(url, attempt)
+                continue
+            
+            self.politeness.record_status(url, response.status_code)
+            if response.status_code == 304:
+                return response
+            if response.status_code != 200:
+                logging.warning(f"HTTP {response.status_code} for {url}")
+                if not self.politeness.is_retryable(response.status_code):
+                    # 404 等客户端错误重试也没有意义，直接放弃
+                    break
+                if attempt + 1 < max_retries:
+                    retry_after = None
+                    if response.status_code in THROTTLE_STATUS:
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    self.politeness.backoff(url, attempt, retry_after)
+                continue
+            
+            # 在原始字节上判断编码，之后只解码一次
+            response.encoding = self.charset.sniff(
+                response.content,
+                response.headers.get('content-type'),
+                urlparse(url).netloc
+            )
+            return response
+        
+        self.politeness.record_failure(url)
+        logging.error(f"Failed to get {url} after {attempt + 1} attempts")
         return None
     
     def clean_filename(self, filename):
@@ -92,61 +169,32 @@ class MaoZedongCrawler:
             logging.error("无法获取主页面")
             return []
         
-        soup = BeautifulSoup(response.text, 'html.parser')
-        article_links = []
-        
-        # 查找所有的文章链接
-        # 记录页面内容用于调试
-        logging.info(f"页面标题: {soup.title.get_text() if soup.title else '无标题'}")
+        # 一次遍历同时找第五卷标记和链接，标记之后的内容不再解析
+        links, boundary = extract_links(response.text, self.parser, self.boundary_markers)
+        if boundary:
+            logging.info(f"找到第五卷标记: {boundary}")
         
-        # 标记是否已经到达第五卷
-        reached_volume_five = False
-        
-        # 如果没有通过表格找到第五卷标记，则通过其他方式检查
-        if not reached_volume_five:
-            # 模式2: 直接查找所有链接，但需要按顺序检查
-            page_text = soup.get_text()
-            fifth_volume_pos = -1
-            
-            # 查找第五卷的位置标记
-            fifth_volume_markers = ['有学者指出，1977年官方版《毛泽东选集》']
-            for marker in fifth_volume_markers:
-                pos = page_text.find(marker)
-                if pos != -1:
-                    fifth_volume_pos = pos
-                    logging.info(f"找到第五卷标记: {marker}")
-                    break
-            
-            all_links = soup.find_all('a', href=True)
-            for link in all_links:
-                # 如果找到了第五卷位置，检查链接是否在第五卷之后
-                if fifth_volume_pos != -1:
-                    link_text_pos = page_text.find(link.get_text().strip())
-                    if link_text_pos > fifth_volume_pos:
-                        continue  # 跳过第五卷之后的链接
+        article_links = []
+        for title, href in links:
+            if href.endswith('.htm') and not href.endswith('index.htm'):
+                # 构建完整URL
+                if href.startswith('/'):
+                    full_url = self.base_domain + href
+                elif href.startswith('http'):
+                    full_url = href
+                else:
+                    full_url = urljoin(self.base_url, href)
                 
-                href = link.get('href')
-                if href and href.endswith('.htm') and not href.endswith('index.htm'):
-                    # 构建完整URL
-                    if href.startswith('/'):
-                        full_url = self.base_domain + href
-                    elif href.startswith('http'):
-                        full_url = href
-                    else:
-                        full_url = urljoin(self.base_url, href)
-                    
-                    title = link.get_text().strip()
-                    
-                    # 额外的过滤：跳过明显是第五卷之后的内容
-                    if any(keyword in title for keyword in ['思想万岁', '1949年', '1950年', '1951年', '1952年', '1953年', '1954年', '1955年', '1956年', '1957年']):
-                        continue
-                    
-                    if title and len(title) > 1:
-                        article_links.append({
-                            'title': title,
-                            'url': full_url,
-                            'href': href
-                        })
+                # 额外的过滤：跳过明显是第五卷之后的内容
+                if not self.rules.title_allowed(title):
+                    continue
+                
+                if title and len(title) > 1:
+                    article_links.append({
+                        'title': title,
+                        'url': full_url,
+                        'href': href
+                    })
         
         # 去重
         seen_urls = set()
@@ -159,91 +207,146 @@ class MaoZedongCrawler:
         logging.info(f"共找到 {len(unique_links)} 个文章链接（已过滤第五卷及之后内容）")
         return unique_links
     
-    def download_article(self, article_info, index):
-        """下载单篇文章"""
+    def fetch_article_page(self, article_info, index):
+        """
+        抓取阶段：下载文章页面。
+        返回 (article_data, None) 表示文章未变化已复用，(None, job) 表示需要提取正文，(None, None) 表示下载失败
+        """
         title = article_info['title']
         url = article_info['url']
         
         logging.info(f"正在下载第 {index + 1} 篇文章: {title}")
         
-        response = self.get_page(url)
+        headers = self.manifest.conditional_headers(url) if self.incremental else None
+        response = self.get_page(url, headers=headers)
+        if response is not None and response.status_code == 304:
+            article_data = self.reuse_article(article_info, index)
+            if article_data:
+                return article_data, None
+            # 服务器说没变但本地文件已经丢失，重新完整下载
+            response = self.get_page(url)
         if not response:
             logging.error(f"无法下载文章: {title}")
-            return None
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 提取文章内容
-        content = ""
-        
-        # 尝试不同的内容选择器
-        content_selectors = [
-            'div.content',
-            'div#content',
-            'article',
-            'div.main',
-            'div.text',
-            'body'
-        ]
-        
-        article_content = None
-        for selector in content_selectors:
-            article_content = soup.select_one(selector)
-            if article_content:
-                break
+            return None, None
         
-        if not article_content:
-            article_content = soup
+        body_hash = content_hash(response.content)
+        validators = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')
+        }
+        previous = self.manifest.get(url)
+        if self.incremental and previous and previous.get('content_hash') == body_hash:
+            # 服务器不支持条件请求，但内容哈希没变，同样跳过
+            article_data = self.reuse_article(article_info, index)
+            if article_data:
+                self.manifest.update(url, **validators)
+                return article_data, None
         
-        # 移除导航和非内容元素
-        for element in article_content.find_all(['nav', 'header', 'footer', 'script', 'style']):
-            element.decompose()
+        filename = self.clean_filename(f"{index:03d}_{title}")
+        job = {
+            'index': index,
+            'title': title,
+            'url': url,
+            'filename': filename,
+            'article_dir': os.path.join(self.output_dir, filename),
+            'download_time': datetime.now().isoformat(),
+            'body': response.content,
+            'encoding': response.encoding,
+            'content_hash': body_hash,
+            'validators': validators,
+            'write_dir': self.store != 'pack',
+            'return_text': self.corpus is not None,
+            'signature': self.dedup_threshold > 0
+        }
+        return None, job
+    
+    def finish_article(self, job, result):
+        """正文提取完成后写入打包语料，并更新清单和索引"""
+        title = job['title']
+        content_length = result['content_length']
+        if content_length < 100:  # 内容太短，可能不是正文
+            logging.warning(f"文章内容太短，可能提取失败: {title}")
         
-        # 提取文本内容
-        content = article_content.get_text().strip()
+        article_data = {
+            'index': job['index'],
+            'title': title,
+            'url': job['url'],
+            'filename': job['filename'],
+            'content_length': content_length,
+            'download_time': job['download_time'],
+            'changed': True
+        }
         
-        # 清理内容
-        content = re.sub(r'\n\s*\n', '\n\n', content)  # 合并多个空行
-        content = re.sub(r'[ \t]+', ' ', content)  # 合并多个空格
+        if self.corpus is not None:
+            self.corpus.add_article(job['filename'], article_data, result['content_text'], job['body'])
+        
+        self.manifest.update(
+            job['url'],
+            content_hash=job['content_hash'],
+            **job['validators'],
+            filename=job['filename'],
+            content_length=content_length,
+            download_time=job['download_time'],
+            minhash=result.get('minhash')
+        )
+        with self.info_lock:
+            self.articles_info.append(article_data)
+        
+        logging.info(f"已保存文章: {title} ({content_length} 字符)")
+        return article_data
+    
+    def download_article(self, article_info, index):
+        """下载单篇文章，在当前线程内完成正文提取"""
+        article_data, job = self.fetch_article_page(article_info, index)
+        if job is None:
+            return article_data
+        return self.finish_article(job, process_article(job))
+    
+    def reuse_article(self, article_info, index):
+        """文章没有变化时复用上次的输出，不重写 content.txt/source.html；本地文件缺失时返回 None"""
+        title = article_info['title']
+        url = article_info['url']
+        previous = self.manifest.get(url)
+        if not previous or not previous.get('filename'):
+            return None
         
-        if len(content) < 100:  # 内容太短，可能不是正文
-            logging.warning(f"文章内容太短，可能提取失败: {title}")
+        old_dir = os.path.join(self.output_dir, previous['filename'])
+        in_dir = os.path.exists(os.path.join(old_dir, "content.txt"))
+        in_pack = self.corpus is not None and self.corpus.has(previous['filename'])
+        if (self.store != 'pack' and not in_dir) or (self.corpus is not None and not in_pack):
+            return None
         
-        # 保存文章
+        # 索引页顺序变化时文章序号会变，只需要重命名目录
         filename = self.clean_filename(f"{index:03d}_{title}")
-        article_dir = os.path.join(self.output_dir, filename)
-        os.makedirs(article_dir, exist_ok=True)
-        
-        # 保存文本内容
-        txt_file = os.path.join(article_dir, "content.txt")
-        with open(txt_file, 'w', encoding='utf-8') as f:
-            f.write(f"标题: {title}\n")
-            f.write(f"链接: {url}\n")
-            f.write(f"下载时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write("-" * 50 + "\n\n")
-            f.write(content)
-        
-        # 保存HTML源码
-        html_file = os.path.join(article_dir, "source.html")
-        with open(html_file, 'w', encoding='utf-8') as f:
-            f.write(response.text)
+        if filename != previous['filename']:
+            new_dir = os.path.join(self.output_dir, filename)
+            if os.path.exists(new_dir) or (in_pack and self.corpus.has(filename)):
+                return None
+            if in_dir:
+                os.rename(old_dir, new_dir)
+            if in_pack:
+                self.corpus.rename(previous['filename'], filename)
+            self.manifest.update(url, filename=filename)
         
         article_data = {
             'index': index,
             'title': title,
             'url': url,
             'filename': filename,
-            'content_length': len(content),
-            'download_time': datetime.now().isoformat()
+            'content_length': previous['content_length'],
+            'download_time': previous['download_time'],
+            'changed': False
         }
+        with self.info_lock:
+            self.articles_info.append(article_data)
         
-        self.articles_info.append(article_data)
-        
-        logging.info(f"已保存文章: {title} ({len(content)} 字符)")
+        logging.info(f"文章未变化，跳过: {title}")
         return article_data
     
     def save_articles_index(self):
         """保存文章索引"""
+        # 并发模式下文章完成顺序不固定，按序号排序保证两种模式输出一致
+        self.articles_info.sort(key=lambda article: article['index'])
         index_file = os.path.join(self.output_dir, "articles_index.json")
         with open(index_file, 'w', encoding='utf-8') as f:
             json.dump(self.articles_info, f, ensure_ascii=False, indent=2)
@@ -258,40 +361,403 @@ class MaoZedongCrawler:
                 f.write(f"     链接: {article['url']}\n")
                 f.write(f"     文件: {article['filename']}\n")
                 f.write(f"     字数: {article['content_length']}\n")
-                f.write(f"     下载时间: {article['download_time']}\n\n")
+                f.write(f"     下载时间: {article['download_time']}\n")
+                if article.get('duplicate_of'):
+                    f.write(f"     近似重复: {article['duplicate_of']} (相似度 {article['duplicate_similarity']})\n")
+                f.write("\n")
+    
+    def article_signature(self, article):
+        """取文章的 MinHash 签名；旧清单中没有签名时从已保存的正文补算"""
+        entry = self.manifest.get(article['url']) or {}
+        if entry.get('minhash'):
+            return entry['minhash']
+        content_text = None
+        if self.corpus is not None:
+            content_text = self.corpus.get_content(article['filename'])
+        content_file = os.path.join(self.output_dir, article['filename'], "content.txt")
+        if content_text is None and os.path.exists(content_file):
+            with open(content_file, 'r', encoding='utf-8') as f:
+                content_text = f.read()
+        if content_text is None:
+            return None
+        signature = text_signature(content_body(content_text))
+        self.manifest.update(article['url'], minhash=signature)
+        return signature
+    
+    def mark_duplicates(self):
+        """
+        按序号顺序检测近似重复：每组中序号最小的文章为代表，其余文章记录 duplicate_of，
+        组内所有文章记录 duplicate_group，下游生成问题时据此跳过重复文章
+        """
+        lsh = LSHIndex(self.dedup_threshold)
+        groups = {}
+        ordered = sorted(self.articles_info, key=lambda article: article['index'])
+        for article in ordered:
+            article['duplicate_of'] = None
+            signature = self.article_signature(article)
+            if signature is None:
+                continue
+            matches = lsh.query(signature)
+            if matches:
+                canonical, similarity = matches[0]
+                article['duplicate_of'] = canonical
+                article['duplicate_similarity'] = round(similarity, 3)
+                groups.setdefault(canonical, []).append(article['filename'])
+            else:
+                # 只有代表文章进入索引，匹配结果直接就是组代表
+                lsh.insert(article['filename'], signature)
+        
+        for article in ordered:
+            if article['filename'] in groups:
+                article['duplicate_group'] = article['filename']
+            else:
+                article['duplicate_group'] = article['duplicate_of']
+        
+        duplicates = sum(len(members) for members in groups.values())
+        if duplicates:
+            logging.info(f"发现 {len(groups)} 组近似重复文章，共 {duplicates} 篇重复（阈值 {self.dedup_threshold}）")
+            for canonical, members in groups.items():
+                logging.info(f"  {canonical} <- {', '.join(members)}")
+    
+    def save_crawl_stats(self):
+        """保存并打印每个主机的请求统计，用于调整限速参数"""
+        stats = self.politeness.stats()
+        stats_file = os.path.join(self.output_dir, "crawl_stats.json")
+        with open(stats_file, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+        for host, host_stats in stats.items():
+            logging.info(
+                f"{host}: 请求 {host_stats['requests']} 次, 重试 {host_stats['retries']} 次, "
+                f"失败 {host_stats['failures']} 次, 限速等待 {host_stats['throttled_time']:.1f}s, "
+                f"退避等待 {host_stats['backoff_time']:.1f}s, 状态码 {host_stats['status']}"
+            )
+    
+    def fetch_article(self, article_info, index):
+        """下载一篇文章并记录到日志，返回是否成功"""
+        try:
+            article_data = self.download_article(article_info, index)
+            error = None if article_data else "无法获取页面"
+        except Exception as e:
+            article_data = None
+            error = str(e)
+        return self.record_result(article_info, index, article_data, error)
+    
+    def article_stored(self, article):
+        """
+        文章正文是否已经写入语料。完成记录立即 fsync 到日志，打包语料和索引却每 20 篇才刷新一次，
+        中途退出时日志中可能有正文没写进 corpus.pack 的文章
+        """
+        if self.corpus is not None and not self.corpus.has(article['filename']):
+            return False
+        if self.store != 'pack':
+            return os.path.exists(os.path.join(self.output_dir, article['filename'], "content.txt"))
+        return True
+    
+    def record_result(self, article_info, index, article_data, error=None):
+        """把一篇文章的结果写入日志，失败的进入重试队列"""
+        if article_data:
+            self.journal.record_done(article_data)
+            # 定期保存清单，中途退出时增量信息也不会全部丢失
+            if len(self.articles_info) % 20 == 0:
+                self.manifest.save()
+                if self.corpus is not None:
+                    self.corpus.flush()
+            return True
+        
+        logging.error(f"下载文章失败: {article_info['title']}, 错误: {error}，已加入重试队列")
+        self.journal.record_failed(article_info['url'], index, error)
+        return False
+    
+    def crawl_sequential(self, pending):
+        """顺序下载 pending 中的 (序号, 文章)，返回失败的部分"""
+        failed = []
+        for index, article_info in pending:
+            if not self.fetch_article(article_info, index):
+                failed.append((index, article_info))
+        return failed
+    
+    def host_slot(self, host_semaphores, url):
+        """返回该主机的并发槽位"""
+        host = urlparse(url).netloc
+        if host not in host_semaphores:
+            host_semaphores[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return host_semaphores[host]
     
-    def crawl_all(self):
-        """爬取所有文章"""
+    async def run_bounded(self, items, handle):
+        """最多 pool_size 个协程依次从 items 取任务执行，协程数量与任务总数无关"""
+        items = iter(items)
+        
+        async def worker():
+            for item in items:
+                await handle(*item)
+        
+        await asyncio.gather(*(worker() for _ in range(self.pool_size)))
+    
+    async def crawl_concurrent(self, pending):
+        """并发下载：每个主机最多 per_host_concurrency 个请求同时进行，速率由令牌桶控制，返回失败的部分"""
+        loop = asyncio.get_running_loop()
+        host_semaphores = {}
+        failed = []
+        
+        async def fetch_one(index, article_info):
+            async with self.host_slot(host_semaphores, article_info['url']):
+                ok = await loop.run_in_executor(executor, self.fetch_article, article_info, index)
+            if not ok:
+                failed.append((index, article_info))
+        
+        # requests 是阻塞的，由线程池执行，asyncio 负责调度和限流
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            await self.run_bounded(pending, fetch_one)
+        return failed
+    
+    async def crawl_pipeline(self, pending):
+        """
+        两阶段流水线：抓取线程把原始字节放入有界队列，进程池负责解析、清理和写文件。
+        队列满时抓取会等待，内存占用与站点大小无关
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        host_semaphores = {}
+        failed = []
+        
+        async def fetcher(index, article_info):
+            async with self.host_slot(host_semaphores, article_info['url']):
+                try:
+                    article_data, job = await loop.run_in_executor(
+                        fetch_executor, self.fetch_article_page, article_info, index
+                    )
+                    error = None if article_data or job else "无法获取页面"
+                except Exception as e:
+                    article_data, job, error = None, None, str(e)
+                if job is not None:
+                    # 在槽位内入队：队列满时该主机的抓取同样暂停
+                    await queue.put((article_info, job))
+                    return
+            if not self.record_result(article_info, index, article_data, error):
+                failed.append((index, article_info))
+        
+        async def extractor():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                article_info, job = item
+                try:
+                    result = await loop.run_in_executor(extract_pool, process_article, job)
+                    article_data = self.finish_article(job, result)
+                    error = None
+                except Exception as e:
+                    article_data, error = None, str(e)
+                if not self.record_result(article_info, job['index'], article_data, error):
+                    failed.append((job['index'], article_info))
+        
+        # 使用 spawn 启动提取进程，避免在已有线程的进程中 fork
+        mp_context = multiprocessing.get_context('spawn')
+        with ThreadPoolExecutor(max_workers=self.pool_size) as fetch_executor, \
+                ProcessPoolExecutor(max_workers=self.extract_workers, mp_context=mp_context) as extract_pool:
+            extractors = [asyncio.create_task(extractor()) for _ in range(self.extract_workers)]
+            await self.run_bounded(pending, fetcher)
+            for _ in extractors:
+                await queue.put(None)
+            await asyncio.gather(*extractors)
+        return failed
+    
+    def fetch_index_links(self, url):
+        """下载一个索引页，返回其中的 (标题, href)；全站模式下不使用分卷边界标记"""
+        response = self.get_page(url)
+        if not response:
+            logging.error(f"无法获取索引页: {url}")
+            return []
+        links, _ = extract_links(response.text, self.parser, [])
+        return links
+    
+    async def fetch_index_level(self, urls):
+        """并发下载同一层的所有索引页，结果与 urls 顺序一致"""
+        loop = asyncio.get_running_loop()
+        host_semaphores = {}
+        results = [None] * len(urls)
+        
+        async def fetch_one(position, url):
+            async with self.host_slot(host_semaphores, url):
+                results[position] = await loop.run_in_executor(executor, self.fetch_index_links, url)
+        
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            await self.run_bounded(enumerate(urls), fetch_one)
+        return results
+    
+    def discover_site(self, concurrent=False):
+        """
+        从种子页出发按层广度优先遍历索引页，返回发现的文章链接。
+        同一层内按页面和链接的顺序编号，并发与否结果一致
+        """
+        visited = BloomFilter(self.visited_capacity)
+        level = []
+        for seed in self.site_seeds:
+            url = normalize_url(seed)
+            if not visited.add(url):
+                level.append(url)
+        
+        article_links = []
+        depth = 0
+        while level:
+            logging.info(f"第 {depth} 层: {len(level)} 个索引页")
+            if concurrent:
+                results = asyncio.run(self.fetch_index_level(level))
+            else:
+                results = [self.fetch_index_links(url) for url in level]
+            
+            next_level = []
+            for page_url, links in zip(level, results):
+                for title, href in links:
+                    url = normalize_url(urljoin(page_url, href))
+                    if not url.startswith('http') or not self.rules.allowed(url):
+                        continue
+                    if self.rules.is_index(url):
+                        if depth < self.max_depth and not visited.add(url):
+                            next_level.append(url)
+                    elif self.rules.is_article(url) and len(title) > 1 and self.rules.title_allowed(title):
+                        if not visited.add(url):
+                            article_links.append({'title': title, 'url': url, 'href': href})
+            level = next_level
+            depth += 1
+        
+        logging.info(
+            f"全站遍历完成：{depth} 层，{len(article_links)} 篇文章，"
+            f"已访问集合 {visited.count} 项，占用 {visited.size_bytes / 1024:.0f} KB"
+        )
+        return article_links
+    
+    def download_pending(self, pending, concurrent):
+        if concurrent and self.extract_workers > 0:
+            return asyncio.run(self.crawl_pipeline(pending))
+        if concurrent:
+            return asyncio.run(self.crawl_concurrent(pending))
+        return self.crawl_sequential(pending)
+    
+    def crawl_all(self, concurrent=False, resume=False):
+        """爬取所有文章；resume=True 时从爬取日志恢复上次的进度"""
         logging.info("开始爬取毛泽东文章...")
         
-        # 获取所有文章链接
-        article_links = self.extract_article_links()
-        if not article_links:
-            logging.error("未找到任何文章链接")
-            return
+        if resume and self.journal.exists():
+            state = self.journal.replay()
+            article_links = state['frontier']
+            done = {url: article for url, article in state['done'].items() if self.article_stored(article)}
+            lost = len(state['done']) - len(done)
+            if lost:
+                logging.warning(f"日志中有 {lost} 篇已完成的文章没有写入语料（上次中途退出），重新下载")
+            pending = [
+                (index, info) for index, info in enumerate(article_links)
+                if info['url'] not in done
+            ]
+            logging.info(
+                f"从日志恢复：已完成 {len(done)} 篇，待下载 {len(pending)} 篇"
+                f"（其中 {len(state['failed'])} 篇上次失败）"
+            )
+        else:
+            if resume:
+                logging.warning("没有找到爬取日志，重新开始爬取")
+            # 获取所有文章链接
+            if self.site_seeds:
+                article_links = self.discover_site(concurrent)
+            else:
+                article_links = self.extract_article_links()
+            if not article_links:
+                logging.error("未找到任何文章链接")
+                return
+            self.journal.start(article_links)
+            pending = list(enumerate(article_links))
+        
+        logging.info(f"准备下载 {len(pending)} 篇文章")
+        if concurrent:
+            logging.info(f"使用并发模式，每个主机并发数: {self.per_host_concurrency}")
+            if self.extract_workers > 0:
+                logging.info(f"正文提取进程数: {self.extract_workers}，队列上限: {self.queue_size}")
+        
+        # 下载每篇文章，失败的进入重试队列
+        failed = self.download_pending(pending, concurrent)
+        for retry_round in range(self.retry_rounds):
+            if not failed:
+                break
+            logging.info(f"第 {retry_round + 1} 轮重试，共 {len(failed)} 篇")
+            failed = self.download_pending(failed, concurrent)
+        for index, article_info in failed:
+            logging.error(f"多次重试后仍然失败: {index:03d} {article_info['title']}，可使用 --resume 再次重试")
         
-        logging.info(f"准备下载 {len(article_links)} 篇文章")
+        # 索引从日志重建，包含之前运行中已完成的文章
+        state = self.journal.replay()
+        self.articles_info = [article for article in state['done'].values() if self.article_stored(article)]
+        self.journal.close()
         
-        # 下载每篇文章
-        for i, article_info in enumerate(article_links):
-            try:
-                self.download_article(article_info, i)
-                # 添加延迟避免过于频繁的请求
-                time.sleep(1)
-            except Exception as e:
-                logging.error(f"下载文章失败: {article_info['title']}, 错误: {e}")
-                continue
+        if self.dedup_threshold > 0:
+            self.mark_duplicates()
         
         # 保存索引
         self.save_articles_index()
+        self.manifest.save()
+        if self.corpus is not None:
+            self.corpus.close()
+        self.save_crawl_stats()
         
-        logging.info(f"爬取完成！共成功下载 {len(self.articles_info)} 篇文章")
+        changed = sum(1 for article in self.articles_info if article['changed'])
+        logging.info(f"爬取完成！共成功下载 {len(self.articles_info)} 篇文章，其中 {changed} 篇有变化")
         logging.info(f"文章保存在目录: {self.output_dir}")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="毛泽东文章爬虫")
+    parser.add_argument("--base-url", default="https://www.marxists.org/chinese/maozedong/index.htm", help="索引页地址")
+    parser.add_argument("--output-dir", default="output", help="输出目录")
+    parser.add_argument("--concurrent", action="store_true", help="使用 asyncio 并发下载")
+    parser.add_argument("--per-host-concurrency", type=int, default=4, help="每个主机同时进行的请求数")
+    parser.add_argument("--store", default="dir", choices=["dir", "pack", "both"], help="语料存储方式：文章目录、打包分片或两者都写")
+    parser.add_argument("--extract-workers", type=int, default=0, help="并发模式下的正文提取进程数，0 表示在抓取线程内提取")
+    parser.add_argument("--queue-size", type=int, default=32, help="等待提取的页面数上限")
+    parser.add_argument("--pool-size", type=int, default=16, help="共享连接池大小")
+    parser.add_argument("--rate", type=float, default=1.0, help="每个主机每秒的请求数，0 表示不限速")
+    parser.add_argument("--burst", type=int, default=1, help="令牌桶容量，允许的瞬时突发请求数")
+    parser.add_argument("--resume", action="store_true", help="从爬取日志恢复上次中断的爬取")
+    parser.add_argument("--retry-rounds", type=int, default=2, help="失败文章的重试轮数")
+    parser.add_argument("--incremental", action="store_true", help="增量爬取：条件请求并跳过未变化的文章")
+    parser.add_argument("--site", action="store_true", help="全站模式：从种子页广度优先遍历多个索引页")
+    parser.add_argument("--seed", action="append", help="全站模式的种子页，可指定多次，默认为 --base-url")
+    parser.add_argument("--max-depth", type=int, default=3, help="全站模式下索引页的最大深度")
+    parser.add_argument("--include", action="append", help="只抓取匹配该正则的 URL，可指定多次，默认为种子页所在目录")
+    parser.add_argument("--exclude", action="append", help="跳过匹配该正则的 URL，可指定多次")
+    parser.add_argument("--index-pattern", action="append", help="匹配该正则的 URL 作为索引页展开，可指定多次")
+    parser.add_argument("--exclude-title", action="append", help="跳过标题匹配该正则的链接，可指定多次，指定后替换默认规则（单索引页模式默认跳过第五卷之后的标题）")
+    parser.add_argument("--no-default-excludes", action="store_true", help="不使用默认的标题排除规则")
+    parser.add_argument("--dedup-threshold", type=float, default=0.85, help="近似重复文章的相似度阈值，0 表示不检测")
+    parser.add_argument("--visited-capacity", type=int, default=1_000_000, help="已访问集合（布隆过滤器）的预计容量")
+    parser.add_argument("--parser", default="lxml", choices=sorted(PARSER_BACKENDS), help="索引页解析后端")
+    parser.add_argument("--max-retries", type=int, default=3, help="每个请求的最大尝试次数")
+    return parser.parse_args()
+
 def main():
     """主函数"""
-    crawler = MaoZedongCrawler()
-    crawler.crawl_all()
+    args = parse_args()
+    crawler = MaoZedongCrawler(
+        base_url=args.base_url,
+        output_dir=args.output_dir,
+        rate=args.rate,
+        burst=args.burst,
+        max_retries=args.max_retries,
+        incremental=args.incremental,
+        per_host_concurrency=args.per_host_concurrency,
+        pool_size=args.pool_size,
+        retry_rounds=args.retry_rounds,
+        parser=args.parser,
+        extract_workers=args.extract_workers,
+        queue_size=args.queue_size,
+        store=args.store,
+        site_seeds=(args.seed or [args.base_url]) if args.site else None,
+        max_depth=args.max_depth,
+        include_patterns=args.include,
+        exclude_patterns=args.exclude,
+        index_patterns=args.index_pattern,
+        exclude_title_patterns=args.exclude_title or ([] if args.no_default_excludes else None),
+        visited_capacity=args.visited_capacity,
+        dedup_threshold=args.dedup_threshold
+    )
+    crawler.crawl_all(concurrent=args.concurrent, resume=args.resume)
 
 if __name__ == "__main__":
     main()
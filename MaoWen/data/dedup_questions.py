@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+问题去重
+问题生成以 temperature=1 采样，切块重叠和多次续跑都会产生换个说法的重复问题，
+每个重复问题都要多花一次带全文的答案请求，还会重复出现在训练数据里。
+这个脚本放在 gen_question.py 和 gen_answer.py 之间，按出现顺序保留每组近似重复问题中的第一个：
+1. 同一篇文章内：去掉书名号中的篇名后，用字符 2-gram 的 MinHash-LSH 比较；
+   加 --embedding-threshold 时再用哈希字符 n-gram 向量的余弦相似度比较，能识别改写过的问题
+2. 所有文章之间：保留篇名，用 MinHash-LSH 比较，去掉不同文章中篇名相同、内容几乎相同的问题
+最后报告省下的答案请求数。
+
+用法:
+    python dedup_questions.py --input data/qa_dataset.jsonl --output data/qa_dataset_dedup.jsonl
+    python gen_answer.py --questions-file data/qa_dataset_dedup.jsonl
+"""
+
+import argparse
+import math
+import re
+import zlib
+from array import array
+from pathlib import Path
+
+from corpus_store import CorpusStore
+from jsonl_io import (JsonlWriter, add_writer_arguments, existing_shards, iter_jsonl_shards, reset_output,
+                      writer_options_from_args)
+from llm_engine import estimate_tokens
+from near_dup import NOISE_RE, LSHIndex, text_signature
+
+# 书名号中的篇名：同一篇文章的问题都带着相同的篇名，比较前去掉，避免相似度被抬高
+TITLE_RE = re.compile(r'《[^》]*》')
+SHINGLE_SIZE = 2
+NUM_PERM = 64
+EMBEDDING_BUCKETS = 1 << 16
+# (n-gram 长度, 权重)
+EMBEDDING_NGRAMS = ((1, 0.5), (2, 1.0))
+
+
+def hashed_embedding(text):
+    """字符 1-gram 和 2-gram 哈希到固定维度的稀疏向量（桶号 -> 权重），已归一化"""
+    text = NOISE_RE.sub('', text.lower())
+    vector = {}
+    for n, weight in EMBEDDING_NGRAMS:
+        for i in range(len(text) - n + 1):
+            bucket = zlib.crc32(text[i:i + n].encode('utf-8')) % EMBEDDING_BUCKETS
+            vector[bucket] = vector.get(bucket, 0.0) + weight
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    return {bucket: value / norm for bucket, value in vector.items()} if norm else {}
+
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(bucket, 0.0) for bucket, value in a.items())
+
+
+def compact_signature(text):
+    """MinHash 签名存成 64 位无符号整数数组，内存只有列表的几分之一"""
+    signature = text_signature(text, n=SHINGLE_SIZE, num_perm=NUM_PERM)
+    return array('Q', signature) if signature is not None else None
+
+
+class QuestionDeduper:
+    """
+    逐个检查问题，返回重复信息或 None。阈值为 0 表示不做这一项比较。
+    可以在脚本里一次处理整个问题文件，也可以在融合流水线里边生成边检查
+    """
+
+    def __init__(self, article_threshold=0.6, global_threshold=0.8, embedding_threshold=0.0):
+        self.article_threshold = article_threshold
+        self.global_threshold = global_threshold
+        self.embedding_threshold = embedding_threshold
+        # 文章名 -> (LSH 索引, [(问题序号, 向量)])
+        self.articles = {}
+        self.global_index = LSHIndex(global_threshold, NUM_PERM) if global_threshold > 0 else None
+        self.kept_questions = []
+        self.kept_titles = []
+        self.stats = {'seen': 0, 'kept': 0, 'article': 0, 'embedding': 0, 'global': 0}
+
+    def check(self, item):
+        """
+        检查一个问题记录；不重复时记住它并返回 None，
+        重复时返回 {'duplicate_of', 'duplicate_similarity', 'duplicate_scope'}
+        """
+        self.stats['seen'] += 1
+        question = item['q']
+        article = self.articles.get(item['source_article'])
+        if article is None:
+            article = self.articles[item['source_article']] = (LSHIndex(self.article_threshold or 1.0, NUM_PERM), [])
+        index, embedded = article
+
+        stripped = TITLE_RE.sub('', question)
+        local_signature = compact_signature(stripped) if self.article_threshold > 0 else None
+        if local_signature is not None:
+            matches = index.query(local_signature)
+            if matches:
+                return self._duplicate('article', *matches[0])
+
+        vector = hashed_embedding(stripped) if self.embedding_threshold > 0 else None
+        if vector:
+            best = max(((cosine(vector, other), key) for key, other in embedded), default=None)
+            if best is not None and best[0] >= self.embedding_threshold:
+                return self._duplicate('embedding', best[1], best[0])
+
+        titles = tuple(TITLE_RE.findall(question))
+        global_signature = compact_signature(question) if self.global_index is not None else None
+        if global_signature is not None:
+            # 同一个句式问的是不同篇目时不算重复，所以还要求篇名相同
+            matches = [match for match in self.global_index.query(global_signature)
+                       if self.kept_titles[match[0]] == titles]
+            if matches:
+                return self._duplicate('global', *matches[0])
+
+        key = len(self.kept_questions)
+        self.kept_questions.append(question)
+        self.kept_titles.append(titles)
+        if local_signature is not None:
+            index.insert(key, local_signature)
+        if vector:
+            embedded.append((key, vector))
+        if global_signature is not None:
+            self.global_index.insert(key, global_signature)
+        self.stats['kept'] += 1
+        return None
+
+    def seed(self, item):
+        """记住一个已经回答过的问题（续跑时使用），不计入统计"""
+        stats = dict(self.stats)
+        self.check(item)
+        self.stats = stats
+
+    def _duplicate(self, scope, key, similarity):
+        self.stats[scope] += 1
+        return {
+            'duplicate_of': self.kept_questions[key],
+            'duplicate_similarity': round(similarity, 3),
+            'duplicate_scope': scope
+        }
+
+    @property
+    def dropped(self):
+        return self.stats['seen'] - self.stats['kept']
+
+    def summary(self):
+        stats = self.stats
+        return (f"检查 {stats['seen']} 个问题，保留 {stats['kept']} 个，去掉 {self.dropped} 个"
+                f"（文章内 {stats['article']}，改写 {stats['embedding']}，跨文章 {stats['global']}）")
+
+
+def saved_answer_calls(total_counts, kept_counts, batch_size=1):
+    """按每批 batch_size 个问题一次请求计算，每篇文章省下的答案请求数"""
+    return {
+        article: math.ceil(total / batch_size) - math.ceil(kept_counts.get(article, 0) / batch_size)
+        for article, total in total_counts.items()
+    }
+
+
+def article_prompt_tokens(output_dir, names):
+    """估计各篇文章全文的 token 数，文章不存在时跳过"""
+    output_dir = Path(output_dir)
+    if not output_dir.exists():
+        return {}
+    corpus = CorpusStore(output_dir) if CorpusStore.exists(output_dir) else None
+    tokens = {}
+    for name in names:
+        if corpus:
+            content = corpus.get_content(name)
+        else:
+            content_file = output_dir / name / "content.txt"
+            content = content_file.read_text(encoding='utf-8') if content_file.exists() else None
+        if content is not None:
+            tokens[name] = estimate_tokens(content)
+    return tokens
+
+
+def add_dedup_arguments(parser):
+    """给命令行加上去重阈值的参数，融合流水线也用这一组参数"""
+    parser.add_argument("--article-threshold", type=float, default=0.6,
+                        help="同一篇文章内 MinHash 相似度阈值（去掉篇名后），0 表示不比较")
+    parser.add_argument("--global-threshold", type=float, default=0.8,
+                        help="跨文章 MinHash 相似度阈值，0 表示不比较")
+    parser.add_argument("--embedding-threshold", type=float, default=0.0,
+                        help="同一篇文章内哈希 n-gram 向量的余弦相似度阈值（建议 0.5 左右），0 表示不使用")
+
+
+def dedup_options_from_args(args):
+    return {
+        'article_threshold': args.article_threshold,
+        'global_threshold': args.global_threshold,
+        'embedding_threshold': args.embedding_threshold
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="去掉问题数据集中的近似重复问题")
+    parser.add_argument("--input", default="data/qa_dataset.jsonl", help="问题文件（含分片）")
+    parser.add_argument("--output", default="data/qa_dataset_dedup.jsonl", help="去重后的问题文件")
+    parser.add_argument("--dropped-file", default=None, help="把去掉的问题及其重复对象写到这个文件")
+    parser.add_argument("--output-dir", default="data/output", help="文章目录，用来估计省下的输入 token")
+    parser.add_argument("--batch-size", type=int, default=1, help="答案生成每批合并回答的问题数，用来计算省下的请求数")
+    add_dedup_arguments(parser)
+    add_writer_arguments(parser)
+    args = parser.parse_args()
+
+    if not existing_shards(args.input):
+        print(f"问题文件 {args.input} 不存在")
+        return
+    if Path(args.output).resolve() == Path(args.input).resolve():
+        print("输出文件不能与输入文件相同")
+        return
+
+    deduper = QuestionDeduper(**dedup_options_from_args(args))
+    writer_options = writer_options_from_args(args)
+    reset_output(args.output)
+    writer = JsonlWriter(args.output, **writer_options)
+    dropped_writer = None
+    if args.dropped_file:
+        reset_output(args.dropped_file)
+        dropped_writer = JsonlWriter(args.dropped_file, **writer_options)
+    total_counts = {}
+    kept_counts = {}
+    try:
+        for item in iter_jsonl_shards(args.input):
+            article = item['source_article']
+            total_counts[article] = total_counts.get(article, 0) + 1
+            duplicate = deduper.check(item)
+            if duplicate is None:
+                kept_counts[article] = kept_counts.get(article, 0) + 1
+                writer.write([item])
+            elif dropped_writer is not None:
+                dropped_writer.write([{**item, **duplicate}])
+    finally:
+        writer.close()
+        if dropped_writer is not None:
+            dropped_writer.close()
+
+    print(f"🧹 {deduper.summary()}")
+    saved = saved_answer_calls(total_counts, kept_counts, max(args.batch_size, 1))
+    saved_calls = sum(saved.values())
+    print(f"💰 省下 {saved_calls} 次答案请求（共 {sum(total_counts.values())} 个问题，每批 {args.batch_size} 个）")
+    tokens = article_prompt_tokens(args.output_dir, [name for name, calls in saved.items() if calls])
+    if tokens:
+        saved_tokens = sum(saved[name] * count for name, count in tokens.items())
+        print(f"💰 按全文提示估计，约省下 {saved_tokens} 个输入 token")
+    print(f"💾 结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
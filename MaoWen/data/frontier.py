@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全站广度优先爬取的基础组件
+URL 规范化、包含/排除规则，以及用布隆过滤器实现的已访问集合。
+布隆过滤器大小在创建时固定，爬取数万个页面时内存占用不随页面数增长。
+"""
+
+import hashlib
+import math
+import posixpath
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# 默认把以 index.htm 结尾或以 / 结尾的页面当作索引页，继续展开其中的链接
+DEFAULT_INDEX_PATTERNS = [r'/index\.html?$', r'/$']
+# 默认只下载 .htm/.html 文章页
+DEFAULT_ARTICLE_PATTERNS = [r'\.html?$']
+# 标题匹配这些规则的链接属于第五卷之后的内容；只是单索引页模式的默认值，UrlRules 本身默认不排除任何标题
+DEFAULT_EXCLUDE_TITLE_PATTERNS = [r'思想万岁', r'19(49|5[0-7])年']
+
+
+def normalize_url(url):
+    """规范化 URL：小写协议和主机、去掉默认端口和片段、解析 ./..、排序查询参数"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    port = parts.port
+    netloc = host if port is None or DEFAULT_PORTS.get(scheme) == port else f"{host}:{port}"
+    path = parts.path or '/'
+    trailing_slash = path.endswith('/')
+    path = posixpath.normpath(path)
+    if path.startswith('//'):
+        path = '/' + path.lstrip('/')
+    if trailing_slash and path != '/':
+        path += '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+class BloomFilter:
+    """固定大小的布隆过滤器，capacity 个元素时误判率约为 error_rate"""
+
+    def __init__(self, capacity=1_000_000, error_rate=1e-4):
+        self.num_bits = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.num_hashes = max(int(round(self.num_bits / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # 双重哈希：用一次 blake2b 得到两个 64 位哈希，组合出 k 个位置
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def add(self, item):
+        """加入元素，返回它之前是否（可能）已经存在"""
+        existed = True
+        for pos in self._positions(item):
+            mask = 1 << (pos & 7)
+            if not self.bits[pos >> 3] & mask:
+                existed = False
+                self.bits[pos >> 3] |= mask
+        if not existed:
+            self.count += 1
+        return existed
+
+    @property
+    def size_bytes(self):
+        return len(self.bits)
+
+
+class UrlRules:
+    """决定一个链接是否抓取、是作为索引页展开还是作为文章下载"""
+
+    def __init__(self, include_patterns=None, exclude_patterns=None, index_patterns=None,
+                 article_patterns=None, exclude_title_patterns=None):
+        self.include = [re.compile(p) for p in include_patterns or []]
+        self.exclude = [re.compile(p) for p in exclude_patterns or []]
+        self.index = [re.compile(p) for p in (DEFAULT_INDEX_PATTERNS if index_patterns is None else index_patterns)]
+        self.article = [re.compile(p) for p in (DEFAULT_ARTICLE_PATTERNS if article_patterns is None else article_patterns)]
+        self.exclude_title = [re.compile(p) for p in exclude_title_patterns or []]
+
+    def allowed(self, url):
+        if self.include and not any(p.search(url) for p in self.include):
+            return False
+        return not any(p.search(url) for p in self.exclude)
+
+    def is_index(self, url):
+        return any(p.search(url) for p in self.index)
+
+    def is_article(self, url):
+        return any(p.search(url) for p in self.article)
+
+    def title_allowed(self, title):
+        return not any(p.search(title) for p in self.exclude_title)
+
+
+def subtree_pattern(seed_url):
+    """以种子页所在目录为根的子树规则"""
+    parts = urlsplit(normalize_url(seed_url))
+    directory = parts.path.rsplit('/', 1)[0] + '/'
+    return '^' + re.escape(urlunsplit((parts.scheme, parts.netloc, directory, '', '')))
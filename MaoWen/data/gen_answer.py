@@ -1,74 +1,147 @@
-import os
+import argparse
+import asyncio
+import hashlib
 import json
-import random
+import re
+from collections import OrderedDict
 from pathlib import Path
-import openai
 from datetime import datetime
-import time
-import re
-from dotenv import load_dotenv
-import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from article_extractor import content_body
+from corpus_store import CorpusStore
+from jsonl_io import (JsonlWriter, add_writer_arguments, existing_shards, iter_jsonl_shards, repair_tail,
+                      reset_output, writer_options_from_args)
+from llm_cache import DEFAULT_CACHE_FILE, DEFAULT_MAX_BYTES, LLMCache, add_cache_arguments, cache_options_from_args
+from llm_engine import LLMEngine, add_engine_arguments, engine_options_from_args, estimate_tokens
+from retrieval import PassageIndex
 
 class AnswerGenerator:
+    # 进度行和指标文件中这个阶段的名字
+    progress_stage = "答案"
+    
     def __init__(self, 
                  questions_file="data/qa_dataset.jsonl", 
                  output_dir="data/output", 
                  output_file="data/qa_with_answers.jsonl", 
-                 max_workers=4):
+                 max_concurrency=64,
+                 engine=None,
+                 cache_file=DEFAULT_CACHE_FILE,
+                 resample=False,
+                 cache_max_bytes=DEFAULT_MAX_BYTES,
+                 resume=False,
+                 batch_size=1,
+                 context_tokens=0,
+                 top_k=8,
+                 max_in_flight=None,
+                 max_open_batches=1024,
+                 writer_options=None,
+                 engine_options=None):
         self.questions_file = Path(questions_file)
         self.output_dir = Path(output_dir)
         self.output_file = Path(output_file)
-        self.client = None
-        self.file_lock = threading.Lock()
         self.total_qa_count = 0
         self.train_count = 0
         self.eval_count = 0
-        self.max_workers = max_workers
         self.processed_count = 0
-        self.progress_lock = threading.Lock()
-        self.setup_openai()
-        
-    def setup_openai(self):
-        load_dotenv()
-        
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            print("请在.env文件中设置OPENAI_API_KEY，或设置环境变量")
-            return
-
-        base_url = os.getenv("OPENAI_BASE_URL")
-        
-        try:
-            client_params = {"api_key": api_key}
-            if base_url:
-                client_params["base_url"] = base_url
-                
-            self.client = openai.OpenAI(**client_params)
-            print("✓ OpenAI客户端初始化成功")
-            
-        except Exception as e:
-            print(f"✗ OpenAI客户端初始化失败: {e}")
-            self.client = None
+        # 续跑时保留已有输出，只回答还没有答案的问题
+        self.resume = resume
+        # 大于 1 时把同一篇文章的问题按批合并到一次请求中回答，文章全文只发送一次
+        self.batch_size = batch_size
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        # 大于 0 时只把文章中与问题最相关的段落（不超过这么多 token）放进提示
+        self.context_tokens = context_tokens
+        self.top_k = top_k
+        self.passage_index = None
+        # 同时处理的问题（分批时为批次）数上限，默认等于引擎的并发上限
+        self.max_in_flight = max_in_flight
+        # 分批时最多暂存这么多个没凑满的批次，见 iter_work
+        self.max_open_batches = max_open_batches
+        # 输出由单独的写线程批量写入，writer_options 传给 JsonlWriter（刷新间隔、fsync 策略、分片数等）
+        self.writer_options = writer_options or {}
+        self.writer = None
+        # 输出目录中有打包语料时优先从中读取文章
+        self.corpus = CorpusStore(self.output_dir) if CorpusStore.exists(self.output_dir) else None
+        # 可以传入共享的引擎，与问题生成共用同一个连接池和并发上限；
+        # cache_file 为 None 时不使用缓存，resample 为真时忽略已缓存的结果重新采样，cache_max_bytes 为缓存大小上限；
+        # engine_options 传给 LLMEngine（自适应并发、RPM/TPM 限额、重试次数等）
+        self.engine_options = engine_options or {}
+        if engine is None:
+            cache = LLMCache(cache_file, max_bytes=cache_max_bytes, bypass=resample) if cache_file else None
+            engine = LLMEngine(max_concurrency=max_concurrency, cache=cache, **self.engine_options)
+        self.engine = engine
     
-    def load_questions(self):
-        """加载问题数据集"""
-        questions = []
-        try:
-            with open(self.questions_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        question_data = json.loads(line)
-                        questions.append(question_data)
-            print(f"✓ 成功加载 {len(questions)} 个问题")
-            return questions
-        except Exception as e:
-            print(f"❌ 加载问题文件失败: {e}")
-            return []
+    def iter_pending_questions(self, completed):
+        """逐行读取问题文件，跳过已经有答案的问题，不把整个文件读进内存"""
+        for item in iter_jsonl_shards(self.questions_file):
+            if self.question_key(item) not in completed:
+                yield item
+    
+    @staticmethod
+    def question_key(item):
+        """问题的定长摘要，续跑时已完成集合的内存占用与问题长度无关"""
+        raw = f"{item['source_article']}\0{item['q']}".encode('utf-8')
+        return hashlib.blake2b(raw, digest_size=8).digest()
+    
+    def load_completed(self):
+        """读取已有输出并恢复计数，返回已经有答案的问题键 (文章名, 问题)"""
+        for shard in existing_shards(self.output_file):
+            dropped = repair_tail(shard)
+            if dropped:
+                print(f"✂️ 截掉 {shard.name} 末尾不完整的 {dropped} 字节")
+        completed = set()
+        for item in iter_jsonl_shards(self.output_file):
+            completed.add(self.question_key(item))
+            self.total_qa_count += 1
+            if item.get('dataset_split') == 'trainset':
+                self.train_count += 1
+            else:
+                self.eval_count += 1
+        return completed
+    
+    def list_articles(self):
+        """返回语料中的所有文章名"""
+        if self.corpus:
+            return self.corpus.keys()
+        return sorted(d.name for d in self.output_dir.iterdir() if (d / "content.txt").exists())
+    
+    def build_passage_index(self):
+        """在整个语料上建立段落索引，每次运行只建一次"""
+        index = PassageIndex()
+        for name in self.list_articles():
+            content = self.load_article_content(name)
+            if content:
+                index.add_article(name, content)
+        print(f"🔎 段落索引: {len(index.article_postings)} 篇文章，{len(index)} 段")
+        self.passage_index = index
+    
+    @staticmethod
+    def chunk_key(question_data):
+        """问题所在块的正文区间，问题不是按块生成时为 None"""
+        chunk = question_data.get('chunk')
+        return tuple(chunk['span']) if chunk else None
+    
+    def article_context(self, article_name, content, query, chunk_span=None):
+        """
+        返回放进提示的文章内容：问题按块生成时只用那一块；
+        文章不超过预算时用全文，否则用检索出的相关段落
+        """
+        if chunk_span:
+            start, end = chunk_span
+            return content_body(content)[start:end]
+        if not self.passage_index or article_name not in self.passage_index:
+            return content
+        if estimate_tokens(content) <= self.context_tokens:
+            return content
+        return self.passage_index.select_context(article_name, query, self.context_tokens, self.top_k) or content
     
     def load_article_content(self, article_name):
         """根据文章名加载文章内容"""
+        if self.corpus:
+            content = self.corpus.get_content(article_name)
+            if content is None:
+                print(f"❌ 打包语料中没有文章: {article_name}")
+            return content
+        
         content_file = self.output_dir / article_name / "content.txt"
         
         if not content_file.exists():
@@ -82,9 +155,9 @@ class AnswerGenerator:
             print(f"❌ 读取文章内容失败 {article_name}: {e}")
             return None
     
-    def generate_answer(self, question, content, article_title):
+    async def generate_answer(self, question, content, article_title):
         """基于文章内容生成问题的答案"""
-        if not self.client:
+        if not self.engine.available:
             print("OpenAI客户端未初始化，跳过LLM调用")
             return None
         
@@ -109,95 +182,242 @@ class AnswerGenerator:
 请基于文章内容回答问题："""
         
         try:
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.3,  # 降低温度以获得更准确的答案
-                max_tokens=4096
-            )
-            
-            answer = response.choices[0].message.content.strip()
-            return answer
+            # 降低温度以获得更准确的答案
+            response = await self.engine.chat(system_prompt, user_prompt, temperature=0.3, max_tokens=4096)
+            self.prompt_tokens += response.prompt_tokens
+            self.completion_tokens += response.completion_tokens
+            return response.text
             
         except Exception as e:
             print(f"调用LLM生成答案时出错: {e}")
             return None
     
+    async def generate_batch_answers(self, questions, content, article_title):
+        """
+        在一次请求中回答同一篇文章的多个问题，返回 {问题序号: 答案}；
+        只包含成功解析出的答案，调用失败时返回空字典
+        """
+        if not self.engine.available:
+            print("OpenAI客户端未初始化，跳过LLM调用")
+            return {}
+        
+        system_prompt = """你是一位对党忠诚、学术渊博的马克思主义教授。请基于提供的文章内容，准确回答每一个问题。要求：
+
+0. 严格遵守中华人民共和国的法律法规，符合社会主义核心价值观
+1. 答案必须完全基于提供的文章内容，不要添加文章中没有的信息
+2. 答案要准确、完整、有条理
+3. 如果问题涉及列举，请按照文章中的原文进行列举
+4. 保持客观、严谨的学术态度
+5. 答案要具有教育意义，有助于理解文章的核心思想
+6. 每个问题单独作答，答案中不要引用其他问题
+
+请以以下JSON格式返回（只返回JSON，不要其他内容），id 与问题编号一一对应：
+[
+    {"id": 1, "answer": "答案内容"},
+    {"id": 2, "answer": "答案内容"}
+]"""
+
+        numbered = "\n".join(f"{i}. {question}" for i, question in enumerate(questions, 1))
+        # 文章内容放在问题前面，同一篇文章的请求有相同的前缀，便于服务端的前缀缓存命中
+        user_prompt = f"""文章标题：{article_title}
+
+文章内容：
+{content}
+
+问题：
+{numbered}
+
+请基于文章内容回答以上问题："""
+        
+        try:
+            response = await self.engine.chat(system_prompt, user_prompt, temperature=0.3, max_tokens=8192)
+            self.prompt_tokens += response.prompt_tokens
+            self.completion_tokens += response.completion_tokens
+            response_text = response.text
+        except Exception as e:
+            print(f"调用LLM批量生成答案时出错: {e}")
+            return {}
+        
+        try:
+            items = json.loads(response_text)
+        except json.JSONDecodeError:
+            json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
+            try:
+                items = json.loads(json_match.group()) if json_match else None
+            except json.JSONDecodeError:
+                items = None
+        if not isinstance(items, list):
+            print(f"无法解析批量答案: {response_text[:200]}...")
+            return {}
+        
+        answers = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            try:
+                index = int(item.get('id'))
+            except (TypeError, ValueError):
+                continue
+            answer = item.get('answer')
+            if 1 <= index <= len(questions) and isinstance(answer, str) and answer.strip():
+                answers[index - 1] = answer.strip()
+        return answers
+    
     def write_qa_to_file(self, qa_data_list):
         """将问答对写入文件"""
-        with self.file_lock:
-            with open(self.output_file, 'a', encoding='utf-8') as f:
-                for item in qa_data_list:
-                    f.write(json.dumps(item, ensure_ascii=False) + '\n')
+        # 所有协程都在同一个事件循环线程里，更新计数不需要加锁；记录交给写线程，不等待写入
+        self.writer.write(qa_data_list)
+        
+        self.total_qa_count += len(qa_data_list)
+        train_new = sum(1 for item in qa_data_list if item['dataset_split'] == 'trainset')
+        eval_new = len(qa_data_list) - train_new
+        self.train_count += train_new
+        self.eval_count += eval_new
+        self.engine.metrics.advance(self.progress_stage, items=len(qa_data_list))
+    
+    def update_progress(self, count=1):
+        """记下处理完 count 个问题，进度行由 engine.metrics 按间隔打印"""
+        self.processed_count += count
+        self.engine.metrics.advance(self.progress_stage, done=count)
+    
+    @staticmethod
+    def build_qa_item(question_data, answer):
+        """构造完整的问答对"""
+        return {
+            'q': question_data['q'],
+            'a': answer,
+            'source_article': question_data['source_article'],
+            'dataset_split': question_data['dataset_split'],
+            'question_generated_time': question_data.get('generated_time'),
+            'answer_generated_time': datetime.now().isoformat()
+        }
+    
+    async def process_question_batch(self, batch):
+        """一次请求回答同一篇文章的一批问题，没有得到答案的问题退回逐个回答"""
+        source_article = batch[0]['source_article']
+        # 已经记入进度的问题数，出错时把其余的问题补上
+        counted = 0
+        try:
+            content = self.load_article_content(source_article)
+            if not content:
+                print(f"❌ 无法加载文章内容: {source_article}")
+                self.update_progress(len(batch))
+                return
             
-            self.total_qa_count += len(qa_data_list)
-            train_new = sum(1 for item in qa_data_list if item['dataset_split'] == 'trainset')
-            eval_new = len(qa_data_list) - train_new
-            self.train_count += train_new
-            self.eval_count += eval_new
+            questions = [item['q'] for item in batch]
+            # 一批问题共用一份节选，用所有问题一起检索
+            context = self.article_context(source_article, content, "\n".join(questions), self.chunk_key(batch[0]))
+            answers = await self.generate_batch_answers(questions, context, source_article)
+            results = [self.build_qa_item(item, answers[i]) for i, item in enumerate(batch) if i in answers]
+            if results:
+                self.write_qa_to_file(results)
+                self.update_progress(len(results))
+                counted = len(results)
             
-            print(f"✓ 已写入 {len(qa_data_list)} 个问答对到文件")
-            print(f"  当前总计: {self.total_qa_count} 个问答对 (训练集: {self.train_count}, 验证集: {self.eval_count})")
-    
-    def update_progress(self, total_questions):
-        """更新并显示进度"""
-        with self.progress_lock:
-            self.processed_count += 1
-            progress = self.processed_count / total_questions * 100
-            print(f"📊 进度: {self.processed_count}/{total_questions} ({progress:.1f}%)")
+            missing = [item for i, item in enumerate(batch) if i not in answers]
+            if missing:
+                print(f"↩️ {source_article} 有 {len(missing)} 个问题没有得到批量答案，改为逐个回答")
+                # 逐个回答时每个问题自己记进度
+                counted = len(batch)
+                await asyncio.gather(*(self.process_single_question(item) for item in missing))
+        
+        except Exception as e:
+            print(f"❌ 批量处理问题时出错: {e}")
+            self.update_progress(len(batch) - counted)
     
-    def process_single_question(self, question_data, total_questions=None):
+    async def process_single_question(self, question_data):
         """处理单个问题，生成答案"""
         try:
             question = question_data['q']
             source_article = question_data['source_article']
             
-            print(f"📖 处理问题: {question[:50]}...")
-            
             # 加载对应的文章内容
             content = self.load_article_content(source_article)
             if not content:
                 print(f"❌ 无法加载文章内容: {source_article}")
-                if total_questions:
-                    self.update_progress(total_questions)
+                self.update_progress()
                 return
             
             # 生成答案
-            answer = self.generate_answer(question, content, source_article)
+            context = self.article_context(source_article, content, question, self.chunk_key(question_data))
+            answer = await self.generate_answer(question, context, source_article)
             if not answer:
-                print(f"❌ 未能为问题生成答案")
-                if total_questions:
-                    self.update_progress(total_questions)
+                print(f"❌ 未能为问题生成答案: {question[:50]}...")
+                self.update_progress()
                 return
             
-            # 构造完整的问答对
-            qa_item = {
-                'q': question,
-                'a': answer,
-                'source_article': source_article,
-                'dataset_split': question_data['dataset_split'],
-                'question_generated_time': question_data.get('generated_time'),
-                'answer_generated_time': datetime.now().isoformat()
-            }
-            
             # 写入文件
-            self.write_qa_to_file([qa_item])
-            print(f"✅ 成功生成答案")
-            
-            if total_questions:
-                self.update_progress(total_questions)
+            self.write_qa_to_file([self.build_qa_item(question_data, answer)])
+            self.update_progress()
             
         except Exception as e:
             print(f"❌ 处理问题时出错: {e}")
-            if total_questions:
-                self.update_progress(total_questions)
+            self.update_progress()
     
-    def run(self):
+    def prepare_output(self):
+        """创建输出文件并启动写线程，续跑时返回已经有答案的问题键"""
+        if self.resume and existing_shards(self.output_file):
+            completed = self.load_completed()
+        else:
+            reset_output(self.output_file)
+            completed = set()
+        self.writer = JsonlWriter(self.output_file, **self.writer_options)
+        return completed
+    
+    def close_output(self):
+        """等写线程写完剩余的记录"""
+        if self.writer is not None:
+            self.writer.close()
+            print(f"💾 写线程共 {self.writer.flushes} 次写入 {self.writer.written} 个问答对")
+            self.writer = None
+    
+    def make_tasks(self, questions):
+        """为一组问题生成待执行的协程，与 run_async 一样用 iter_work 切分工作单元"""
+        return [self.process_work(unit) for unit in self.iter_work(questions)]
+    
+    def iter_work(self, questions):
+        """
+        把问题流切成工作单元：逐个回答时每个问题一个单元；分批时把同一篇文章（按块生成的问题则是同一块）
+        的问题每 batch_size 个合成一批，不要求这些问题在文件中相邻。
+        没凑满的批次按文章暂存，最多暂存 max_open_batches 个，超过时先交出最早开始的那个，
+        内存占用不超过 max_open_batches x batch_size 个问题
+        """
+        if self.batch_size <= 1:
+            for question in questions:
+                yield [question]
+            return
+        open_batches = OrderedDict()
+        for item in questions:
+            key = (item['source_article'], self.chunk_key(item))
+            batch = open_batches.setdefault(key, [])
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                del open_batches[key]
+                yield batch
+            elif len(open_batches) > self.max_open_batches:
+                yield open_batches.popitem(last=False)[1]
+        yield from open_batches.values()
+    
+    async def process_work(self, unit):
+        if self.batch_size > 1:
+            await self.process_question_batch(unit)
+        else:
+            await self.process_single_question(unit[0])
+    
+    def start_progress(self, total=None):
+        """开始记录答案阶段的进度，total 为空表示问题陆续到来（融合流水线）"""
+        self.engine.metrics.start_stage(self.progress_stage, total, unit="个问题", item_unit="QA")
+    
+    def print_summary(self):
+        print(f"📊 总共生成 {self.total_qa_count} 个问答对")
+        print(f"📚 训练集: {self.train_count} 个问答对")
+        print(f"🧪 验证集: {self.eval_count} 个问答对")
+        print(f"🔢 输入 {self.prompt_tokens} tokens，输出 {self.completion_tokens} tokens")
+        print(f"💾 结果已保存到: {self.output_file}")
+    
+    async def run_async(self):
         """运行答案生成器"""
-        if not self.questions_file.exists():
+        if not existing_shards(self.questions_file):
             print(f"问题文件 {self.questions_file} 不存在")
             return
         
@@ -205,46 +425,78 @@ class AnswerGenerator:
             print(f"输出目录 {self.output_dir} 不存在")
             return
         
-        # 加载问题
-        questions = self.load_questions()
-        if not questions:
+        # 创建输出文件，续跑时跳过已经有答案的问题
+        completed = self.prepare_output()
+        
+        # 先流式数一遍剩余的问题，用于显示进度
+        remaining = sum(1 for _ in self.iter_pending_questions(completed))
+        if not remaining and not completed:
             print("没有找到有效的问题数据")
             return
         
-        # 创建输出文件
-        self.output_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.output_file, 'w', encoding='utf-8') as f:
-            pass  # 清空文件
+        if self.context_tokens > 0:
+            self.build_passage_index()
         
-        print(f"🚀 开始并行生成答案，找到 {len(questions)} 个问题")
-        print(f"🔧 使用 {self.max_workers} 个并发线程")
+        max_in_flight = self.max_in_flight or self.engine.max_concurrency
+        print(f"🚀 开始并行生成答案，找到 {remaining + len(completed)} 个问题")
+        if completed:
+            print(f"⏩ 续跑：已完成 {len(completed)} 个问题，剩余 {remaining} 个")
+        print(f"🔧 最多 {self.engine.max_concurrency} 个并发请求，同时处理 {max_in_flight} 个{'批次' if self.batch_size > 1 else '问题'}")
         print(f"📁 输出文件: {self.output_file}")
+        self.start_progress(remaining)
         
-        # 使用线程池并行处理
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # 提交所有任务
-            future_to_question = {
-                executor.submit(self.process_single_question, question, len(questions)): question 
-                for question in questions
-            }
-            
-            # 等待所有任务完成
-            for future in as_completed(future_to_question):
-                question = future_to_question[future]
+        # 固定数量的协程依次从问题流中取下一个工作单元，完成一个才读入下一个，内存占用与问题总数无关
+        units = self.iter_work(self.iter_pending_questions(completed))
+        
+        async def worker():
+            for unit in units:
                 try:
-                    future.result()  # 获取结果，如果有异常会抛出
+                    await self.process_work(unit)
                 except Exception as exc:
                     print(f"❌ 问题处理时发生异常: {exc}")
         
+        try:
+            await asyncio.gather(*(worker() for _ in range(max_in_flight)))
+        finally:
+            self.close_output()
+        
         print(f"\n🎉 并行处理完成！")
-        print(f"📊 总共生成 {self.total_qa_count} 个问答对")
-        print(f"📚 训练集: {self.train_count} 个问答对")
-        print(f"🧪 验证集: {self.eval_count} 个问答对")
-        print(f"💾 结果已保存到: {self.output_file}")
+        self.print_summary()
+    
+    def run(self):
+        async def main():
+            try:
+                await self.run_async()
+            finally:
+                await self.engine.close()
+        asyncio.run(main())
 
 def main():    
+    parser = argparse.ArgumentParser(description="为问题数据集生成答案")
+    parser.add_argument("--questions-file", default="data/qa_dataset.jsonl", help="问题文件，可以是 dedup_questions.py 去重后的文件")
+    parser.add_argument("--resume", action="store_true", help="保留已有输出，只回答还没有答案的问题")
+    parser.add_argument("--batch-size", type=int, default=1, help="同一篇文章的问题每批合并回答的数量，1 表示逐个回答")
+    parser.add_argument("--context-tokens", type=int, default=0, help="只发送与问题相关的段落，最多这么多 token，0 表示发送全文")
+    parser.add_argument("--top-k", type=int, default=8, help="最多选取的相关段落数")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="同时处理的问题（分批时为批次）数，默认等于并发请求数")
+    add_writer_arguments(parser)
+    add_engine_arguments(parser)
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+    
     print("🎯 开始生成答案数据集...")
-    generator = AnswerGenerator(max_workers=32)
+    generator = AnswerGenerator(
+        questions_file=args.questions_file,
+        max_concurrency=256,
+        resume=args.resume,
+        batch_size=args.batch_size,
+        context_tokens=args.context_tokens,
+        top_k=args.top_k,
+        max_in_flight=args.max_in_flight,
+        writer_options=writer_options_from_args(args),
+        engine_options=engine_options_from_args(args),
+        **cache_options_from_args(args)
+    )
     generator.run()
     print("✨ 完成！")
 
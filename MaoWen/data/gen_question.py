@@ -1,53 +1,70 @@
-import os
+import argparse
+import asyncio
 import json
 import random
 from pathlib import Path
-import openai
 from datetime import datetime
-import time
-import re
-from dotenv import load_dotenv
-import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from article_extractor import content_body
+from chunking import chunk_text
+from corpus_store import CorpusStore
+from json_stream import JsonArrayStream, parse_json_array
+from jsonl_io import (JsonlWriter, add_writer_arguments, existing_shards, iter_jsonl_shards, repair_tail,
+                      reset_output, writer_options_from_args)
+from llm_cache import DEFAULT_CACHE_FILE, DEFAULT_MAX_BYTES, LLMCache, add_cache_arguments, cache_options_from_args
+from llm_engine import LLMEngine, add_engine_arguments, engine_options_from_args, estimate_tokens
+from near_dup import LSHIndex, text_signature
 
 class QAGenerator:
-    def __init__(self, output_dir="data/output", output_file="data/qa_dataset.jsonl", max_workers=4):
+    # 进度行和指标文件中这个阶段的名字
+    progress_stage = "问题"
+    
+    def __init__(self, output_dir="data/output", output_file="data/qa_dataset.jsonl", max_concurrency=64,
+                 skip_duplicates=True, engine=None, cache_file=DEFAULT_CACHE_FILE, resample=False,
+                 cache_max_bytes=DEFAULT_MAX_BYTES,
+                 resume=False, chunk_tokens=0, chunk_overlap=200, writer_options=None,
+                 engine_options=None, stream=False):
         self.output_dir = Path(output_dir)
         self.output_file = Path(output_file)
-        self.client = None
-        self.file_lock = threading.Lock()
         self.total_qa_count = 0
         self.train_count = 0
         self.eval_count = 0
-        self.max_workers = max_workers  # 并发处理的最大线程数
         self.processed_count = 0
-        self.progress_lock = threading.Lock()
-        self.setup_openai()
-        
-    def setup_openai(self):
-        load_dotenv()
-        
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            print("请在.env文件中设置OPENAI_API_KEY，或设置环境变量")
-            return
-
-        base_url = os.getenv("OPENAI_BASE_URL")
-        
-        try:
-            client_params = {"api_key": api_key}
-            if base_url:
-                client_params["base_url"] = base_url
-                
-            self.client = openai.OpenAI(**client_params)
-            print("✓ OpenAI客户端初始化成功")
-            
-        except Exception as e:
-            print(f"✗ OpenAI客户端初始化失败: {e}")
-            self.client = None
+        # 输出目录中有打包语料时优先从中读取文章
+        self.corpus = CorpusStore(self.output_dir) if CorpusStore.exists(self.output_dir) else None
+        # 跳过爬虫标记为近似重复的文章，避免重复生成问题
+        self.skip_duplicates = skip_duplicates
+        # 续跑时保留已有输出，只处理还没有生成问题的文章
+        self.resume = resume
+        # 大于 0 时把超过这么多 token 的文章切块，各块并发生成问题后合并去重
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        # 流式请求时每个问题一生成完就写入并交给下游，回复被截断或中途断开时也保留已经完整的问题
+        self.stream = stream
+        # 融合流水线中设置为一个有界队列，问题写入文件后立刻放进去：不流式时每篇文章一组，
+        # 流式时同一块的问题每凑够 sink_batch 个一组（流水线设为答案的批大小），文章结束时放进剩下的
+        self.question_sink = None
+        self.sink_batch = 1
+        # 续跑时问题文件中有、但没有记为写完的文章（中途退出时只写了一部分），文章名 -> 已写入的问题
+        self.partial_questions = {}
+        self.done_file = None
+        # 输出由单独的写线程批量写入，writer_options 传给 JsonlWriter（刷新间隔、fsync 策略、分片数等）
+        self.writer_options = writer_options or {}
+        self.writer = None
+        # 可以传入共享的引擎，与答案生成共用同一个连接池和并发上限；
+        # cache_file 为 None 时不使用缓存，resample 为真时忽略已缓存的结果重新采样，cache_max_bytes 为缓存大小上限；
+        # engine_options 传给 LLMEngine（自适应并发、RPM/TPM 限额、重试次数等）
+        self.engine_options = engine_options or {}
+        if engine is None:
+            cache = LLMCache(cache_file, max_bytes=cache_max_bytes, bypass=resample) if cache_file else None
+            engine = LLMEngine(max_concurrency=max_concurrency, cache=cache, **self.engine_options)
+        self.engine = engine
     
-    def generate_qa_pairs(self, content, title):
-        if not self.client:
+    async def generate_qa_pairs(self, content, title, part=None, on_question=None):
+        """
+        为一段文章内容生成问题，返回解析出的问题列表；
+        流式模式下每个问题一闭合就调用 on_question(问题)，不流式时不调用
+        """
+        if not self.engine.available:
             print("OpenAI客户端未初始化，跳过LLM调用")
             return []
         
@@ -66,31 +83,29 @@ class QAGenerator:
     {"question": "问题内容"}
 ]"""
 
+        # part 为 (第几块, 总块数)，切块时告诉模型这只是文章的一部分
+        label = f"文章内容（第{part[0]}/{part[1]}部分）" if part else "文章内容"
         user_prompt = f"""文章标题：{title}
 
-文章内容：
+{label}：
 {content}"""
         
+        if self.stream:
+            return await self.stream_qa_pairs(system_prompt, user_prompt, title, on_question)
+        
         try:
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=1,
-                max_tokens=8192
-            )
-            
-            response_text = response.choices[0].message.content.strip()
+            response = await self.engine.chat(system_prompt, user_prompt, temperature=1, max_tokens=8192)
+            response_text = response.text
             
             try:
                 qa_pairs = json.loads(response_text)
                 return qa_pairs
             except json.JSONDecodeError:
-                json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-                if json_match:
-                    qa_pairs = json.loads(json_match.group())
+                # 数组前后有多余内容或回复被截断时，取出其中所有完整的元素
+                qa_pairs = parse_json_array(response_text)
+                if qa_pairs:
+                    if response.truncated:
+                        print(f"⚠️ {title} 的回复被截断，保留 {len(qa_pairs)} 个完整问题")
                     return qa_pairs
                 else:
                     print(f"无法解析LLM返回的内容: {response_text[:200]}...")
@@ -100,122 +115,367 @@ class QAGenerator:
             print(f"调用LLM时出错: {e}")
             return []
     
+    async def stream_qa_pairs(self, system_prompt, user_prompt, title, on_question=None):
+        """流式请求，边接收边解析 JSON 数组"""
+        parser = JsonArrayStream()
+        qa_pairs = []
+        
+        def on_text(text):
+            for item in parser.feed(text):
+                qa_pairs.append(item)
+                if on_question is not None:
+                    on_question(item)
+        
+        try:
+            response = await self.engine.chat(system_prompt, user_prompt, temperature=1, max_tokens=8192,
+                                              on_text=on_text)
+        except Exception as e:
+            print(f"调用LLM时出错: {e}")
+            if qa_pairs:
+                print(f"⚠️ {title} 的回复中途断开，保留 {len(qa_pairs)} 个完整问题")
+            return qa_pairs
+        if response.truncated or parser.pending:
+            print(f"⚠️ {title} 的回复被截断，保留 {len(qa_pairs)} 个完整问题")
+        elif not qa_pairs:
+            print(f"无法解析LLM返回的内容: {response.text[:200]}...")
+        if parser.skipped:
+            print(f"⚠️ {title} 的回复中有 {parser.skipped} 个元素无法解析，已跳过")
+        return qa_pairs
+    
+    async def generate_chunked_questions(self, content, title, on_question=None, known=()):
+        """
+        为文章生成问题，返回 [(问题, 所在块)]；文章超过 chunk_tokens 时各块并发生成，合并时去掉重复或近似重复的问题，
+        不切块时所在块为 None。known 为续跑时这篇文章已经写入的问题，与它们近似重复的新问题也去掉。
+        on_question 不为空时每保留一个问题就调用 on_question(问题, 所在块)，流式模式下问题一闭合就调用
+        """
+        body = content_body(content)
+        if not self.chunk_tokens or estimate_tokens(body) <= self.chunk_tokens:
+            parts = [(content, None, None)]
+        else:
+            chunks = chunk_text(body, self.chunk_tokens, self.chunk_overlap)
+            print(f"✂️ 文章 {title} 切成 {len(chunks)} 块")
+            parts = [(chunk.text, chunk, (chunk.index + 1, len(chunks))) for chunk in chunks]
+        
+        # 只有一块且没有已写入的问题时不必去重
+        accept = self.question_filter() if len(parts) > 1 or known else None
+        for question in known:
+            accept({'question': question})
+        merged = []
+        
+        def emit_for(chunk):
+            def emit(q):
+                if not isinstance(q, dict) or not q.get('question'):
+                    return
+                if accept is not None and not accept(q):
+                    return
+                merged.append((q, chunk))
+                if on_question is not None:
+                    on_question(q, chunk)
+            return emit
+        
+        if self.stream:
+            # 各块的问题交错到达，边到边去重
+            await asyncio.gather(*(
+                self.generate_qa_pairs(text, title, part=part, on_question=emit_for(chunk))
+                for text, chunk, part in parts
+            ))
+        else:
+            results = await asyncio.gather(*(self.generate_qa_pairs(text, title, part=part) for text, _, part in parts))
+            # 按块的顺序合并，重复时保留先出现的
+            for (_, chunk, _), questions in zip(parts, results):
+                emit = emit_for(chunk)
+                for q in questions:
+                    emit(q)
+        return merged
+    
+    @staticmethod
+    def question_filter(threshold=0.8):
+        """返回一个判断函数：问题有效且与之前接受过的问题都不近似重复时返回真，并记住这个问题"""
+        lsh = LSHIndex(threshold)
+        accepted = 0
+        
+        def accept(q):
+            nonlocal accepted
+            if not isinstance(q, dict) or not q.get('question'):
+                return False
+            signature = text_signature(q['question'], n=3)
+            if signature is not None:
+                if lsh.query(signature):
+                    return False
+                lsh.insert(accepted, signature)
+            accepted += 1
+            return True
+        
+        return accept
+    
     def determine_dataset_split(self):
         return "trainset" if random.random() < 0.9 else "evalset"
     
     def write_questions_to_file(self, questions_data):
-        with self.file_lock:
-            with open(self.output_file, 'a', encoding='utf-8') as f:
-                for item in questions_data:
-                    f.write(json.dumps(item, ensure_ascii=False) + '\n')
-            
-            self.total_qa_count += len(questions_data)
-            train_new = sum(1 for item in questions_data if item['dataset_split'] == 'trainset')
-            eval_new = len(questions_data) - train_new
-            self.train_count += train_new
-            self.eval_count += eval_new
-            
-            print(f"✓ 已写入 {len(questions_data)} 个问题到文件")
-            print(f"  当前总计: {self.total_qa_count} 个问题 (训练集: {self.train_count}, 验证集: {self.eval_count})")
+        # 所有协程都在同一个事件循环线程里，更新计数不需要加锁；记录交给写线程，不等待写入
+        self.writer.write(questions_data)
+        
+        self.total_qa_count += len(questions_data)
+        train_new = sum(1 for item in questions_data if item['dataset_split'] == 'trainset')
+        eval_new = len(questions_data) - train_new
+        self.train_count += train_new
+        self.eval_count += eval_new
+        self.engine.metrics.advance(self.progress_stage, items=len(questions_data))
     
-    def update_progress(self, total_articles):
-        """更新并显示进度"""
-        with self.progress_lock:
-            self.processed_count += 1
-            progress = self.processed_count / total_articles * 100
-            print(f"📊 进度: {self.processed_count}/{total_articles} ({progress:.1f}%)")
+    def make_question_item(self, q, chunk, title):
+        item = {
+            'q': q['question'],
+            'source_article': title,
+            'dataset_split': self.determine_dataset_split(),
+            'generated_time': datetime.now().isoformat()
+        }
+        if chunk is not None:
+            # 记录问题来自正文的哪一块，答案生成时只需发送这一块
+            item['chunk'] = {'index': chunk.index, 'span': chunk.span()}
+        return item
     
-    def process_single_article(self, article_dir, total_articles=None):
-        content_file = article_dir / "content.txt"
+    @property
+    def done_path(self):
+        """记录问题已经全部写入的文章名，每行一个"""
+        return self.output_file.with_name(self.output_file.name + '.done')
+    
+    def mark_article_done(self, title):
+        """文章的问题都写入文件后再记下文章名，续跑时据此区分写完的文章和只写了一部分的文章"""
+        def append():
+            self.done_file.write(title + '\n')
+            self.done_file.flush()
+        self.writer.write([], on_written=append)
+    
+    def load_done_articles(self):
+        """读取已经写完的文章名，没有记录文件（旧版本的输出）时返回 None"""
+        if not self.done_path.exists():
+            return None
+        repair_tail(self.done_path)
+        with open(self.done_path, 'r', encoding='utf-8') as f:
+            return {line.rstrip('\n') for line in f if line.strip()}
+    
+    async def stream_article_questions(self, content, title, known=()):
+        """流式生成一篇文章的问题：每个问题一生成完就写入，并按 sink_batch 个一组尽快交给下游，返回写入的问题"""
+        results = []
+        # 块序号 -> 还没凑满的一组；答案按 (文章, 块) 分批，同一组的问题来自同一块
+        open_batches = {}
+        deferred = []
         
-        if not content_file.exists():
-            print(f"跳过 {article_dir.name}：没有找到content.txt")
-            if total_articles:
-                self.update_progress(total_articles)
-            return
+        def on_question(q, chunk):
+            item = self.make_question_item(q, chunk, title)
+            results.append(item)
+            self.write_questions_to_file([item])
+            if self.question_sink is None:
+                return
+            key = None if chunk is None else chunk.index
+            batch = open_batches.setdefault(key, [])
+            batch.append(item)
+            if len(batch) < self.sink_batch:
+                return
+            del open_batches[key]
+            # 回调里不能等待，队列满时先攒着，生成完再放进去
+            if deferred or self.question_sink.full():
+                deferred.append(batch)
+            else:
+                self.question_sink.put_nowait(batch)
         
+        await self.generate_chunked_questions(content, title, on_question, known)
+        for batch in deferred + list(open_batches.values()):
+            await self.question_sink.put(batch)
+        return results
+    
+    def update_progress(self):
+        """记下处理完一篇文章，进度行由 engine.metrics 按间隔打印"""
+        self.processed_count += 1
+        self.engine.metrics.advance(self.progress_stage, done=1)
+    
+    def start_progress(self, total):
+        self.engine.metrics.start_stage(self.progress_stage, total, unit="篇", item_unit="问题")
+    
+    def load_completed(self):
+        """
+        读取已有输出并恢复计数，返回问题已经全部写入的文章名；
+        只写了一部分的文章记在 partial_questions 中，重新生成时跳过与已写入问题近似重复的问题
+        """
+        for shard in existing_shards(self.output_file):
+            dropped = repair_tail(shard)
+            if dropped:
+                print(f"✂️ 截掉 {shard.name} 末尾不完整的 {dropped} 字节")
+        done = self.load_done_articles()
+        completed = set()
+        for item in iter_jsonl_shards(self.output_file):
+            title = item['source_article']
+            if done is None or title in done:
+                completed.add(title)
+            else:
+                self.partial_questions.setdefault(title, []).append(item['q'])
+            self.total_qa_count += 1
+            if item.get('dataset_split') == 'trainset':
+                self.train_count += 1
+            else:
+                self.eval_count += 1
+        return completed
+    
+    def load_duplicates(self):
+        """从文章索引中读取被标记为近似重复的文章名"""
+        index_file = self.output_dir / "articles_index.json"
+        if not index_file.exists():
+            return set()
+        with open(index_file, 'r', encoding='utf-8') as f:
+            articles = json.load(f)
+        return {article['filename'] for article in articles if article.get('duplicate_of')}
+    
+    def list_articles(self):
+        """返回所有文章名（即文章目录名），按序号排列"""
+        if self.corpus:
+            titles = self.corpus.keys()
+        else:
+            titles = sorted(d.name for d in self.output_dir.iterdir() if d.is_dir())
+        if self.skip_duplicates:
+            duplicates = self.load_duplicates()
+            if duplicates:
+                print(f"⏭️ 跳过 {len(duplicates)} 篇近似重复文章")
+                titles = [title for title in titles if title not in duplicates]
+        return titles
+    
+    def load_article(self, title):
+        """读取文章全文，找不到时返回 None"""
+        if self.corpus:
+            return self.corpus.get_content(title)
+        content_file = self.output_dir / title / "content.txt"
+        if not content_file.exists():
+            return None
+        with open(content_file, 'r', encoding='utf-8') as f:
+            return f.read()
+    
+    async def process_single_article(self, title):
         try:
-            with open(content_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            title = article_dir.name
-            print(f"📖 处理文章: {title}")
-            
-            questions = self.generate_qa_pairs(content, title)
-            
-            if not questions:
-                print(f"❌ 未能为文章 {title} 生成问题")
-                if total_articles:
-                    self.update_progress(total_articles)
+            content = self.load_article(title)
+            if content is None:
+                print(f"跳过 {title}：没有找到content.txt")
+                self.update_progress()
                 return
             
-            results = []
-            for q in questions:
-                if 'question' in q:
-                    item = {
-                        'q': q['question'],
-                        'source_article': title,
-                        'dataset_split': self.determine_dataset_split(),
-                        'generated_time': datetime.now().isoformat()
-                    }
-                    results.append(item)
+            known = self.partial_questions.pop(title, ())
+            if self.stream:
+                results = await self.stream_article_questions(content, title, known)
+            else:
+                questions = await self.generate_chunked_questions(content, title, known=known)
+                results = [self.make_question_item(q, chunk, title) for q, chunk in questions]
+                if results:
+                    self.write_questions_to_file(results)
+                    if self.question_sink is not None:
+                        await self.question_sink.put(results)
             
-            if results:
-                self.write_questions_to_file(results)
-                print(f"✅ 成功处理文章 {title}，生成 {len(results)} 个问题")
+            # 续跑时新生成的问题可能都与已写入的重复，这篇文章也算写完
+            if results or known:
+                self.mark_article_done(title)
             else:
-                print(f"❌ 文章 {title} 没有生成有效的问题")
+                print(f"❌ 未能为文章 {title} 生成问题")
             
-            if total_articles:
-                self.update_progress(total_articles)
+            self.update_progress()
             
         except Exception as e:
-            print(f"❌ 处理文章 {article_dir.name} 时出错: {e}")
-            if total_articles:
-                self.update_progress(total_articles)
+            print(f"❌ 处理文章 {title} 时出错: {e}")
+            self.update_progress()
     
-    def run(self):
+    def prepare_output(self):
+        """创建输出文件并启动写线程，续跑时返回已经生成过问题的文章名"""
+        if self.resume and existing_shards(self.output_file):
+            completed = self.load_completed()
+            if self.partial_questions:
+                print(f"🔁 {len(self.partial_questions)} 篇文章的问题只写了一部分，重新生成")
+            # 旧版本的输出没有记录文件时，把已有问题的文章都记为写完
+            rewrite = not self.done_path.exists()
+        else:
+            reset_output(self.output_file)
+            completed = set()
+            rewrite = True
+        self.done_file = open(self.done_path, 'w' if rewrite else 'a', encoding='utf-8')
+        if rewrite:
+            self.done_file.writelines(title + '\n' for title in sorted(completed))
+            self.done_file.flush()
+        self.writer = JsonlWriter(self.output_file, **self.writer_options)
+        return completed
+    
+    def close_output(self):
+        """等写线程写完剩余的记录"""
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            finally:
+                self.done_file.close()
+            print(f"💾 写线程共 {self.writer.flushes} 次写入 {self.writer.written} 个问题")
+            self.writer = None
+    
+    def print_summary(self):
+        print(f"📊 总共生成 {self.total_qa_count} 个问题")
+        print(f"📚 训练集: {self.train_count} 个问题")
+        print(f"🧪 验证集: {self.eval_count} 个问题")
+        print(f"💾 结果已保存到: {self.output_file}")
+    
+    async def run_async(self):
         if not self.output_dir.exists():
             print(f"输出目录 {self.output_dir} 不存在")
             return
         
-        self.output_file.parent.mkdir(parents=True, exist_ok=True)
+        completed = self.prepare_output()
+        articles = self.list_articles()
+        pending = [title for title in articles if title not in completed]
         
-        with open(self.output_file, 'w', encoding='utf-8') as f:
-            pass
-        
-        article_dirs = [d for d in self.output_dir.iterdir() if d.is_dir()]
-        article_dirs.sort()
-        
-        print(f"🚀 开始并行处理，找到 {len(article_dirs)} 个文章目录")
-        print(f"🔧 使用 {self.max_workers} 个并发线程")
+        source = "打包语料" if self.corpus else "文章目录"
+        print(f"🚀 开始并行处理，从{source}中找到 {len(articles)} 篇文章")
+        if completed:
+            print(f"⏩ 续跑：已完成 {len(articles) - len(pending)} 篇（{self.total_qa_count} 个问题），剩余 {len(pending)} 篇")
+        print(f"🔧 最多 {self.engine.max_concurrency} 个并发请求")
         print(f"📁 输出文件: {self.output_file}")
+        self.start_progress(len(pending))
         
-        # 使用线程池并行处理
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # 提交所有任务
-            future_to_article = {
-                executor.submit(self.process_single_article, article_dir, len(article_dirs)): article_dir 
-                for article_dir in article_dirs
-            }
-            
-            # 等待所有任务完成
-            for future in as_completed(future_to_article):
-                article_dir = future_to_article[future]
-                try:
-                    future.result()  # 获取结果，如果有异常会抛出
-                except Exception as exc:
-                    print(f"❌ 文章 {article_dir.name} 处理时发生异常: {exc}")
+        # 所有文章在同一个事件循环中并发处理，在途请求数由引擎的信号量限制
+        try:
+            results = await asyncio.gather(
+                *(self.process_single_article(title) for title in pending),
+                return_exceptions=True
+            )
+        finally:
+            self.close_output()
+        for title, result in zip(pending, results):
+            if isinstance(result, Exception):
+                print(f"❌ 文章 {title} 处理时发生异常: {result}")
         
         print(f"\n🎉 并行处理完成！")
-        print(f"📊 总共生成 {self.total_qa_count} 个问题")
-        print(f"📚 训练集: {self.train_count} 个问题")
-        print(f"🧪 验证集: {self.eval_count} 个问题")
-        print(f"💾 结果已保存到: {self.output_file}")
+        self.print_summary()
+    
+    def run(self):
+        async def main():
+            try:
+                await self.run_async()
+            finally:
+                await self.engine.close()
+        asyncio.run(main())
 
 def main():    
+    parser = argparse.ArgumentParser(description="从爬取的文章生成问题数据集")
+    parser.add_argument("--resume", action="store_true", help="保留已有输出，只处理还没有生成问题的文章")
+    parser.add_argument("--chunk-tokens", type=int, default=0, help="超过这么多 token 的文章切块生成问题，0 表示不切块")
+    parser.add_argument("--chunk-overlap", type=int, default=200, help="相邻块之间重叠的 token 数")
+    parser.add_argument("--stream", action="store_true", help="流式请求，每个问题生成完就写入，回复被截断时保留已经完整的问题")
+    add_writer_arguments(parser)
+    add_engine_arguments(parser)
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+    
     print("🎯 开始生成问题数据集...")
-    generator = QAGenerator(max_workers=8)
+    generator = QAGenerator(
+        max_concurrency=64,
+        resume=args.resume,
+        chunk_tokens=args.chunk_tokens,
+        chunk_overlap=args.chunk_overlap,
+        stream=args.stream,
+        writer_options=writer_options_from_args(args),
+        engine_options=engine_options_from_args(args),
+        **cache_options_from_args(args)
+    )
     generator.run()
     print("✨ 完成！")
 
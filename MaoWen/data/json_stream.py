@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量解析 LLM 输出中的 JSON 数组
+模型按 token 流式返回时，每收到一段文本就交给 JsonArrayStream.feed，
+数组中的元素（例如 {"question": ...}）一闭合就解析出来，不必等整个回复结束。
+回复被截断时，已经闭合的元素仍然可以用；数组前面的说明文字和 ```json 标记会被跳过。
+"""
+
+import json
+
+OPENERS = '{['
+CLOSERS = '}]'
+
+
+class JsonArrayStream:
+    """
+    逐段读入文本，返回新闭合的顶层数组元素。只跟踪字符串、转义和括号深度，
+    每个元素闭合后再用 json.loads 解析，解析失败的元素跳过并计入 skipped
+    """
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.element = []
+        self.count = 0
+        self.skipped = 0
+
+    def feed(self, text):
+        """读入一段文本，返回其中闭合的元素列表"""
+        items = []
+        for ch in text:
+            if self.finished:
+                break
+            if not self.started:
+                # 跳过数组之前的内容
+                self.started = ch == '['
+                continue
+            if self.in_string:
+                self.element.append(ch)
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+            if self.depth == 0 and ch in ',]':
+                # 顶层的逗号和右括号结束数字、字符串等标量元素
+                self._finish(items)
+                self.finished = ch == ']'
+                continue
+            if self.depth == 0 and not self.element and ch.isspace():
+                continue
+            self.element.append(ch)
+            if ch == '"':
+                self.in_string = True
+            elif ch in OPENERS:
+                self.depth += 1
+            elif ch in CLOSERS:
+                self.depth -= 1
+                if self.depth == 0:
+                    # 对象或数组元素一闭合就解析
+                    self._finish(items)
+        return items
+
+    def _finish(self, items):
+        if not self.element:
+            return
+        raw = ''.join(self.element).strip()
+        self.element = []
+        self.depth = 0
+        if not raw:
+            return
+        try:
+            items.append(json.loads(raw))
+            self.count += 1
+        except json.JSONDecodeError:
+            self.skipped += 1
+
+    @property
+    def pending(self):
+        """还有没闭合的元素（回复被截断时为真）"""
+        return bool(self.element)
+
+
+def parse_json_array(text):
+    """从完整或被截断的文本中取出数组里所有完整的元素"""
+    return JsonArrayStream().feed(text)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSONL 输出文件的读写工具
+生成脚本中途退出时，输出文件最后一行可能只写了一半。续跑前先把它截掉，
+再逐行读出已完成的记录。
+写入由一个单独的线程批量完成，生成协程不会阻塞在文件 I/O 上。
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from pathlib import Path
+
+FSYNC_POLICIES = ('never', 'batch', 'close')
+
+
+def repair_tail(path):
+    """截掉文件末尾不完整的一行，返回截掉的字节数"""
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return 0
+        # 从末尾往前找最后一个换行符
+        pos = size
+        while pos > 0:
+            step = min(4096, pos)
+            f.seek(pos - step)
+            chunk = f.read(step)
+            newline = chunk.rfind(b'\n')
+            if newline != -1:
+                pos = pos - step + newline + 1
+                break
+            pos -= step
+        if pos == size:
+            return 0
+        f.truncate(pos)
+        return size - pos
+
+
+def iter_jsonl(path):
+    """逐行读出记录，跳过空行和无法解析的行"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def shard_path(path, index, num_shards):
+    """第 index 个分片的文件名，只有一个分片时就是 path 本身"""
+    path = Path(path)
+    if num_shards <= 1:
+        return path
+    return path.with_name(f"{path.stem}-{index:03d}-of-{num_shards:03d}{path.suffix}")
+
+
+def existing_shards(path):
+    """path 本身（存在时）以及它的所有分片文件"""
+    path = Path(path)
+    paths = [path] if path.exists() else []
+    paths += sorted(path.parent.glob(f"{path.stem}-*-of-*{path.suffix}"))
+    return paths
+
+
+def reset_output(path):
+    """清空输出文件并删除旧的分片"""
+    path = Path(path)
+    for shard in existing_shards(path):
+        if shard != path:
+            shard.unlink()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8'):
+        pass
+
+
+def iter_jsonl_shards(path):
+    """依次读出 path 及其所有分片中的记录"""
+    for shard in existing_shards(path):
+        yield from iter_jsonl(shard)
+
+
+class JsonlWriter:
+    """
+    单写线程的 JSONL 输出：调用方把记录放进队列后立即返回，写线程攒够 flush_size 条
+    或距第一条未写记录超过 flush_interval 秒时一次写入。
+    fsync 为 'batch' 时每次写入后 fsync，为 'close' 时只在关闭时 fsync，为 'never' 时不 fsync。
+    num_shards 大于 1 时按 shard_key 字段的哈希把记录分到多个文件。
+    """
+
+    def __init__(self, path, flush_interval=1.0, flush_size=256, fsync='close', num_shards=1,
+                 shard_key='source_article'):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync 只能是 {', '.join(FSYNC_POLICIES)}")
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.fsync = fsync
+        self.shard_key = shard_key
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.files = [open(shard_path(self.path, i, num_shards), 'a', encoding='utf-8') for i in range(num_shards)]
+        self.queue = queue.SimpleQueue()
+        self.written = 0
+        self.flushes = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name="jsonl-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, records, on_written=None):
+        """提交一组记录，不等待写入；on_written 不为空时在这些记录写入文件后由写线程调用"""
+        if self.error is not None:
+            raise self.error
+        self.queue.put((list(records), on_written))
+
+    def _shard(self, record):
+        if len(self.files) == 1:
+            return 0
+        key = str(record.get(self.shard_key, '')).encode('utf-8')
+        return zlib.crc32(key) % len(self.files)
+
+    def _run(self):
+        pending = [[] for _ in self.files]
+        # 等这一批写入后再调用的 on_written
+        callbacks = []
+        count = 0
+        deadline = None
+        closing = False
+        while not closing:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ([], None)
+            if item is None:
+                closing = True
+            else:
+                records, on_written = item
+                complete = True
+                for record in records:
+                    try:
+                        line = json.dumps(record, ensure_ascii=False) + '\n'
+                        pending[self._shard(record)].append(line)
+                        count += 1
+                    except Exception as e:
+                        # 无法序列化的记录不写入，错误在 write 或 close 时抛出；其余记录照常写
+                        self._fail(e)
+                        complete = False
+                # 这组记录没有全部写入时不调用 on_written
+                if on_written is not None and complete:
+                    callbacks.append(on_written)
+                if (count or callbacks) and deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if (count or callbacks) and (closing or count >= self.flush_size or time.monotonic() >= deadline):
+                try:
+                    if count:
+                        self._flush(pending)
+                    for on_written in callbacks:
+                        on_written()
+                except Exception as e:
+                    # 写线程不能退出，否则之后的 write 都无人处理；继续取队列，错误在 write 或 close 时抛出
+                    self._fail(e)
+                callbacks.clear()
+                count = 0
+                deadline = None
+
+    def _fail(self, error):
+        """只保留第一个错误"""
+        if self.error is None:
+            self.error = error
+
+    def _flush(self, pending):
+        for f, lines in zip(self.files, pending):
+            if not lines:
+                continue
+            f.write(''.join(lines))
+            f.flush()
+            if self.fsync == 'batch':
+                os.fsync(f.fileno())
+            self.written += len(lines)
+            lines.clear()
+        self.flushes += 1
+
+    def close(self):
+        """写完队列中剩余的记录并关闭文件"""
+        self.queue.put(None)
+        self.thread.join()
+        for f in self.files:
+            if self.fsync != 'never':
+                os.fsync(f.fileno())
+            f.close()
+        if self.error is not None:
+            raise self.error
+
+
+def add_writer_arguments(parser):
+    """给生成脚本的命令行加上写线程的参数"""
+    parser.add_argument("--flush-interval", type=float, default=1.0, help="未写记录最多等待的秒数")
+    parser.add_argument("--flush-size", type=int, default=256, help="攒够这么多条记录就写入")
+    parser.add_argument("--fsync", choices=FSYNC_POLICIES, default='close', help="fsync 策略")
+    parser.add_argument("--shards", type=int, default=1, help="输出分片数，按文章名分片")
+
+
+def writer_options_from_args(args):
+    return {
+        'flush_interval': args.flush_interval,
+        'flush_size': args.flush_size,
+        'fsync': args.fsync,
+        'num_shards': args.shards
+    }
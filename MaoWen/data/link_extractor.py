@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+索引页链接提取
+按文档顺序一次遍历页面：同时检测分卷边界标记并收集 <a> 链接，
+遇到边界标记后立即停止解析。解析后端可在运行时选择。
+"""
+
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+from bs4.element import NavigableString, PreformattedString, Tag
+
+# 第五卷及之后内容开始处的文字
+DEFAULT_BOUNDARY_MARKERS = ['有学者指出，1977年官方版《毛泽东选集》']
+
+# 每次喂给流式解析器的字符数，边界出现后剩余部分不再解析
+FEED_CHUNK_SIZE = 16 * 1024
+
+
+class LinkCollector:
+    """接收按文档顺序到达的文本和链接事件"""
+
+    def __init__(self, boundary_markers):
+        self.boundary_markers = [marker for marker in boundary_markers if marker]
+        self.tail_size = max((len(marker) for marker in self.boundary_markers), default=1) - 1
+        self.tail = ""
+        self.links = []
+        self.current_href = None
+        self.current_text = []
+        self.boundary = None
+
+    @property
+    def done(self):
+        return self.boundary is not None
+
+    def text(self, data):
+        if self.done:
+            return
+        if self.current_href is not None:
+            self.current_text.append(data)
+        # 标记可能被标签拆开，保留上一段文本的末尾一起检查
+        window = self.tail + data
+        for marker in self.boundary_markers:
+            if marker in window:
+                self.boundary = marker
+                self.current_href = None
+                return
+        self.tail = window[-self.tail_size:] if self.tail_size else ""
+
+    def start_link(self, href):
+        if self.done:
+            return
+        self.end_link()
+        self.current_href = href
+        self.current_text = []
+
+    def end_link(self):
+        if self.current_href is None:
+            return
+        self.links.append(("".join(self.current_text).strip(), self.current_href))
+        self.current_href = None
+        self.current_text = []
+
+
+class _StdlibTarget(HTMLParser):
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            href = dict(attrs).get('href')
+            if href:
+                self.collector.start_link(href)
+
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self.collector.end_link()
+
+    def handle_data(self, data):
+        self.collector.text(data)
+
+
+class _LxmlTarget:
+    def __init__(self, collector):
+        self.collector = collector
+
+    def start(self, tag, attrib):
+        if tag == 'a' and attrib.get('href'):
+            self.collector.start_link(attrib['href'])
+
+    def end(self, tag):
+        if tag == 'a':
+            self.collector.end_link()
+
+    def data(self, data):
+        self.collector.text(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return None
+
+
+def _feed_in_chunks(parser, html, collector):
+    for start in range(0, len(html), FEED_CHUNK_SIZE):
+        parser.feed(html[start:start + FEED_CHUNK_SIZE])
+        if collector.done:
+            return
+
+
+def _parse_stdlib(html, collector):
+    """标准库 html.parser，纯 Python 流式解析，不建树"""
+    parser = _StdlibTarget(collector)
+    _feed_in_chunks(parser, html, collector)
+    if not collector.done:
+        parser.close()
+
+
+def _parse_lxml(html, collector):
+    """lxml (libxml2) 的 C 解析器，以 target 回调方式流式解析，不建树"""
+    from lxml import etree
+    parser = etree.HTMLParser(target=_LxmlTarget(collector))
+    _feed_in_chunks(parser, html, collector)
+    if not collector.done:
+        parser.close()
+
+
+def _inside(node, link):
+    return any(parent is link for parent in node.parents)
+
+
+def _make_bs4_backend(features):
+    def parse(html, collector):
+        """先用 BeautifulSoup 建树，再按文档顺序遍历一次"""
+        soup = BeautifulSoup(html, features)
+        current_link = None
+        for node in soup.descendants:
+            if collector.done:
+                return
+            if isinstance(node, Tag):
+                if current_link is not None and not _inside(node, current_link):
+                    collector.end_link()
+                    current_link = None
+                if node.name == 'a' and node.get('href'):
+                    collector.start_link(node['href'])
+                    current_link = node
+            elif isinstance(node, NavigableString) and not isinstance(node, PreformattedString):
+                if current_link is not None and not _inside(node, current_link):
+                    collector.end_link()
+                    current_link = None
+                collector.text(str(node))
+        collector.end_link()
+    return parse
+
+
+PARSER_BACKENDS = {
+    'html.parser': _parse_stdlib,
+    'lxml': _parse_lxml,
+    'bs4-html.parser': _make_bs4_backend('html.parser'),
+    'bs4-lxml': _make_bs4_backend('lxml'),
+}
+
+
+def extract_links(html, parser='lxml', boundary_markers=DEFAULT_BOUNDARY_MARKERS):
+    """
+    按文档顺序返回边界标记之前的所有 (标题, href)，以及找到的边界标记（没找到为 None）
+    """
+    if parser not in PARSER_BACKENDS:
+        raise ValueError(f"未知的解析后端: {parser}，可选: {', '.join(PARSER_BACKENDS)}")
+    collector = LinkCollector(boundary_markers)
+    PARSER_BACKENDS[parser](html, collector)
+    collector.end_link()
+    return collector.links, collector.boundary
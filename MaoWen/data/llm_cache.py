@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM 响应的磁盘缓存
+以 (模型, 系统提示, 用户提示, temperature, max_tokens) 的哈希为键，把返回结果存进 SQLite。
+语料和提示词没变时重跑生成脚本直接命中缓存，不再调用 API。
+缓存总大小超过上限时按最近使用时间淘汰。命中时只在内存里记下使用时间，
+攒够一批或写入新结果、关闭时再一起写回，命中不会每次都提交一次事务。
+
+用法:
+    python llm_cache.py info data/llm_cache.sqlite
+    python llm_cache.py clear data/llm_cache.sqlite
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_FILE = "data/llm_cache.sqlite"
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+# 攒够这么多次命中就把使用时间写回数据库
+TOUCH_BATCH = 256
+
+
+def cache_key(model, system_prompt, user_prompt, temperature, max_tokens):
+    raw = json.dumps([model, system_prompt, user_prompt, temperature, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """
+    线程安全的响应缓存。bypass 为真时不读缓存，但仍写入新结果，
+    用于在 temperature=1 下有意重新采样并覆盖旧结果
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_FILE, max_bytes=DEFAULT_MAX_BYTES, bypass=False):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        # 还没写回的使用时间：键 -> 最近一次命中的时间
+        self.touched = {}
+        self.lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """返回缓存的结果字典，没有命中时返回 None"""
+        if self.bypass:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.touched[key] = time.time()
+            if len(self.touched) >= TOUCH_BATCH:
+                self._flush_touched()
+                self.conn.commit()
+        return json.loads(row[0])
+
+    def _flush_touched(self):
+        """把攒下的使用时间写回数据库（不提交），调用方需持有锁"""
+        if self.touched:
+            self.conn.executemany("UPDATE responses SET last_used = ? WHERE key = ?",
+                                  [(used, key) for key, used in self.touched.items()])
+            self.touched.clear()
+
+    def put(self, key, value):
+        raw = json.dumps(value, ensure_ascii=False)
+        size = len(raw.encode('utf-8'))
+        now = time.time()
+        with self.lock:
+            # 与这次写入在同一个事务里提交；淘汰前也要先写回，以免淘汰掉刚命中过的条目
+            self._flush_touched()
+            old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, raw, size, now, now)
+            )
+            self.total_bytes += size - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """按最近使用时间淘汰，直到总大小降到上限的 90%，调用方需持有锁"""
+        target = self.max_bytes * 0.9
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+        removed = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            removed.append((key,))
+            self.total_bytes -= size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", removed)
+        self.evicted += len(removed)
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self.lock:
+            self.touched.clear()
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+            self.conn.execute("VACUUM")
+            self.total_bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evicted': self.evicted,
+            'entries': self.count(),
+            'size_bytes': self.total_bytes
+        }
+
+    def summary(self):
+        stats = self.stats()
+        return (f"缓存命中 {stats['hits']} 次，未命中 {stats['misses']} 次 "
+                f"(命中率 {stats['hit_rate'] * 100:.1f}%)，共 {stats['entries']} 条 "
+                f"{stats['size_bytes'] / 1024 / 1024:.1f} MB")
+
+    def close(self):
+        with self.lock:
+            self._flush_touched()
+            self.conn.commit()
+            self.conn.close()
+
+
+def add_cache_arguments(parser):
+    """给生成脚本的命令行加上响应缓存的参数"""
+    parser.add_argument("--cache-file", default=DEFAULT_CACHE_FILE, help="LLM 响应缓存文件")
+    parser.add_argument("--no-cache", action="store_true", help="不使用响应缓存")
+    parser.add_argument("--resample", action="store_true", help="忽略已缓存的结果重新采样，新结果仍写入缓存")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_BYTES / 1024 / 1024,
+                        help="缓存大小上限（MB），超过时按最近使用时间淘汰")
+
+
+def cache_options_from_args(args):
+    return {
+        'cache_file': None if args.no_cache else args.cache_file,
+        'resample': args.resample,
+        'cache_max_bytes': int(args.cache_max_mb * 1024 * 1024)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM 响应缓存工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    info_parser = subparsers.add_parser("info", help="查看缓存统计")
+    info_parser.add_argument("path", nargs="?", default=DEFAULT_CACHE_FILE, help="缓存文件")
+    clear_parser = subparsers.add_parser("clear", help="清空缓存")
+    clear_parser.add_argument("path", nargs="?", default=DEFAULT_CACHE_FILE, help="缓存文件")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"❌ 缓存文件 {args.path} 不存在")
+        return
+    cache = LLMCache(args.path)
+    if args.command == "info":
+        print(f"📦 条目数: {cache.count()}")
+        print(f"💾 大小: {cache.total_bytes / 1024 / 1024:.2f} MB")
+    elif args.command == "clear":
+        cache.clear()
+        print(f"✅ 已清空 {args.path}")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
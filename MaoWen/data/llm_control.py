@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM 请求的自适应并发与限额控制
+并发上限按 AIMD 调整：起步阶段每个成功请求加 1（每轮翻倍），超过阈值后每轮只加 1；
+遇到 429/503/504 或超时时减半。每分钟请求数（RPM）和 token 数（TPM）用爬虫同款令牌桶控制，
+token 数在发送前按提示长度估计，收到响应后按实际用量补差。
+"""
+
+import asyncio
+import time
+
+from politeness import TokenBucket
+
+
+class AdaptiveConcurrency:
+    """
+    异步的 AIMD 并发限制器。adaptive 为假时并发上限固定为 max_limit，相当于信号量。
+    latency_target 不为空时，请求耗时超过它就不再提高上限。
+    """
+
+    def __init__(self, max_limit=64, min_limit=1, initial=None, adaptive=True, latency_target=None):
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.adaptive = adaptive
+        self.latency_target = latency_target
+        self.limit = float(max_limit if not adaptive else (initial or min(max_limit, 4)))
+        self.threshold = float(max_limit)
+        self.in_flight = 0
+        self.peak = self.limit
+        self.decreases = 0
+        self.last_decrease = 0.0
+        self.condition = None
+
+    def _condition(self):
+        # 在第一次使用时创建，保证绑定到实际运行的事件循环
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        return self.condition
+
+    async def acquire(self):
+        """等到有空闲名额，返回开始时间，完成后交给 release"""
+        condition = self._condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return time.monotonic()
+
+    async def release(self, started, throttled=False, latency=None):
+        condition = self._condition()
+        async with condition:
+            self.in_flight -= 1
+            if self.adaptive:
+                if throttled:
+                    # 在上次减半之后才发出的请求被限流才再减半，避免同一波 429 把上限压到底
+                    if started >= self.last_decrease:
+                        self.threshold = max(self.limit / 2, self.min_limit)
+                        self.limit = self.threshold
+                        self.last_decrease = time.monotonic()
+                        self.decreases += 1
+                elif self.latency_target is None or latency is None or latency <= self.latency_target:
+                    if self.limit < self.threshold:
+                        self.limit += 1
+                    else:
+                        self.limit += 1 / self.limit
+                    self.limit = min(self.limit, self.max_limit)
+                    self.peak = max(self.peak, self.limit)
+            condition.notify_all()
+
+    async def abandon(self):
+        """归还名额但不调整上限（请求没有发出或被取消）"""
+        condition = self._condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    @property
+    def current(self):
+        return int(self.limit)
+
+
+class RateBudget:
+    """每分钟请求数和 token 数的限额，0 表示不限；允许最多 10 秒的突发"""
+
+    def __init__(self, rpm=0, tpm=0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm / 60, max(rpm // 6, 1)) if rpm else None
+        self.tokens = TokenBucket(tpm / 60, max(tpm // 6, 1)) if tpm else None
+        # 不限速的桶只用来实现 Retry-After 暂停
+        self.gate = TokenBucket(0)
+        self.waited = 0.0
+
+    def reserve(self, estimated_tokens):
+        """预订一次请求和 token 额度，返回需要等待的秒数"""
+        wait = self.gate.reserve()
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(estimated_tokens))
+        if wait > 0:
+            self.waited += wait
+        return wait
+
+    async def wait(self, estimated_tokens):
+        """发送前等待请求和 token 额度"""
+        wait = self.reserve(estimated_tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def wait_sync(self, estimated_tokens):
+        """同 wait，给在线程池里调用的评分函数使用"""
+        wait = self.reserve(estimated_tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """按实际用量补差：用多了继续扣，用少了退还"""
+        if self.tokens is not None and actual_tokens:
+            self.tokens.reserve(actual_tokens - estimated_tokens)
+
+    def pause(self, seconds):
+        """服务端要求等待时暂停发放额度"""
+        for bucket in (self.gate, self.requests, self.tokens):
+            if bucket is not None:
+                bucket.pause(seconds)
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享的异步 LLM 调用引擎
+问题生成和答案生成共用一个 AsyncOpenAI 客户端（内部是一个连接池），
+同时在途的请求数由 AIMD 限制器控制，在 max_concurrency 以内随限流情况自动升降。
+所有请求都在同一个事件循环里等待网络，几百个并发请求不需要几百个线程。
+429/5xx、超时和连接错误按 Retry-After 或指数退避重试。
+传入 LLMCache 时先查磁盘缓存，命中的请求不占用并发名额也不调用 API。
+配置了多个接口时，请求由 llm_router.py 按各接口的余量分配，连续失败的接口暂时摘除。
+每次调用的耗时、token 用量、状态和接口记录在 self.metrics 中（见 llm_metrics.py）。
+"""
+
+import asyncio
+import math
+import os
+import re
+import time
+from dataclasses import dataclass
+
+import openai
+from dotenv import load_dotenv
+
+from llm_cache import cache_key
+from llm_metrics import LLMMetrics, add_metrics_arguments, metrics_options_from_args
+from llm_router import EndpointConfig, LLMRouter, load_endpoints
+from politeness import RETRYABLE_STATUS, backoff_delay, parse_retry_after
+
+DEFAULT_MODEL = "deepseek-chat"
+
+# 中文字符和全角标点
+CJK_RE = re.compile(r'[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+
+def estimate_tokens(text):
+    """粗略估计 token 数：中文约每字 0.6 个 token，其他字符约每字 0.3 个 token"""
+    cjk = len(CJK_RE.findall(text))
+    return math.ceil(cjk * 0.6 + (len(text) - cjk) * 0.3)
+
+
+@dataclass
+class LLMResponse:
+    """一次调用的结果：返回文本、token 用量和耗时"""
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+    cached: bool = False
+    # 'stop' 为正常结束，'length' 为达到 max_tokens 被截断，'interrupted' 为流式读取中途断开
+    finish_reason: str = None
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def truncated(self):
+        return self.finish_reason in TRUNCATED_REASONS
+
+
+TRUNCATED_REASONS = ('length', 'interrupted')
+
+
+class StreamInterrupted(Exception):
+    """流式读取已经收到部分文本后出错，response 为已收到的部分"""
+
+    def __init__(self, response, cause):
+        super().__init__(str(cause))
+        self.response = response
+        self.cause = cause
+
+
+# 这些状态码说明服务端过载，需要降低并发；其他可重试的错误只重试不降并发
+OVERLOAD_STATUS = {429, 503, 504}
+# 这些状态码说明接口本身不可用（密钥无效、没有权限），熔断这个接口
+ENDPOINT_REJECT_STATUS = {401, 403}
+
+
+def error_status(error):
+    """指标中记录的失败状态：HTTP 状态码、'timeout'、'connection' 或异常类名"""
+    if isinstance(error, openai.APIStatusError):
+        return str(error.status_code)
+    if isinstance(error, openai.APITimeoutError):
+        return 'timeout'
+    if isinstance(error, openai.APIConnectionError):
+        return 'connection'
+    return type(error).__name__
+
+
+def classify_error(error):
+    """返回 (是否可以重试, 是否说明服务端过载, Retry-After 秒数)"""
+    if isinstance(error, openai.APIStatusError):
+        status = error.status_code
+        retry_after = parse_retry_after(error.response.headers.get('retry-after'))
+        return status in RETRYABLE_STATUS, status in OVERLOAD_STATUS, retry_after
+    if isinstance(error, openai.APITimeoutError):
+        return True, True, None
+    if isinstance(error, openai.APIConnectionError):
+        return True, False, None
+    return False, False, None
+
+
+class LLMEngine:
+    """
+    max_concurrency 是并发上限；adaptive 为真时从较小的并发开始，没有限流就逐步提高，
+    遇到 429/503/504 或超时减半。rpm/tpm 为每分钟请求数和 token 数的限额，0 表示不限。
+    endpoints（EndpointConfig 列表）或 endpoints_file（接口列表文件，默认读取环境变量 LLM_ENDPOINTS，
+    传入 api_key 或 base_url 时不读取）给出多个接口时，请求按余量分配到各接口，并发上限和限额按接口分别计算，见 llm_router.py。
+    metrics_file、progress_interval 和价格传给 LLMMetrics，生成脚本也通过 engine.metrics 报告各阶段的进度
+    """
+
+    def __init__(self, max_concurrency=64, model=DEFAULT_MODEL, api_key=None, base_url=None, timeout=600,
+                 cache=None, adaptive=True, min_concurrency=1, rpm=0, tpm=0, max_retries=4,
+                 backoff_base=1.0, backoff_cap=60.0, max_retry_after=300.0, latency_target=None,
+                 endpoints=None, endpoints_file=None, failure_threshold=5, cooldown=30.0, metrics_file=None,
+                 progress_interval=10.0, price_prompt=0.0, price_completion=0.0):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.cache = cache
+        self.router = None
+        self.endpoint_options = {
+            'adaptive': adaptive,
+            'min_concurrency': min_concurrency,
+            'rpm': rpm,
+            'tpm': tpm,
+            'latency_target': latency_target,
+            'failure_threshold': failure_threshold,
+            'cooldown': cooldown
+        }
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_retry_after = max_retry_after
+        self.stats = {'requests': 0, 'retries': 0, 'throttled': 0, 'failures': 0, 'truncated': 0}
+        self.metrics = LLMMetrics(metrics_file, progress_interval, price_prompt=price_prompt,
+                                  price_completion=price_completion)
+        if cache is not None:
+            # 缓存命中记在单独的 'cache' 一项下，不计花费
+            self.metrics.register_endpoint('cache', 0.0, 0.0)
+        self.setup_openai(api_key, base_url, endpoints, endpoints_file)
+
+    def setup_openai(self, api_key=None, base_url=None, endpoints=None, endpoints_file=None):
+        load_dotenv()
+
+        # 显式传入的 api_key/base_url 优先，只有都没有时才读取接口列表文件（含环境变量 LLM_ENDPOINTS），
+        # 否则性能测试等指定了模拟接口的调用会被 .env 中的 LLM_ENDPOINTS 悄悄转到真实接口上
+        if not endpoints and not (api_key or base_url):
+            try:
+                endpoints = load_endpoints(endpoints_file)
+            except (OSError, ValueError, TypeError) as e:
+                print(f"✗ 读取接口列表失败: {e}")
+                return
+
+        if not endpoints:
+            api_key = api_key or os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                print("请在.env文件中设置OPENAI_API_KEY，或设置环境变量")
+                return
+            base_url = base_url or os.getenv("OPENAI_BASE_URL")
+            endpoints = [EndpointConfig(base_url=base_url, api_key=api_key, model=self.model)]
+        else:
+            # 各接口的模型可能不同，缓存键使用所有模型名，任一接口的结果都可以复用
+            self.model = "+".join(sorted({config.model for config in endpoints}))
+
+        try:
+            self.router = LLMRouter.from_configs(endpoints, self.max_concurrency, self.timeout,
+                                                 **self.endpoint_options)
+            self.max_concurrency = self.router.max_concurrency
+            for config in endpoints:
+                self.metrics.register_endpoint(config.label, config.price_prompt, config.price_completion)
+            adaptive = '，自适应调整' if self.endpoint_options['adaptive'] else ''
+            if len(endpoints) > 1:
+                print(f"✓ OpenAI客户端初始化成功（{len(endpoints)} 个接口，最多 {self.max_concurrency} 个并发请求{adaptive}）")
+            else:
+                print(f"✓ OpenAI客户端初始化成功（最多 {self.max_concurrency} 个并发请求{adaptive}）")
+
+        except Exception as e:
+            print(f"✗ OpenAI客户端初始化失败: {e}")
+            self.router = None
+
+    @property
+    def available(self):
+        return self.router is not None
+
+    async def complete(self, endpoint, messages, temperature, max_tokens, on_text=None):
+        """向 endpoint 发出一次请求；on_text 不为空时流式读取，每收到一段文本就交给它"""
+        params = {"model": endpoint.model, "messages": messages, "temperature": temperature,
+                  "max_tokens": max_tokens}
+        if on_text is None:
+            response = await endpoint.client.chat.completions.create(**params)
+            usage = response.usage
+            choice = response.choices[0]
+            return LLMResponse(
+                text=(choice.message.content or "").strip(),
+                prompt_tokens=usage.prompt_tokens if usage else 0,
+                completion_tokens=usage.completion_tokens if usage else 0,
+                finish_reason=choice.finish_reason
+            )
+
+        parts = []
+        usage = None
+        finish_reason = None
+        try:
+            stream = await endpoint.client.chat.completions.create(
+                **params, stream=True, stream_options={"include_usage": True})
+            async for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage
+                for choice in chunk.choices:
+                    if choice.delta and choice.delta.content:
+                        parts.append(choice.delta.content)
+                        on_text(choice.delta.content)
+                    if choice.finish_reason:
+                        finish_reason = choice.finish_reason
+        except Exception as e:
+            if not parts:
+                raise
+            # 已经交出去的文本收不回来，不能再整体重试，把收到的部分交给调用方
+            text = "".join(parts)
+            raise StreamInterrupted(LLMResponse(text=text.strip(), completion_tokens=estimate_tokens(text),
+                                                finish_reason='interrupted'), e)
+        text = "".join(parts)
+        return LLMResponse(
+            text=text.strip(),
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else estimate_tokens(text),
+            # 没有收到结束标记就断开的流也按中途断开处理
+            finish_reason=finish_reason or 'interrupted'
+        )
+
+    async def chat(self, system_prompt, user_prompt, temperature=1.0, max_tokens=4096, on_text=None):
+        """
+        发送一次对话请求，返回 LLMResponse；客户端未初始化时返回 None，
+        临时错误会重试（有其他可用接口时换一个接口立即重试），
+        重试用完或遇到不可重试的错误时抛出异常。
+        on_text 不为空时流式请求，每收到一段文本就调用 on_text(文本)；
+        已经收到部分文本后出错不再重试，返回已收到的部分（finish_reason 为 'interrupted'）
+        """
+        if not self.router:
+            return None
+        key = None
+        if self.cache is not None:
+            key = cache_key(self.model, system_prompt, user_prompt, temperature, max_tokens)
+            cached = self.cache.get(key)
+            if cached is not None:
+                if on_text is not None:
+                    on_text(cached['text'])
+                self.metrics.record_call('cache', 'cached', prompt_tokens=cached['prompt_tokens'],
+                                         completion_tokens=cached['completion_tokens'])
+                return LLMResponse(
+                    text=cached['text'],
+                    prompt_tokens=cached['prompt_tokens'],
+                    completion_tokens=cached['completion_tokens'],
+                    cached=True
+                )
+        estimated = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+        attempt = 0
+        endpoint = None
+        while True:
+            endpoint = self.router.select(avoid=endpoint)
+            try:
+                await endpoint.budget.wait(estimated)
+                started = await endpoint.limiter.acquire()
+            except BaseException:
+                self.router.cancel(endpoint)
+                raise
+            if self.router.tripped_since(endpoint) and self.router.has_alternative(endpoint):
+                # 排队期间这个接口被熔断了，换一个接口，不算重试
+                await endpoint.limiter.abandon()
+                self.router.cancel(endpoint)
+                continue
+            self.stats['requests'] += 1
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ]
+            try:
+                result = await self.complete(endpoint, messages, temperature, max_tokens, on_text)
+            except StreamInterrupted as e:
+                _, overloaded, _ = classify_error(e.cause)
+                await endpoint.limiter.release(started, throttled=overloaded)
+                self.router.finish(endpoint, ok=False, failed=True)
+                result = e.response
+                result.prompt_tokens = estimated
+                result.latency = time.monotonic() - started
+                self.metrics.record_call(endpoint.label, 'interrupted', result.latency, result.prompt_tokens,
+                                         result.completion_tokens)
+                break
+            except Exception as e:
+                retryable, overloaded, retry_after = classify_error(e)
+                await endpoint.limiter.release(started, throttled=overloaded)
+                # 密钥无效或没有权限时直接熔断这个接口，还有其他接口时换一个重试
+                rejected = isinstance(e, openai.APIStatusError) and e.status_code in ENDPOINT_REJECT_STATUS
+                self.router.finish(endpoint, ok=False, failed=retryable, trip=rejected)
+                self.metrics.record_call(endpoint.label, error_status(e), time.monotonic() - started)
+                if overloaded:
+                    self.stats['throttled'] += 1
+                alternative = self.router.has_alternative(endpoint)
+                if not (retryable or (rejected and alternative)) or attempt >= self.max_retries:
+                    self.stats['failures'] += 1
+                    raise
+                self.stats['retries'] += 1
+                if retry_after is not None:
+                    # 服务端指定了等待时间，暂停这个接口的额度
+                    endpoint.budget.pause(min(retry_after, self.max_retry_after))
+                elif not alternative:
+                    await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_cap))
+                attempt += 1
+                continue
+            except BaseException:
+                await endpoint.limiter.abandon()
+                self.router.finish(endpoint, ok=False)
+                raise
+            result.latency = time.monotonic() - started
+            await endpoint.limiter.release(started, latency=result.latency)
+            self.router.finish(endpoint, ok=True)
+            self.metrics.record_call(endpoint.label, result.finish_reason if result.truncated else 'ok',
+                                     result.latency, result.prompt_tokens, result.completion_tokens)
+            break
+        endpoint.budget.settle(estimated, result.total_tokens)
+        if result.truncated:
+            self.stats['truncated'] += 1
+        # 被截断的回复不缓存，下次重新请求
+        if key is not None and result.text and not result.truncated:
+            self.cache.put(key, {
+                'text': result.text,
+                'prompt_tokens': result.prompt_tokens,
+                'completion_tokens': result.completion_tokens
+            })
+        return result
+
+    def summary(self):
+        stats = self.stats
+        endpoints = self.router.endpoints if self.router else []
+        limit = sum(e.limiter.current for e in endpoints)
+        peak = sum(int(e.limiter.peak) for e in endpoints)
+        waited = sum(e.budget.waited for e in endpoints)
+        text = (f"请求 {stats['requests']} 次，重试 {stats['retries']} 次，过载 {stats['throttled']} 次，"
+                f"放弃 {stats['failures']} 次，截断 {stats['truncated']} 次；并发上限 {limit}（峰值 {peak}），"
+                f"各请求累计等待限额 {waited:.1f} 秒")
+        if len(endpoints) > 1:
+            text += f"\n   {self.router.summary()}"
+        return text
+
+    async def close(self):
+        self.metrics.close()
+        if self.router is not None:
+            print(f"📈 {self.summary()}")
+            print(f"⏱️ {self.metrics.summary()}")
+            for endpoint in self.router.endpoints:
+                await endpoint.client.close()
+                if endpoint.sync_client is not None:
+                    endpoint.sync_client.close()
+        if self.cache is not None:
+            print(f"📦 {self.cache.summary()}")
+            self.cache.close()
+
+
+def add_engine_arguments(parser):
+    """给生成脚本的命令行加上并发控制和限额的参数"""
+    parser.add_argument("--no-adaptive", dest="adaptive", action="store_false",
+                        help="固定使用最大并发数，不随限流情况调整")
+    parser.add_argument("--min-concurrency", type=int, default=1, help="自适应调整时并发数的下限")
+    parser.add_argument("--rpm", type=int, default=0, help="每分钟请求数限额，0 表示不限")
+    parser.add_argument("--tpm", type=int, default=0, help="每分钟 token 数限额，0 表示不限")
+    parser.add_argument("--max-retries", type=int, default=4, help="单个请求最多重试的次数")
+    parser.add_argument("--latency-target", type=float, default=None, help="请求耗时超过这么多秒就不再提高并发")
+    parser.add_argument("--endpoints", default=None, help="多接口列表文件（JSON），默认读取环境变量 LLM_ENDPOINTS")
+    parser.add_argument("--cooldown", type=float, default=30.0, help="接口连续失败被熔断后的冷却秒数")
+    add_metrics_arguments(parser)
+
+
+def engine_options_from_args(args):
+    return {
+        'adaptive': args.adaptive,
+        'min_concurrency': args.min_concurrency,
+        'rpm': args.rpm,
+        'tpm': args.tpm,
+        'max_retries': args.max_retries,
+        'latency_target': args.latency_target,
+        'endpoints_file': args.endpoints,
+        'cooldown': args.cooldown,
+        **metrics_options_from_args(args)
+    }
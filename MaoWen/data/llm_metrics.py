@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM 调用的指标与进度
+引擎每完成一次调用就记一条记录：耗时、输入/输出 token、状态（ok、cached、429、timeout、截断等）和接口，
+重试中失败的那几次也各记一条。LLMMetrics 把记录汇总成累计数、最近一段时间的吞吐率和耗时分位数，
+生成脚本再按阶段记下完成了多少篇文章、多少个问题。
+汇总结果可以写成 JSON 或 Prometheus 文本格式的文件（后者可交给 node_exporter 的 textfile 收集器），
+并且每隔 progress_interval 秒打印一行进度（完成数、ETA、QA/s、tokens/s），代替逐条打印。
+"""
+
+import json
+import os
+import time
+from collections import deque
+
+LATENCY_SAMPLES = 4096
+QUANTILES = (0.5, 0.9, 0.99)
+METRIC_PREFIX = "maowen"
+
+
+def percentile(values, q):
+    """最近秩法求百分位数，values 为空时返回 0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(max(int(len(ordered) * q / 100 + 0.5) - 1, 0), len(ordered) - 1)
+    return ordered[index]
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def format_count(value):
+    return f"{value / 1000:.1f}k" if value >= 1000 else f"{value:.0f}"
+
+
+class RollingRate:
+    """最近 window 秒内的累计量，用来计算滑动窗口的速率；按秒分桶，内存与调用频率无关"""
+
+    def __init__(self, window):
+        self.window = window
+        # [秒, 这一秒内的累计量]
+        self.events = deque()
+        self.total = 0.0
+
+    def add(self, amount, now):
+        second = int(now)
+        if self.events and self.events[-1][0] == second:
+            self.events[-1][1] += amount
+        else:
+            self.events.append([second, amount])
+        self.total += amount
+        self.trim(now)
+
+    def trim(self, now):
+        while self.events and self.events[0][0] <= now - self.window:
+            self.total -= self.events.popleft()[1]
+
+    def rate(self, now, since):
+        """每秒的量；开始不到一个窗口时按实际经过的时间计算"""
+        self.trim(now)
+        span = min(self.window, now - since)
+        return self.total / span if span > 0 else 0.0
+
+
+class StageProgress:
+    """一个阶段的进度：done/total 按 unit 计（文章或问题），items 为产出的记录数"""
+
+    def __init__(self, name, total, unit, item_unit, window, now):
+        self.name = name
+        self.total = total
+        self.unit = unit
+        self.item_unit = item_unit
+        # 总数还在增长（融合流水线中答案阶段的问题陆续到来）时不估计剩余时间
+        self.open = total is None
+        self.done = 0
+        self.items = 0
+        self.started = now
+        self.done_rate = RollingRate(window)
+        self.item_rate = RollingRate(window)
+
+    def eta(self, now):
+        if self.open or not self.total:
+            return None
+        rate = self.done_rate.rate(now, self.started)
+        remaining = self.total - self.done
+        if remaining <= 0:
+            return 0.0
+        return remaining / rate if rate > 0 else None
+
+    def snapshot(self, now):
+        eta = self.eta(now)
+        return {
+            'done': self.done,
+            'total': self.total or 0,
+            'unit': self.unit,
+            'items': self.items,
+            'item_unit': self.item_unit,
+            'done_per_second': round(self.done_rate.rate(now, self.started), 3),
+            'items_per_second': round(self.item_rate.rate(now, self.started), 3),
+            'eta_seconds': round(eta, 1) if eta is not None else None
+        }
+
+
+class EndpointStats:
+    def __init__(self, price_prompt, price_completion):
+        # 状态 -> 次数
+        self.calls = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        # 每百万 token 的价格
+        self.price_prompt = price_prompt
+        self.price_completion = price_completion
+
+    @property
+    def cost(self):
+        return (self.prompt_tokens * self.price_prompt + self.completion_tokens * self.price_completion) / 1e6
+
+
+class LLMMetrics:
+    """
+    LLM 调用和各阶段进度的汇总。所有方法都在事件循环线程里调用，不加锁。
+    metrics_file 不为空时每次打印进度和结束时写出指标文件，后缀为 .prom 时用 Prometheus 文本格式，否则用 JSON；
+    progress_interval 为 0 时不打印进度行。price_prompt/price_completion 为每百万 token 的价格，用来估算花费
+    """
+
+    def __init__(self, metrics_file=None, progress_interval=10.0, window=60.0, price_prompt=0.0,
+                 price_completion=0.0):
+        self.metrics_file = metrics_file
+        self.progress_interval = progress_interval
+        self.window = window
+        self.price_prompt = price_prompt
+        self.price_completion = price_completion
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.endpoints = {}
+        self.stages = {}
+        self.request_rate = RollingRate(window)
+        self.token_rate = RollingRate(window)
+
+    def register_endpoint(self, label, price_prompt=None, price_completion=None):
+        """接口自己配置了价格时覆盖默认价格"""
+        self.endpoints[label] = EndpointStats(
+            self.price_prompt if price_prompt is None else price_prompt,
+            self.price_completion if price_completion is None else price_completion)
+
+    def endpoint(self, label):
+        if label not in self.endpoints:
+            self.register_endpoint(label)
+        return self.endpoints[label]
+
+    def record_call(self, endpoint, status, latency=0.0, prompt_tokens=0, completion_tokens=0):
+        """记录一次调用；缓存命中（status 为 'cached'）不计入耗时和吞吐率"""
+        stats = self.endpoint(endpoint)
+        stats.calls[status] = stats.calls.get(status, 0) + 1
+        stats.prompt_tokens += prompt_tokens
+        stats.completion_tokens += completion_tokens
+        if status != 'cached':
+            now = time.monotonic()
+            stats.latencies.append(latency)
+            stats.latency_sum += latency
+            stats.latency_count += 1
+            self.request_rate.add(1, now)
+            self.token_rate.add(prompt_tokens + completion_tokens, now)
+        self.maybe_report()
+
+    def start_stage(self, name, total=None, unit="个", item_unit="个"):
+        """开始一个阶段；total 为空表示总数未知，之后用 add_total 累加"""
+        self.stages[name] = StageProgress(name, total, unit, item_unit, self.window, time.monotonic())
+
+    def add_total(self, name, count):
+        stage = self.stages[name]
+        stage.total = (stage.total or 0) + count
+
+    def advance(self, name, done=0, items=0):
+        """阶段完成 done 个单位、产出 items 条记录"""
+        stage = self.stages.get(name)
+        if stage is None:
+            return
+        now = time.monotonic()
+        if done:
+            stage.done += done
+            stage.done_rate.add(done, now)
+        if items:
+            stage.items += items
+            stage.item_rate.add(items, now)
+        self.maybe_report()
+
+    def snapshot(self):
+        """当前的全部指标，结构与 JSON 文件相同"""
+        now = time.monotonic()
+        endpoints = {}
+        for label, stats in self.endpoints.items():
+            latencies = list(stats.latencies)
+            endpoints[label] = {
+                'calls': dict(stats.calls),
+                'prompt_tokens': stats.prompt_tokens,
+                'completion_tokens': stats.completion_tokens,
+                'latency_seconds': {f"p{int(q * 100)}": round(percentile(latencies, q * 100), 3)
+                                    for q in QUANTILES},
+                'latency_sum': round(stats.latency_sum, 3),
+                'latency_count': stats.latency_count,
+                'cost': round(stats.cost, 4)
+            }
+        return {
+            'timestamp': time.time(),
+            'elapsed_seconds': round(now - self.started, 1),
+            'requests_per_second': round(self.request_rate.rate(now, self.started), 3),
+            'tokens_per_second': round(self.token_rate.rate(now, self.started), 1),
+            'endpoints': endpoints,
+            'stages': {name: stage.snapshot(now) for name, stage in self.stages.items()}
+        }
+
+    def latency_samples(self):
+        return [latency for stats in self.endpoints.values() for latency in stats.latencies]
+
+    def status_count(self, status):
+        return sum(stats.calls.get(status, 0) for stats in self.endpoints.values())
+
+    def progress_line(self):
+        now = time.monotonic()
+        parts = []
+        for stage in self.stages.values():
+            text = f"{stage.name} {stage.done}/{stage.total or '?'}{stage.unit}"
+            if stage.total and not stage.open:
+                text += f" ({stage.done / stage.total * 100:.1f}%)"
+            text += f" {stage.item_rate.rate(now, stage.started):.1f} {stage.item_unit}/s"
+            eta = stage.eta(now)
+            if eta is not None:
+                text += f" ETA {format_duration(eta)}"
+            parts.append(text)
+        latencies = self.latency_samples()
+        llm = (f"LLM {self.request_rate.rate(now, self.started):.1f} 次/s "
+               f"{format_count(self.token_rate.rate(now, self.started))} tokens/s")
+        if latencies:
+            llm += f" p50 {percentile(latencies, 50):.1f}s p99 {percentile(latencies, 99):.1f}s"
+        throttled = self.status_count('429')
+        if throttled:
+            llm += f" 429×{throttled}"
+        parts.append(llm)
+        parts.append(f"用时 {format_duration(now - self.started)}")
+        return "📊 " + " | ".join(parts)
+
+    def maybe_report(self, force=False):
+        """距上次报告超过 progress_interval 秒时打印进度行并写出指标文件"""
+        now = time.monotonic()
+        if not force and now - self.last_report < (self.progress_interval or float('inf')):
+            return
+        self.last_report = now
+        if self.progress_interval:
+            print(self.progress_line())
+        if self.metrics_file:
+            self.export()
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{escape_label(val)}"' for key, val in labels.items())
+                lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}" if label_text
+                             else f"{METRIC_PREFIX}_{name} {value}")
+
+        endpoints = snapshot['endpoints']
+        metric("llm_calls_total", "counter", "LLM calls by endpoint and status",
+               [({'endpoint': label, 'status': status}, count)
+                for label, stats in endpoints.items() for status, count in stats['calls'].items()])
+        metric("llm_tokens_total", "counter", "Tokens used by endpoint",
+               [({'endpoint': label, 'kind': kind}, stats[f"{kind}_tokens"])
+                for label, stats in endpoints.items() for kind in ('prompt', 'completion')])
+        latency = []
+        for label, stats in endpoints.items():
+            latency.extend(({'endpoint': label, 'quantile': str(q)}, stats['latency_seconds'][f"p{int(q * 100)}"])
+                           for q in QUANTILES)
+        metric("llm_latency_seconds", "summary", "LLM call latency over recent calls", latency)
+        lines.extend(f'{METRIC_PREFIX}_llm_latency_seconds_{suffix}{{endpoint="{escape_label(label)}"}} '
+                     f'{stats[f"latency_{suffix}"]}'
+                     for label, stats in endpoints.items() for suffix in ('sum', 'count'))
+        metric("llm_cost_total", "counter", "Estimated cost by endpoint",
+               [({'endpoint': label}, stats['cost']) for label, stats in endpoints.items()])
+        metric("llm_requests_per_second", "gauge", "Rolling LLM request rate",
+               [({}, snapshot['requests_per_second'])])
+        metric("llm_tokens_per_second", "gauge", "Rolling LLM token throughput",
+               [({}, snapshot['tokens_per_second'])])
+        stages = snapshot['stages']
+        metric("stage_done", "gauge", "Units finished per stage",
+               [({'stage': name}, stage['done']) for name, stage in stages.items()])
+        metric("stage_total", "gauge", "Units to finish per stage",
+               [({'stage': name}, stage['total']) for name, stage in stages.items()])
+        metric("stage_items_total", "counter", "Records produced per stage",
+               [({'stage': name}, stage['items']) for name, stage in stages.items()])
+        metric("stage_items_per_second", "gauge", "Rolling record throughput per stage",
+               [({'stage': name}, stage['items_per_second']) for name, stage in stages.items()])
+        metric("stage_eta_seconds", "gauge", "Estimated seconds until the stage finishes",
+               [({'stage': name}, stage['eta_seconds']) for name, stage in stages.items()
+                if stage['eta_seconds'] is not None])
+        return "\n".join(lines) + "\n"
+
+    def export(self, path=None):
+        """写出指标文件；先写临时文件再替换，读取方不会读到写了一半的文件"""
+        path = str(path or self.metrics_file)
+        if path.endswith('.prom'):
+            text = self.to_prometheus()
+        else:
+            text = json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"❌ 写入指标文件 {path} 失败: {e}")
+
+    def summary(self):
+        latencies = self.latency_samples()
+        calls = sum(sum(stats.calls.values()) for stats in self.endpoints.values())
+        failed = sum(count for stats in self.endpoints.values() for status, count in stats.calls.items()
+                     if status not in ('ok', 'cached'))
+        prompt = sum(stats.prompt_tokens for stats in self.endpoints.values())
+        completion = sum(stats.completion_tokens for stats in self.endpoints.values())
+        text = f"调用 {calls} 次（缓存 {self.status_count('cached')} 次，出错或截断 {failed} 次）"
+        if latencies:
+            text += (f"，耗时 p50 {percentile(latencies, 50):.2f}s p90 {percentile(latencies, 90):.2f}s "
+                     f"p99 {percentile(latencies, 99):.2f}s")
+        text += f"，输入 {prompt} tokens，输出 {completion} tokens"
+        cost = sum(stats.cost for stats in self.endpoints.values())
+        if cost:
+            text += f"，估计花费 {cost:.2f}"
+        return text
+
+    def close(self):
+        """打印最后一行进度，写出最终的指标文件"""
+        if self.stages or self.endpoints:
+            self.maybe_report(force=True)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def add_metrics_arguments(parser):
+    """给生成脚本的命令行加上进度和指标文件的参数"""
+    parser.add_argument("--metrics-file", default=None,
+                        help="定期写出 LLM 调用指标的文件，.prom 后缀为 Prometheus 文本格式，否则为 JSON")
+    parser.add_argument("--progress-interval", type=float, default=10.0, help="每隔这么多秒打印一行进度，0 表示不打印")
+    parser.add_argument("--price-prompt", type=float, default=0.0, help="每百万输入 token 的价格，用来估算花费")
+    parser.add_argument("--price-completion", type=float, default=0.0, help="每百万输出 token 的价格")
+
+
+def metrics_options_from_args(args):
+    return {
+        'metrics_file': args.metrics_file,
+        'progress_interval': args.progress_interval,
+        'price_prompt': args.price_prompt,
+        'price_completion': args.price_completion
+    }
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多个 LLM 接口之间的负载均衡与故障切换
+每个接口（base URL、密钥、模型名、权重、RPM/TPM 限额、并发上限）有自己的客户端、
+AIMD 并发限制器和限额令牌桶。每次请求按 权重 x 当前余量 加权随机选一个接口，
+余量取最近一分钟请求数和在途请求数两者中更紧的一项。
+连续失败的接口由熔断器摘除，冷却一段时间后放行一个试探请求，成功才恢复。
+
+接口列表是一个 JSON 文件，例如：
+[
+    {"name": "deepseek", "base_url": "https://api.deepseek.com", "api_key_env": "DEEPSEEK_API_KEY",
+     "model": "deepseek-chat", "weight": 2, "rpm": 600, "price_prompt": 2, "price_completion": 8},
+    {"name": "backup", "base_url": "https://example.com/v1", "api_key_env": "BACKUP_API_KEY",
+     "model": "deepseek-chat", "weight": 1, "rpm": 120, "max_concurrency": 16}
+]
+密钥写在环境变量（或 .env）里，文件中用 api_key_env 指定变量名；也可以直接写 api_key。
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import openai
+from dotenv import load_dotenv
+
+from llm_control import AdaptiveConcurrency, RateBudget
+
+DEFAULT_ENDPOINTS_ENV = "LLM_ENDPOINTS"
+
+
+@dataclass
+class EndpointConfig:
+    base_url: str = None
+    api_key: str = None
+    model: str = "deepseek-chat"
+    name: str = None
+    weight: float = 1.0
+    rpm: int = 0
+    tpm: int = 0
+    # 为空时使用引擎的 max_concurrency
+    max_concurrency: int = None
+    # 每百万输入/输出 token 的价格，为空时使用 --price-prompt/--price-completion
+    price_prompt: float = None
+    price_completion: float = None
+
+    @property
+    def label(self):
+        return self.name or self.base_url or "default"
+
+
+def load_endpoints(path=None):
+    """
+    读取接口列表文件，path 为空时读取环境变量 LLM_ENDPOINTS 指定的文件；
+    都没有时返回 None，表示沿用 OPENAI_API_KEY / OPENAI_BASE_URL 的单个接口
+    """
+    load_dotenv()
+    path = path or os.getenv(DEFAULT_ENDPOINTS_ENV)
+    if not path:
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{path} 应该是一个非空的 JSON 数组")
+    configs = []
+    for entry in entries:
+        entry = dict(entry)
+        key_env = entry.pop('api_key_env', None)
+        if key_env and not entry.get('api_key'):
+            entry['api_key'] = os.getenv(key_env)
+            if not entry['api_key']:
+                raise ValueError(f"环境变量 {key_env} 没有设置")
+        configs.append(EndpointConfig(**entry))
+    return configs
+
+
+class CircuitBreaker:
+    """
+    连续失败 failure_threshold 次后断开，cooldown 秒内不再放行请求；
+    冷却结束后只放行一个试探请求，成功则恢复，失败则再冷却一次
+    """
+
+    def __init__(self, failure_threshold=5, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.trips = 0
+
+    @property
+    def is_open(self):
+        return self.failures >= self.failure_threshold
+
+    def allow(self, now):
+        """能否向这个接口发送请求（不改变状态）"""
+        if not self.is_open:
+            return True
+        return now >= self.open_until and not self.probing
+
+    def on_send(self, now):
+        if self.is_open and now >= self.open_until:
+            self.probing = True
+
+    def record_success(self):
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self, now, trip=False):
+        """trip 为真时直接断开（例如密钥无效）"""
+        was_open = self.is_open
+        self.failures = self.failure_threshold if trip else self.failures + 1
+        if self.is_open:
+            if not was_open or self.probing:
+                self.trips += 1
+            self.open_until = now + self.cooldown
+            self.probing = False
+
+
+class Endpoint:
+    """一个接口的客户端、并发限制器、限额和健康状态"""
+
+    def __init__(self, config, max_concurrency, timeout, adaptive=True, min_concurrency=1, rpm=0, tpm=0,
+                 latency_target=None, failure_threshold=5, cooldown=30.0):
+        self.config = config
+        self.model = config.model
+        self.timeout = timeout
+        self.client = openai.AsyncOpenAI(**self.client_params())
+        self.sync_client = None
+        self.sync_client_lock = threading.Lock()
+        self.limiter = AdaptiveConcurrency(config.max_concurrency or max_concurrency, min_concurrency,
+                                           adaptive=adaptive, latency_target=latency_target)
+        # AIMD 限制器只能在事件循环里用，线程池里的同步请求用固定上限的信号量
+        self.sync_slots = threading.BoundedSemaphore(self.limiter.max_limit)
+        self.budget = RateBudget(config.rpm or rpm, config.tpm or tpm)
+        self.rpm = config.rpm or rpm
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self.in_flight = 0
+        # 最近一分钟发出请求的时间，用来估计 RPM 余量
+        self.recent = deque()
+        self.stats = {'requests': 0, 'failures': 0}
+
+    def client_params(self):
+        # 重试由引擎自己负责，客户端不再重试
+        params = {"api_key": self.config.api_key, "timeout": self.timeout, "max_retries": 0}
+        if self.config.base_url:
+            params["base_url"] = self.config.base_url
+        return params
+
+    def get_sync_client(self):
+        """同步客户端，给在线程池里调用的评分函数使用"""
+        with self.sync_client_lock:
+            if self.sync_client is None:
+                self.sync_client = openai.OpenAI(**self.client_params())
+            return self.sync_client
+
+    def headroom(self, now):
+        """0 到 1 之间的余量：RPM 余量和并发余量中较小的一个"""
+        while self.recent and self.recent[0] <= now - 60:
+            self.recent.popleft()
+        rpm_room = 1 - len(self.recent) / self.rpm if self.rpm else 1.0
+        concurrency_room = 1 - self.in_flight / max(self.limiter.current, 1)
+        return max(min(rpm_room, concurrency_room), 0.0)
+
+    @property
+    def label(self):
+        return self.config.label
+
+
+class LLMRouter:
+    """
+    在多个接口之间分配请求。select 和 finish 之间用锁保护，
+    既可以在事件循环里调用，也可以在评分函数的线程池里调用
+    """
+
+    def __init__(self, endpoints):
+        if not endpoints:
+            raise ValueError("至少需要一个接口")
+        self.endpoints = endpoints
+        self.lock = threading.Lock()
+        self.rng = random.Random()
+
+    @classmethod
+    def from_configs(cls, configs, max_concurrency=64, timeout=600, **options):
+        """按接口配置创建路由，options 传给每个 Endpoint（自适应并发、默认限额、熔断参数等）"""
+        return cls([Endpoint(config, max_concurrency, timeout, **options) for config in configs])
+
+    def select(self, avoid=None):
+        """
+        按 权重 x 余量 加权随机选一个熔断器放行的接口，尽量避开 avoid（上次失败的接口）；
+        所有接口都被熔断时返回最早恢复的那个
+        """
+        with self.lock:
+            now = time.monotonic()
+            allowed = [e for e in self.endpoints if e.breaker.allow(now)]
+            if len(allowed) > 1 and avoid in allowed:
+                allowed.remove(avoid)
+            if not allowed:
+                endpoint = min(self.endpoints, key=lambda e: e.breaker.open_until)
+            else:
+                scores = [e.config.weight * e.headroom(now) for e in allowed]
+                if sum(scores) > 0:
+                    endpoint = self.rng.choices(allowed, weights=scores)[0]
+                else:
+                    # 都没有余量时按权重选，请求在该接口的限制器里排队
+                    endpoint = self.rng.choices(allowed, weights=[e.config.weight for e in allowed])[0]
+            endpoint.breaker.on_send(now)
+            endpoint.in_flight += 1
+            endpoint.recent.append(now)
+            endpoint.stats['requests'] += 1
+            return endpoint
+
+    def finish(self, endpoint, ok, failed=False, trip=False):
+        """
+        记录一次请求的结果：ok 为真表示成功；failed 为真表示这次失败应计入熔断器
+        （超时、连接错误、429/5xx），trip 为真表示直接熔断（密钥无效等）
+        """
+        with self.lock:
+            endpoint.in_flight -= 1
+            if ok:
+                endpoint.breaker.record_success()
+            elif failed or trip:
+                endpoint.stats['failures'] += 1
+                endpoint.breaker.record_failure(time.monotonic(), trip=trip)
+            else:
+                # 请求本身的问题（例如参数错误）不说明接口是否健康，试探请求作废，下次重新试探
+                endpoint.breaker.probing = False
+
+    def cancel(self, endpoint):
+        """撤销一次 select（请求最终没有发给这个接口）"""
+        with self.lock:
+            endpoint.in_flight -= 1
+            endpoint.stats['requests'] -= 1
+            endpoint.breaker.probing = False
+
+    def tripped_since(self, endpoint):
+        """选中 endpoint 之后它是否已被熔断（排队期间其他请求连续失败）"""
+        with self.lock:
+            return endpoint.breaker.is_open and time.monotonic() < endpoint.breaker.open_until
+
+    def has_alternative(self, endpoint):
+        """除 endpoint 之外还有没有可用的接口"""
+        with self.lock:
+            now = time.monotonic()
+            return any(e is not endpoint and e.breaker.allow(now) for e in self.endpoints)
+
+    @property
+    def max_concurrency(self):
+        return sum(e.limiter.max_limit for e in self.endpoints)
+
+    def summary(self):
+        parts = []
+        for e in self.endpoints:
+            state = "熔断" if e.breaker.is_open else "正常"
+            parts.append(f"{e.label}: 请求 {e.stats['requests']} 次，失败 {e.stats['failures']} 次，"
+                         f"熔断 {e.breaker.trips} 次，并发上限 {e.limiter.current}，{state}")
+        return "；".join(parts)
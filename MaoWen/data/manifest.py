@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量爬取清单
+记录每个 URL 的 ETag / Last-Modified / 内容哈希及其对应的输出目录，
+下次爬取时据此发送条件请求，并跳过没有变化的文章。
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+
+def content_hash(data):
+    """计算页面原始字节的哈希"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class CrawlManifest:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            self.entries = json.load(f)
+
+    def save(self):
+        """先写临时文件再替换，避免中途退出留下损坏的清单"""
+        with self.lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def get(self, url):
+        with self.lock:
+            entry = self.entries.get(url)
+            return dict(entry) if entry else None
+
+    def update(self, url, **fields):
+        with self.lock:
+            entry = self.entries.setdefault(url, {})
+            entry.update(fields)
+
+    def conditional_headers(self, url):
+        """根据上次记录生成 If-None-Match / If-Modified-Since 请求头"""
+        entry = self.get(url)
+        headers = {}
+        if not entry:
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
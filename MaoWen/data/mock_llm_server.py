@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟的 OpenAI 兼容对话接口
+按提示内容返回固定格式的 JSON：问题生成返回问题列表，批量作答返回带 id 的答案列表，
+单个问题返回答案文本，评分返回分数。响应延迟按指定分布抽样，另外可以模拟每个输出 token 的耗时。
+可以设置同时在途请求数、每分钟请求数和 token 数的上限，超出时返回 429（带 Retry-After），
+也可以按比例随机注入 429 和 5xx。请求带 stream 时按 SSE 逐段返回，
+还可以按比例模拟达到 max_tokens 被截断的回复和中途断开的流。不需要 API 密钥，也不产生费用。
+
+用法:
+    python mock_llm_server.py --port 18080 --latency 0.5 --max-inflight 16
+    OPENAI_BASE_URL=http://127.0.0.1:18080/v1 OPENAI_API_KEY=mock python gen_question.py
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_engine import estimate_tokens
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'exponential', 'lognormal')
+
+TITLE_RE = re.compile(r'文章标题：(.*)')
+SCORE_MARKER = "请直接给出你的打分"
+
+
+def sample_latency(rng, mean, distribution='lognormal', sigma=0.5):
+    """按分布抽样一次延迟，各分布的均值都是 mean"""
+    if mean <= 0:
+        return 0.0
+    if distribution == 'fixed':
+        return mean
+    if distribution == 'uniform':
+        return rng.uniform(0, 2 * mean)
+    if distribution == 'exponential':
+        return rng.expovariate(1 / mean)
+    # 对数正态分布的长尾更接近真实服务的延迟
+    return rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+
+
+def canned_questions(user_prompt, count):
+    """问题生成：根据标题和正文片段拼出 count 个互不相同的问题"""
+    match = TITLE_RE.search(user_prompt)
+    title = match.group(1).strip() if match else "文章"
+    body = user_prompt.split("：\n", 1)[-1].replace("\n", "")
+    step = max(len(body) // (count + 1), 1)
+    return [
+        {"question": f"《{title}》中关于“{body[i * step:i * step + 12]}”的论述说明了什么？"}
+        for i in range(count)
+    ]
+
+
+def canned_batch_answers(user_prompt, answer_chars):
+    """批量作答：按编号逐个回答 “问题：” 之后列出的问题"""
+    block = user_prompt.rsplit("问题：\n", 1)[-1].split("\n\n", 1)[0]
+    answers = []
+    for line in block.splitlines():
+        number, _, question = line.partition(". ")
+        if number.isdigit():
+            answers.append({"id": int(number), "answer": canned_answer(question, answer_chars)})
+    return answers
+
+
+def canned_answer(question, answer_chars):
+    text = f"根据文章，{question.strip()}"
+    return (text * (answer_chars // max(len(text), 1) + 1))[:answer_chars]
+
+
+def render_response(system_prompt, user_prompt, questions_per_article=5, answer_chars=200):
+    """根据提示的类型返回固定格式的输出文本"""
+    if SCORE_MARKER in user_prompt:
+        return "8"
+    if '"question"' in system_prompt:
+        return json.dumps(canned_questions(user_prompt, questions_per_article), ensure_ascii=False)
+    if '"id"' in system_prompt:
+        return json.dumps(canned_batch_answers(user_prompt, answer_chars), ensure_ascii=False)
+    question = user_prompt.rsplit("\n问题：", 1)[-1].split("\n", 1)[0]
+    return canned_answer(question, answer_chars)
+
+
+class MockLLMServer:
+    """
+    模拟的对话接口服务。max_inflight、rpm、tpm 为 0 时不限；
+    throttle_rate 和 error_rate 为随机返回 429 和 500 的比例；
+    retry_after 不为空时，同时在途请求数超限和随机 429 都带上这个 Retry-After
+    """
+
+    def __init__(self, latency=0.2, distribution='lognormal', sigma=0.5, token_latency=0.0,
+                 max_inflight=0, rpm=0, tpm=0, throttle_rate=0.0, error_rate=0.0, retry_after=None,
+                 truncate_rate=0.0, disconnect_rate=0.0, stream_chunk_chars=8,
+                 questions_per_article=5, answer_chars=200, seed=None, port=0):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"延迟分布只能是 {', '.join(LATENCY_DISTRIBUTIONS)}")
+        self.latency = latency
+        self.distribution = distribution
+        self.sigma = sigma
+        self.token_latency = token_latency
+        self.max_inflight = max_inflight
+        self.rpm = rpm
+        self.tpm = tpm
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.truncate_rate = truncate_rate
+        self.disconnect_rate = disconnect_rate
+        self.stream_chunk_chars = stream_chunk_chars
+        self.questions_per_article = questions_per_article
+        self.answer_chars = answer_chars
+        self.port = port
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        # 最近 60 秒内接受的请求：(时间, token 数)
+        self.window = deque()
+        self.in_flight = 0
+        self.server = None
+        self.thread = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {'requests': 0, 'completed': 0, 'throttled': 0, 'errors': 0, 'peak_in_flight': 0,
+                          'truncated': 0, 'disconnected': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+
+    def admit(self, tokens):
+        """
+        判断请求能否被接受，返回 None 表示接受，否则返回 (状态码, Retry-After 秒数)
+        """
+        with self.lock:
+            self.stats['requests'] += 1
+            now = time.monotonic()
+            while self.window and self.window[0][0] <= now - 60:
+                self.window.popleft()
+            rejection = None
+            if self.max_inflight and self.in_flight >= self.max_inflight:
+                rejection = (429, self.retry_after)
+            elif self.rpm and len(self.window) >= self.rpm:
+                rejection = (429, self.window[0][0] + 60 - now)
+            elif self.tpm and self.window and sum(t for _, t in self.window) + tokens > self.tpm:
+                rejection = (429, self.window[0][0] + 60 - now)
+            elif self.rng.random() < self.throttle_rate:
+                rejection = (429, self.retry_after)
+            elif self.rng.random() < self.error_rate:
+                rejection = (500, None)
+            if rejection is not None:
+                self.stats['throttled' if rejection[0] == 429 else 'errors'] += 1
+                return rejection
+            self.window.append((now, tokens))
+            self.in_flight += 1
+            self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self.in_flight)
+            return None
+
+    def prepare(self, body, stream=False):
+        """
+        生成一个已接受请求的回复，返回 (文本, 结束原因, 输入 token 数, 输出 token 数, 首字延迟, 断开位置)；
+        断开位置为 None 表示完整发送
+        """
+        messages = body.get('messages', [])
+        system_prompt = next((m['content'] for m in messages if m.get('role') == 'system'), "")
+        user_prompt = next((m['content'] for m in reversed(messages) if m.get('role') == 'user'), "")
+        text = render_response(system_prompt, user_prompt, self.questions_per_article, self.answer_chars)
+        finish_reason = "stop"
+        cut = None
+        with self.lock:
+            delay = sample_latency(self.rng, self.latency, self.distribution, self.sigma)
+            if self.rng.random() < self.truncate_rate:
+                # 模拟达到 max_tokens：回复在中间某处被截断
+                text = text[:self.rng.randint(1, max(len(text) - 1, 1))]
+                finish_reason = "length"
+                self.stats['truncated'] += 1
+            elif stream and self.rng.random() < self.disconnect_rate:
+                cut = self.rng.randint(1, max(len(text) - 1, 1))
+                self.stats['disconnected'] += 1
+        prompt_tokens = sum(estimate_tokens(m.get('content') or "") for m in messages)
+        return text, finish_reason, prompt_tokens, estimate_tokens(text), delay, cut
+
+    def record(self, prompt_tokens, completion_tokens):
+        with self.lock:
+            self.stats['completed'] += 1
+            self.stats['prompt_tokens'] += prompt_tokens
+            self.stats['completion_tokens'] += completion_tokens
+            return self.stats['completed']
+
+    def complete(self, body):
+        """处理一个已接受的非流式请求，返回响应 JSON"""
+        text, finish_reason, prompt_tokens, completion_tokens, delay, _ = self.prepare(body)
+        time.sleep(delay + completion_tokens * self.token_latency)
+        number = self.record(prompt_tokens, completion_tokens)
+        return {
+            "id": f"chatcmpl-mock-{number}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get('model', 'mock'),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                         "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        }
+
+    def stream_events(self, body):
+        """
+        处理一个已接受的流式请求，逐个产出 SSE 事件（字节串）；
+        首个事件前等待首字延迟，之后每段文本按输出 token 数等待
+        """
+        text, finish_reason, prompt_tokens, completion_tokens, delay, cut = self.prepare(body, stream=True)
+        created = int(time.time())
+        model = body.get('model', 'mock')
+
+        def event(choices, usage=None):
+            payload = {"id": "chatcmpl-mock-stream", "object": "chat.completion.chunk", "created": created,
+                       "model": model, "choices": choices}
+            if usage is not None:
+                payload["usage"] = usage
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        time.sleep(delay)
+        step = max(self.stream_chunk_chars, 1)
+        for start in range(0, len(text), step):
+            piece = text[start:start + step]
+            if cut is not None and start + len(piece) > cut:
+                # 模拟连接中途断开：发出断开位置之前的部分后直接结束，不发结束标记
+                yield event([{"index": 0, "delta": {"content": piece[:cut - start]}, "finish_reason": None}])
+                return
+            delta = {"content": piece}
+            if start == 0:
+                delta["role"] = "assistant"
+            time.sleep(estimate_tokens(piece) * self.token_latency)
+            yield event([{"index": 0, "delta": delta, "finish_reason": None}])
+        yield event([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+        self.record(prompt_tokens, completion_tokens)
+        if (body.get('stream_options') or {}).get('include_usage'):
+            yield event([], {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                             "total_tokens": prompt_tokens + completion_tokens})
+        yield b"data: [DONE]\n\n"
+
+    def make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def send_json(self, status, payload, retry_after=None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if retry_after is not None:
+                    self.send_header("Retry-After", f"{max(retry_after, 0):.2f}")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self.send_json(400, {"error": {"message": "invalid JSON body", "type": "invalid_request_error"}})
+                    return
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_json(404, {"error": {"message": f"unknown path {self.path}", "type": "not_found"}})
+                    return
+                tokens = sum(estimate_tokens(m.get('content') or "") for m in body.get('messages', []))
+                rejection = server.admit(tokens)
+                if rejection is not None:
+                    status, retry_after = rejection
+                    kind = "rate_limit_exceeded" if status == 429 else "server_error"
+                    self.send_json(status, {"error": {"message": f"mock {kind}", "type": kind}}, retry_after)
+                    return
+                try:
+                    if body.get('stream'):
+                        self.send_stream(server.stream_events(body))
+                    else:
+                        self.send_json(200, server.complete(body))
+                finally:
+                    with server.lock:
+                        server.in_flight -= 1
+
+            def send_stream(self, events):
+                # 不知道总长度，发完后关闭连接
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                for data in events:
+                    self.wfile.write(data)
+                    self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """启动服务，返回 base_url（以 /v1 结尾）"""
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def summary(self):
+        stats = self.stats
+        return (f"收到 {stats['requests']} 个请求，完成 {stats['completed']} 个，429 {stats['throttled']} 个，"
+                f"5xx {stats['errors']} 个，截断 {stats['truncated']} 个，断开 {stats['disconnected']} 个，最多同时 {stats['peak_in_flight']} 个；"
+                f"输入 {stats['prompt_tokens']} tokens，输出 {stats['completion_tokens']} tokens")
+
+
+def add_server_arguments(parser):
+    """给命令行加上模拟服务的参数，性能测试脚本也用这一组参数"""
+    parser.add_argument("--latency", type=float, default=0.2, help="平均响应延迟（秒）")
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default='lognormal', help="延迟分布")
+    parser.add_argument("--sigma", type=float, default=0.5, help="对数正态分布的 sigma，越大长尾越重")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="每个输出 token 额外的耗时（秒）")
+    parser.add_argument("--max-inflight", type=int, default=0, help="同时在途请求数上限，超出返回 429，0 表示不限")
+    parser.add_argument("--server-rpm", type=int, default=0, help="每分钟请求数上限，0 表示不限")
+    parser.add_argument("--server-tpm", type=int, default=0, help="每分钟 token 数上限，0 表示不限")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="随机返回 429 的比例")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回 500 的比例")
+    parser.add_argument("--retry-after", type=float, default=None, help="429 响应带上的 Retry-After 秒数")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="回复在中间被截断（finish_reason 为 length）的比例")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="流式回复中途断开的比例")
+    parser.add_argument("--questions-per-article", type=int, default=5, help="每次问题生成返回的问题数")
+    parser.add_argument("--answer-chars", type=int, default=200, help="每个答案的字数")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+
+
+def server_options_from_args(args):
+    return {
+        'latency': args.latency,
+        'distribution': args.distribution,
+        'sigma': args.sigma,
+        'token_latency': args.token_latency,
+        'max_inflight': args.max_inflight,
+        'rpm': args.server_rpm,
+        'tpm': args.server_tpm,
+        'throttle_rate': args.throttle_rate,
+        'error_rate': args.error_rate,
+        'retry_after': args.retry_after,
+        'truncate_rate': args.truncate_rate,
+        'disconnect_rate': args.disconnect_rate,
+        'questions_per_article': args.questions_per_article,
+        'answer_chars': args.answer_chars,
+        'seed': args.seed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的 OpenAI 兼容对话接口")
+    parser.add_argument("--port", type=int, default=18080, help="监听端口")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockLLMServer(port=args.port, **server_options_from_args(args))
+    base_url = server.start()
+    print(f"🧪 模拟接口已启动: {base_url}")
+    print(f"   设置 OPENAI_BASE_URL={base_url} OPENAI_API_KEY=mock 后运行生成脚本，按 Ctrl+C 停止")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"📈 {server.summary()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"📈 {server.summary()}")
+
+
+if __name__ == "__main__":
+    main()
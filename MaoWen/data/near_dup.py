@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+近似重复检测
+基于字符 n-gram 的 MinHash 签名和 LSH 分桶索引。
+签名使用单次排列哈希（one permutation hashing）：每个 n-gram 只算一次哈希，
+按哈希值分到各个桶里取最小值，再对空桶做旋转补齐，复杂度与文本长度成线性。
+"""
+
+import hashlib
+import re
+
+# 去掉空白和标点后再切 n-gram，避免排版差异影响相似度
+NOISE_RE = re.compile(r'[\s　-〿＀-／：-＠［-｀｛-･,.;:!?\'"()\[\]{}<>\-—…·]+')
+
+HASH_BITS = 64
+MAX_HASH = (1 << HASH_BITS) - 1
+
+
+def char_shingles(text, n=5):
+    """规范化后的字符 n-gram 集合，文本短于 n 时返回整段文本"""
+    text = NOISE_RE.sub('', text.lower())
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _hash64(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def minhash_signature(shingles, num_perm=128):
+    """计算长度为 num_perm 的 MinHash 签名；空集合返回 None"""
+    if not shingles:
+        return None
+    signature = [MAX_HASH] * num_perm
+    for shingle in shingles:
+        h = _hash64(shingle)
+        slot = h % num_perm
+        value = h // num_perm
+        if value < signature[slot]:
+            signature[slot] = value
+    # 空桶向右借用最近的非空桶，并按距离加偏移，保证不同文档之间补齐方式一致
+    if MAX_HASH in signature:
+        original = list(signature)
+        offset = MAX_HASH // num_perm // num_perm
+        nearest = None
+        for step in range(2 * num_perm - 1, -1, -1):
+            slot = step % num_perm
+            if original[slot] != MAX_HASH:
+                nearest = (original[slot], step)
+            elif nearest is not None and step < num_perm:
+                signature[slot] = nearest[0] + (nearest[1] - step) * offset
+    return signature
+
+
+def text_signature(text, n=5, num_perm=128):
+    return minhash_signature(char_shingles(text, n), num_perm)
+
+
+def estimate_similarity(sig_a, sig_b):
+    """两个签名相同位置相等的比例，即 Jaccard 相似度的估计"""
+    if not sig_a or not sig_b:
+        return 0.0
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+def choose_bands(threshold, num_perm):
+    """
+    选择分带数 b 和每带行数 r。候选还会用签名再确认一次，漏判比误判代价大，
+    所以让 S 曲线拐点 (1/b)^(1/r) 落在阈值下方约 0.15 处
+    """
+    target = max(threshold - 0.15, 0.05)
+    best = None
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        knee = (1 / bands) ** (1 / rows)
+        score = abs(knee - target)
+        if best is None or score < best[0]:
+            best = (score, bands, rows)
+    return best[1], best[2]
+
+
+class LSHIndex:
+    """MinHash LSH 索引：签名切成 b 段，任一段完全相同即为候选，再用签名估计相似度确认"""
+
+    def __init__(self, threshold=0.85, num_perm=128):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = choose_bands(threshold, num_perm)
+        self.buckets = [{} for _ in range(self.bands)]
+        self.signatures = {}
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield band, tuple(signature[start:start + self.rows])
+
+    def insert(self, key, signature):
+        self.signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self.buckets[band].setdefault(band_key, []).append(key)
+
+    def query(self, signature):
+        """返回相似度不低于阈值的 (键, 相似度)，按相似度从高到低排列"""
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self.buckets[band].get(band_key, ()))
+        matches = []
+        for key in candidates:
+            similarity = estimate_similarity(signature, self.signatures[key])
+            if similarity >= self.threshold:
+                matches.append((key, similarity))
+        matches.sort(key=lambda item: -item[1])
+        return matches
+
+    def __len__(self):
+        return len(self.signatures)
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+问题生成与答案生成的融合流水线
+问题生成的协程每处理完一篇文章，就把这篇文章的问题放进一个有界队列（加 --stream 时每个问题一生成完就写入，
+同一块的问题凑够一批就放进去）；答案生成的协程同时从队列里取问题作答。第一个问答对在第一篇文章的问题生成后就能写出，
+总耗时约为两个阶段中较慢的一个，而不是两者之和。
+两个阶段共用一个 LLM 引擎，问题文件和答案文件的格式与单独运行两个脚本时相同。
+加 --dedup 时，问题在交给答案协程之前先去掉近似重复（见 dedup_questions.py），问题文件中仍保留全部问题。
+
+用法:
+    python pipeline.py --question-workers 8 --answer-workers 8
+"""
+
+import argparse
+import asyncio
+import time
+from itertools import groupby
+
+from dedup_questions import QuestionDeduper, add_dedup_arguments, dedup_options_from_args, saved_answer_calls
+from gen_answer import AnswerGenerator
+from gen_question import QAGenerator
+from jsonl_io import add_writer_arguments, iter_jsonl_shards, writer_options_from_args
+from llm_cache import DEFAULT_CACHE_FILE, DEFAULT_MAX_BYTES, LLMCache, add_cache_arguments, cache_options_from_args
+from llm_engine import LLMEngine, add_engine_arguments, engine_options_from_args
+
+
+class QAPipeline:
+    def __init__(self,
+                 output_dir="data/output",
+                 questions_file="data/qa_dataset.jsonl",
+                 answers_file="data/qa_with_answers.jsonl",
+                 max_concurrency=64,
+                 question_workers=8,
+                 answer_workers=8,
+                 queue_size=16,
+                 cache_file=DEFAULT_CACHE_FILE,
+                 resample=False,
+                 cache_max_bytes=DEFAULT_MAX_BYTES,
+                 resume=False,
+                 skip_duplicates=True,
+                 chunk_tokens=0,
+                 chunk_overlap=200,
+                 stream=False,
+                 batch_size=1,
+                 context_tokens=0,
+                 top_k=8,
+                 writer_options=None,
+                 engine_options=None,
+                 dedup_options=None):
+        cache = LLMCache(cache_file, max_bytes=cache_max_bytes, bypass=resample) if cache_file else None
+        self.engine = LLMEngine(max_concurrency=max_concurrency, cache=cache, **(engine_options or {}))
+        self.questions = QAGenerator(
+            output_dir=output_dir,
+            output_file=questions_file,
+            skip_duplicates=skip_duplicates,
+            engine=self.engine,
+            resume=resume,
+            chunk_tokens=chunk_tokens,
+            chunk_overlap=chunk_overlap,
+            stream=stream,
+            writer_options=writer_options
+        )
+        self.answers = AnswerGenerator(
+            questions_file=questions_file,
+            output_dir=output_dir,
+            output_file=answers_file,
+            engine=self.engine,
+            resume=resume,
+            batch_size=batch_size,
+            context_tokens=context_tokens,
+            top_k=top_k,
+            writer_options=writer_options
+        )
+        # 流式生成问题时按答案的批大小交给答案协程，一组问题正好凑成一批
+        self.questions.sink_batch = max(batch_size, 1)
+        # 问题生成的并发文章数要有上限，否则问题请求会占满引擎的并发名额，答案请求排不上队
+        self.question_workers = question_workers
+        self.answer_workers = answer_workers
+        self.queue_size = queue_size
+        self.resume = resume
+        # dedup_options 不为空时在回答之前去掉近似重复的问题
+        self.deduper = QuestionDeduper(**dedup_options) if dedup_options is not None else None
+        self.question_counts = {}
+        self.kept_counts = {}
+
+    def unanswered_questions(self, answered):
+        """续跑时，问题文件中已有但还没有答案的问题，按文章分组"""
+        backlog = [
+            item for item in iter_jsonl_shards(self.questions.output_file)
+            if self.answers.question_key(item) not in answered
+        ]
+        backlog.sort(key=lambda item: item['source_article'])
+        return [list(group) for _, group in groupby(backlog, key=lambda item: item['source_article'])]
+
+    def seed_deduper(self, answered):
+        """续跑时先让去重器记住已经回答过的问题，之后与它们近似重复的问题不再回答"""
+        seeded = 0
+        for item in iter_jsonl_shards(self.questions.output_file):
+            if self.answers.question_key(item) in answered:
+                self.deduper.seed(item)
+                seeded += 1
+        if seeded:
+            print(f"🧹 去重器载入 {seeded} 个已回答的问题")
+
+    def drop_duplicates(self, questions):
+        """去掉近似重复的问题，并记下每篇文章的问题数和保留数"""
+        kept = []
+        for item in questions:
+            article = item['source_article']
+            self.question_counts[article] = self.question_counts.get(article, 0) + 1
+            if self.deduper.check(item) is None:
+                self.kept_counts[article] = self.kept_counts.get(article, 0) + 1
+                kept.append(item)
+        return kept
+
+    async def run_async(self):
+        if not self.questions.output_dir.exists():
+            print(f"输出目录 {self.questions.output_dir} 不存在")
+            return
+
+        completed = self.questions.prepare_output()
+        answered = self.answers.prepare_output()
+        backlog = self.unanswered_questions(answered) if self.resume else []
+        if self.resume and self.deduper is not None:
+            self.seed_deduper(answered)
+        articles = self.questions.list_articles()
+        pending = [title for title in articles if title not in completed]
+        if self.answers.context_tokens > 0:
+            self.answers.build_passage_index()
+
+        print(f"🚀 融合流水线：{len(pending)} 篇文章待生成问题，{sum(map(len, backlog))} 个已有问题待回答")
+        print(f"🔧 {self.question_workers} 个问题协程，{self.answer_workers} 个答案协程，"
+              f"最多 {self.engine.max_concurrency} 个并发请求")
+
+        self.questions.start_progress(len(pending))
+        self.answers.start_progress()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.questions.question_sink = queue
+        start = time.monotonic()
+        restored_answers = self.answers.total_qa_count
+        first_answer = None
+
+        async def produce():
+            # 续跑时先回答已有的问题
+            for questions in backlog:
+                await queue.put(questions)
+            titles = iter(pending)
+
+            async def worker():
+                for title in titles:
+                    await self.questions.process_single_article(title)
+
+            await asyncio.gather(*(worker() for _ in range(self.question_workers)))
+
+        async def consume():
+            nonlocal first_answer
+            while True:
+                questions = await queue.get()
+                if questions is None:
+                    return
+                if self.deduper is not None:
+                    questions = self.drop_duplicates(questions)
+                    if not questions:
+                        continue
+                self.engine.metrics.add_total(self.answers.progress_stage, len(questions))
+                results = await asyncio.gather(*self.answers.make_tasks(questions), return_exceptions=True)
+                for result in results:
+                    if isinstance(result, Exception):
+                        print(f"❌ 问题处理时发生异常: {result}")
+                if first_answer is None and self.answers.total_qa_count > restored_answers:
+                    first_answer = time.monotonic() - start
+                    print(f"⏱️ 第一个问答对在 {first_answer:.1f} 秒后写出")
+
+        consumers = [asyncio.create_task(consume()) for _ in range(self.answer_workers)]
+        try:
+            await produce()
+        finally:
+            for _ in consumers:
+                await queue.put(None)
+            await asyncio.gather(*consumers)
+            self.questions.question_sink = None
+            self.questions.close_output()
+            self.answers.close_output()
+
+        print(f"\n🎉 流水线完成！用时 {time.monotonic() - start:.1f} 秒")
+        self.questions.print_summary()
+        self.answers.print_summary()
+        if self.deduper is not None:
+            saved = saved_answer_calls(self.question_counts, self.kept_counts, max(self.answers.batch_size, 1))
+            print(f"🧹 {self.deduper.summary()}，省下 {sum(saved.values())} 次答案请求")
+
+    def run(self):
+        async def main():
+            try:
+                await self.run_async()
+            finally:
+                await self.engine.close()
+        asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同时生成问题和答案")
+    parser.add_argument("--output-dir", default="data/output", help="爬取的文章目录")
+    parser.add_argument("--questions-file", default="data/qa_dataset.jsonl", help="问题输出文件")
+    parser.add_argument("--answers-file", default="data/qa_with_answers.jsonl", help="问答对输出文件")
+    parser.add_argument("--max-concurrency", type=int, default=64, help="最多同时在途的 LLM 请求数")
+    parser.add_argument("--question-workers", type=int, default=8, help="同时生成问题的文章数")
+    parser.add_argument("--answer-workers", type=int, default=8, help="同时回答问题的文章数")
+    parser.add_argument("--queue-size", type=int, default=16, help="等待回答的问题组数上限（每篇文章或每批问题一组）")
+    parser.add_argument("--resume", action="store_true", help="保留已有输出，只处理缺少的部分")
+    parser.add_argument("--chunk-tokens", type=int, default=0, help="超过这么多 token 的文章切块生成问题，0 表示不切块")
+    parser.add_argument("--chunk-overlap", type=int, default=200, help="相邻块之间重叠的 token 数")
+    parser.add_argument("--stream", action="store_true", help="流式生成问题，每个问题生成完就写入并交给答案协程")
+    parser.add_argument("--batch-size", type=int, default=1, help="同一篇文章的问题每批合并回答的数量，1 表示逐个回答")
+    parser.add_argument("--context-tokens", type=int, default=0, help="只发送与问题相关的段落，最多这么多 token，0 表示发送全文")
+    parser.add_argument("--top-k", type=int, default=8, help="最多选取的相关段落数")
+    parser.add_argument("--dedup", action="store_true", help="回答之前去掉近似重复的问题")
+    add_dedup_arguments(parser)
+    add_writer_arguments(parser)
+    add_engine_arguments(parser)
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+
+    print("🎯 开始生成问答数据集...")
+    pipeline = QAPipeline(
+        output_dir=args.output_dir,
+        questions_file=args.questions_file,
+        answers_file=args.answers_file,
+        max_concurrency=args.max_concurrency,
+        question_workers=args.question_workers,
+        answer_workers=args.answer_workers,
+        queue_size=args.queue_size,
+        resume=args.resume,
+        chunk_tokens=args.chunk_tokens,
+        chunk_overlap=args.chunk_overlap,
+        stream=args.stream,
+        batch_size=args.batch_size,
+        context_tokens=args.context_tokens,
+        top_k=args.top_k,
+        writer_options=writer_options_from_args(args),
+        engine_options=engine_options_from_args(args),
+        **cache_options_from_args(args),
+        dedup_options=dedup_options_from_args(args) if args.dedup else None
+    )
+    pipeline.run()
+    print("✨ 完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+爬虫礼貌访问与重试策略
+每个主机一个令牌桶限速，失败时指数退避（带随机抖动），
+429/503 按 Retry-After 暂停整个主机，并统计每个主机的请求、重试与等待时间。
+"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+# 可以重试的状态码：限流、超时和服务端临时错误
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# 这两个状态码会附带 Retry-After，需要暂停整个主机
+THROTTLE_STATUS = {429, 503}
+
+
+class TokenBucket:
+    """线程安全的令牌桶，rate 为每秒补充的令牌数，rate<=0 表示不限速"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """预订令牌，返回调用方需要等待的秒数（令牌可以透支，等待时间即偿还时间）"""
+        with self.lock:
+            now = time.monotonic()
+            wait = max(self.paused_until - now, 0.0)
+            if self.rate <= 0:
+                return wait
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+            return wait
+
+    def acquire(self, tokens=1):
+        """阻塞直到拿到令牌，返回实际等待的秒数"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        """在接下来的 seconds 秒内不再发放令牌"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 头，支持秒数和 HTTP 日期两种格式，无法解析时返回 None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """指数退避（full jitter）：在 [0, min(cap, base * 2^attempt)] 内随机取值"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class PolitenessPolicy:
+    """按主机管理令牌桶、退避和统计"""
+
+    def __init__(self, rate=1.0, burst=1, backoff_base=1.0, backoff_cap=60.0, max_retry_after=300.0):
+        self.rate = rate
+        self.burst = burst
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_retry_after = max_retry_after  # 服务器要求等待过久时的上限
+        self.buckets = {}
+        self.host_stats = {}
+        self.lock = threading.Lock()
+
+    def _host(self, url):
+        return urlparse(url).netloc
+
+    def _get(self, host):
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+                self.host_stats[host] = {
+                    'requests': 0,
+                    'retries': 0,
+                    'failures': 0,
+                    'throttled_time': 0.0,
+                    'backoff_time': 0.0,
+                    'status': {}
+                }
+            return self.buckets[host], self.host_stats[host]
+
+    def wait_turn(self, url):
+        """发送请求前调用：等待该主机的令牌"""
+        bucket, stats = self._get(self._host(url))
+        waited = bucket.acquire()
+        with self.lock:
+            stats['requests'] += 1
+            stats['throttled_time'] += waited
+
+    def record_status(self, url, status):
+        _, stats = self._get(self._host(url))
+        with self.lock:
+            key = str(status)
+            stats['status'][key] = stats['status'].get(key, 0) + 1
+
+    def record_failure(self, url):
+        _, stats = self._get(self._host(url))
+        with self.lock:
+            stats['failures'] += 1
+
+    def is_retryable(self, status):
+        return status in RETRYABLE_STATUS
+
+    def backoff(self, url, attempt, retry_after=None):
+        """重试前调用：有 Retry-After 时暂停整个主机，否则按指数退避睡眠"""
+        bucket, stats = self._get(self._host(url))
+        with self.lock:
+            stats['retries'] += 1
+        if retry_after is not None:
+            # 暂停时间会在下一次 wait_turn 中体现为 throttled_time
+            bucket.pause(min(retry_after, self.max_retry_after))
+            return
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+        with self.lock:
+            stats['backoff_time'] += delay
+        time.sleep(delay)
+
+    def stats(self):
+        """返回每个主机的计数快照"""
+        with self.lock:
+            return {
+                host: dict(stats, status=dict(stats['status']))
+                for host, stats in self.host_stats.items()
+            }
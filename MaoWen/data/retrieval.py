@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+段落级检索
+把语料切成段落，以去掉标点后的中文字符二元组为词项建倒排索引，用 BM25 打分。
+答案生成时只把与问题最相关的几段原文（按原文顺序）放进提示，不再发送整篇文章。
+IDF 在整个语料上统计，检索时只在问题所属的文章内打分。
+"""
+
+import math
+import re
+from collections import Counter
+
+from article_extractor import content_body
+from llm_engine import estimate_tokens
+from near_dup import NOISE_RE
+
+# 短于这个长度的行和后面的行合并成一段
+MIN_PASSAGE_CHARS = 120
+# 被省略的段落之间的分隔
+OMISSION = "\n……\n"
+
+
+def split_passages(text, min_chars=MIN_PASSAGE_CHARS):
+    """按行切分正文，把过短的行合并，返回段落列表"""
+    passages = []
+    current = []
+    length = 0
+    for line in re.split(r'\n+', text):
+        line = line.strip()
+        if not line:
+            continue
+        current.append(line)
+        length += len(line)
+        if length >= min_chars:
+            passages.append("\n".join(current))
+            current = []
+            length = 0
+    if current:
+        passages.append("\n".join(current))
+    return passages
+
+
+def terms(text):
+    """去掉空白和标点后的字符二元组，单字文本返回单字"""
+    text = NOISE_RE.sub('', text.lower())
+    if len(text) < 2:
+        return [text] if text else []
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+class PassageIndex:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.passages = []
+        self.lengths = []
+        self.total_length = 0
+        self.article_postings = {}
+        self.doc_freq = Counter()
+
+    def add_article(self, name, content_text):
+        """把一篇文章（content.txt 全文）切段加入索引"""
+        postings = {}
+        for passage in split_passages(content_body(content_text)):
+            pid = len(self.passages)
+            counts = Counter(terms(passage))
+            self.passages.append(passage)
+            self.lengths.append(sum(counts.values()))
+            self.total_length += self.lengths[-1]
+            for term, tf in counts.items():
+                postings.setdefault(term, {})[pid] = tf
+                self.doc_freq[term] += 1
+        self.article_postings[name] = postings
+
+    def __contains__(self, name):
+        return name in self.article_postings
+
+    def __len__(self):
+        return len(self.passages)
+
+    @property
+    def avg_length(self):
+        return self.total_length / len(self.lengths) if self.lengths else 0.0
+
+    def idf(self, term):
+        n = len(self.passages)
+        df = self.doc_freq.get(term, 0)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, name, query, top_k=None):
+        """在文章 name 内检索，返回按 BM25 分数从高到低排列的 (段落编号, 分数)"""
+        postings = self.article_postings.get(name)
+        if not postings:
+            return []
+        avg_length = self.avg_length or 1.0
+        scores = Counter()
+        for term, qtf in Counter(terms(query)).items():
+            term_postings = postings.get(term)
+            if not term_postings:
+                continue
+            idf = self.idf(term)
+            for pid, tf in term_postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[pid] / avg_length)
+                scores[pid] += qtf * idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores.most_common(top_k)
+
+    def select_context(self, name, query, token_budget, top_k=8):
+        """
+        取文章内与 query 最相关的至多 top_k 段，总 token 数不超过 token_budget，
+        按原文顺序拼接；文章中没有匹配的段落时返回 None
+        """
+        chosen = []
+        used = 0
+        for pid, _ in self.search(name, query, top_k):
+            tokens = estimate_tokens(self.passages[pid])
+            if used + tokens > token_budget:
+                # 至少保留一段，哪怕超出预算
+                if chosen:
+                    continue
+            chosen.append(pid)
+            used += tokens
+        if not chosen:
+            return None
+        chosen.sort()
+        parts = [self.passages[chosen[0]]]
+        for previous, pid in zip(chosen, chosen[1:]):
+            parts.append("\n\n" if pid == previous + 1 else OMISSION)
+            parts.append(self.passages[pid])
+        return "".join(parts)
@@ -0,0 +1,122 @@
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# The LLM client helpers live next to the generation scripts in data/
+sys.path.insert(0, str(Path(__file__).resolve().parent / "data"))
+
+from llm_engine import ENDPOINT_REJECT_STATUS, classify_error, estimate_tokens  # noqa: E402
+from llm_router import EndpointConfig, LLMRouter, load_endpoints  # noqa: E402
+from politeness import backoff_delay  # noqa: E402
+
+DEFAULT_JUDGE_BASE_URL = "https://api.deepseek.com"
+DEFAULT_JUDGE_MODEL = "deepseek-chat"
+JUDGE_MAX_RETRIES = 3
+JUDGE_SYSTEM_PROMPT = "你是一位对党忠诚、学术渊博的马克思主义教授。"
+
+JUDGE_PROMPT = """
+请根据以下问题和学生的回答，给学生的回答打分。
+
+问题：{question}
+学生的回答：{answer}
+
+请根据以下标准给学生的回答打分：
+9～10分：回答正确且有深度思考。
+7～8分：回答正确但缺乏深度思考。
+5～6分：回答有错误。
+3～4分：回答严重错误。
+1～2分：回答与问题无关。
+
+请直接给出你的打分，不要给出任何其他内容，只给出数字:
+"""
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """
+    Returns the judge router, created once and shared by all judging threads.
+    Endpoints are chosen in this order (environment variables are also read from .env):
+    the JSON file named by JUDGE_ENDPOINTS (see data/llm_router.py); a single endpoint
+    from JUDGE_API_KEY / JUDGE_BASE_URL / JUDGE_MODEL; the file named by LLM_ENDPOINTS;
+    a single endpoint from OPENAI_API_KEY / OPENAI_BASE_URL.
+    """
+    global _router
+    with _router_lock:
+        if _router is None:
+            load_dotenv()
+            if os.getenv("JUDGE_ENDPOINTS"):
+                endpoints = load_endpoints(os.getenv("JUDGE_ENDPOINTS"))
+            elif os.getenv("JUDGE_API_KEY") or os.getenv("JUDGE_BASE_URL"):
+                # An explicitly configured judge endpoint wins over the shared LLM_ENDPOINTS list
+                endpoints = None
+            else:
+                endpoints = load_endpoints()
+            if not endpoints:
+                api_key = os.getenv("JUDGE_API_KEY") or os.getenv("OPENAI_API_KEY")
+                if not api_key:
+                    raise RuntimeError("Set JUDGE_API_KEY or OPENAI_API_KEY in the environment or .env")
+                base_url = os.getenv("JUDGE_BASE_URL") or os.getenv("OPENAI_BASE_URL") or DEFAULT_JUDGE_BASE_URL
+                model = os.getenv("JUDGE_MODEL") or DEFAULT_JUDGE_MODEL
+                endpoints = [EndpointConfig(base_url=base_url, api_key=api_key, model=model)]
+            # Judging runs synchronously in a thread pool, outside the AIMD limiter; each endpoint's
+            # max_concurrency caps its sync_slots semaphore, and its rpm/tpm budget is reserved per call
+            _router = LLMRouter.from_configs(endpoints, max_concurrency=16, timeout=30, adaptive=False)
+        return _router
+
+
+def judge(question: str, answer: str):
+    """
+    Sends the question and answer to the judge model, retrying transient
+    errors on another endpoint when one is available. Each call waits for the
+    endpoint's rpm/tpm budget and concurrency slot first. Gives up early when
+    the endpoint has been circuit-broken and there is no other endpoint to try.
+    Returns the score as an integer, or 0 if judging fails.
+    """
+    prompt = JUDGE_PROMPT.format(question=question, answer=answer)
+    estimated = estimate_tokens(JUDGE_SYSTEM_PROMPT) + estimate_tokens(prompt)
+    endpoint = None
+    try:
+        router = get_router()
+        for attempt in range(JUDGE_MAX_RETRIES + 1):
+            endpoint = router.select(avoid=endpoint)
+            if router.tripped_since(endpoint):
+                # Every endpoint is circuit-broken; select only returned the one that recovers first
+                router.cancel(endpoint)
+                raise RuntimeError(f"all judge endpoints are circuit-broken ({router.summary()})")
+            try:
+                with endpoint.sync_slots:
+                    endpoint.budget.wait_sync(estimated)
+                    response = endpoint.get_sync_client().chat.completions.create(
+                        model=endpoint.model,
+                        messages=[
+                            {"role": "system", "content": JUDGE_SYSTEM_PROMPT},
+                            {"role": "user", "content": prompt},
+                        ],
+                        stream=False,
+                    )
+            except Exception as e:
+                retryable, _, retry_after = classify_error(e)
+                rejected = getattr(e, "status_code", None) in ENDPOINT_REJECT_STATUS
+                router.finish(endpoint, ok=False, failed=retryable, trip=rejected)
+                if retry_after is not None:
+                    endpoint.budget.pause(min(retry_after, 60))
+                if not (retryable or rejected) or attempt == JUDGE_MAX_RETRIES:
+                    raise
+                if not router.has_alternative(endpoint):
+                    if router.tripped_since(endpoint):
+                        raise
+                    time.sleep(min(retry_after, 60) if retry_after is not None else backoff_delay(attempt))
+                continue
+            router.finish(endpoint, ok=True)
+            if response.usage is not None:
+                endpoint.budget.settle(estimated, response.usage.total_tokens)
+            return int(response.choices[0].message.content)
+    except Exception as e:
+        print(f"An error occurred during judging: {e}")
+        return 0
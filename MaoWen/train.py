@@ -8,50 +8,13 @@ import os
 import json
 from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
-from openai import OpenAI
 from pathlib import Path
 
+from judge import judge
+
 os.environ["WANDB_PROJECT"] = "MaoWen"
 os.environ["WANDB_MODE"] = "offline"
 
-JUDGE_PROMPT = """
-请根据以下问题和学生的回答，给学生的回答打分。
-
-问题：{question}
-学生的回答：{answer}
-
-请根据以下标准给学生的回答打分：
-9～10分：回答正确且有深度思考。
-7～8分：回答正确但缺乏深度思考。
-5～6分：回答有错误。
-3～4分：回答严重错误。
-1～2分：回答与问题无关。
-
-请直接给出你的打分，不要给出任何其他内容，只给出数字:
-"""
-
-def judge(question: str, answer: str):
-    """
-    Sends the question and answer to the DeepSeek API for judging.
-    Returns the score as an integer.
-    """
-    client = OpenAI(api_key="sk-1040a650df194c1485c95027c4bdc7fb", base_url="https://api.deepseek.com")
-    prompt = JUDGE_PROMPT.format(question=question, answer=answer)
-    try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "你是一位对党忠诚、学术渊博的马克思主义教授。"},
-                {"role": "user", "content": prompt},
-            ],
-            stream=False,
-            timeout=30,
-        )
-        return int(response.choices[0].message.content)
-    except Exception as e:
-        print(f"An error occurred during judging: {e}")
-        return 0
-
 def load_dataset():
     """Loads the full dataset and splits it into train and eval sets."""
     try: